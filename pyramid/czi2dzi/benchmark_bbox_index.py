@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+"""Compare BBoxIndex queries to a full scan over all subblock bboxes.
+
+usage: benchmark_bbox_index.py [max_subblocks]
+
+Builds synthetic mosaics of overlapping 1600x1200 tiles at 10% overlap
+with increasing subblock counts and times 512x512 output tile queries
+over a sample of the canvas.
+"""
+
+import sys
+import time
+import numpy as np
+
+from czi2dzi import BBoxIndex
+
+def mosaic_bboxes(n, tile=(1200, 1600), overlap=0.1):
+    step = (int(tile[0] * (1 - overlap)), int(tile[1] * (1 - overlap)))
+    cols = int(np.ceil(np.sqrt(n)))
+    rows = int(np.ceil(float(n) / cols))
+    y, x = np.mgrid[0:rows, 0:cols]
+    v0 = np.stack([y.ravel() * step[0], x.ravel() * step[1]], axis=1)[0:n]
+    return np.concatenate([v0, v0 + tile], axis=1).astype(np.int32)
+
+def full_scan(bboxes, bbox):
+    y_nonintersects = (bboxes[:,2] <= bbox[0]) + (bboxes[:,0] >= bbox[2])
+    x_nonintersects = (bboxes[:,3] <= bbox[1]) + (bboxes[:,1] >= bbox[3])
+    return np.nonzero(~(y_nonintersects + x_nonintersects))[0]
+
+def main(max_subblocks=100000, nqueries=2000, tilesize=512):
+    rng = np.random.RandomState(0)
+    sys.stdout.write('%10s %10s %12s %12s %8s\n' % ('subblocks', 'build ms', 'scan us/q', 'index us/q', 'speedup'))
+    n = 100
+    while n <= max_subblocks:
+        bboxes = mosaic_bboxes(n)
+        t0 = time.time()
+        index = BBoxIndex(bboxes)
+        build = time.time() - t0
+
+        extent = bboxes[:,2:4].max(axis=0)
+        corners = (rng.randint(0, extent[0], nqueries), rng.randint(0, extent[1], nqueries))
+        queries = [ np.array([y, x, y + tilesize, x + tilesize], dtype=np.int32) for y, x in zip(*corners) ]
+
+        t0 = time.time()
+        expected = [ full_scan(bboxes, q) for q in queries ]
+        scan = time.time() - t0
+
+        t0 = time.time()
+        found = [ index.query(q) for q in queries ]
+        indexed = time.time() - t0
+
+        for a, b in zip(expected, found):
+            assert (a == b).all(), (a, b)
+
+        sys.stdout.write('%10d %10.1f %12.1f %12.1f %7.1fx\n' % (
+            n, build * 1e3, scan / nqueries * 1e6, indexed / nqueries * 1e6, scan / indexed
+        ))
+        n *= 10
+
+if __name__ == '__main__':
+    main(*[ int(a) for a in sys.argv[1:] ])
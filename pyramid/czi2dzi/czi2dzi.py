@@ -3,17 +3,367 @@
 import sys
 import os
 import os.path
+import shutil
 import math
 import czifile
 import numpy as np
-from scipy.misc import toimage
+from PIL import Image
 import json
 import re
+import multiprocessing
+import collections
+import Queue
+import select
+import traceback
+import base64
+import time
+import threading
+import cStringIO
+import sqlite3
+
+# ways to render a Z stack: only the first or the middle plane, a pyramid
+# per plane, or a per-pixel maximum or mean intensity projection over all planes
+Z_MODES = ['first', 'middle', 'planes', 'max', 'mean']
+
+# pixels per np.take call, bounding the temporary index array it makes
+LUT_CHUNK = 256 * 1024
+
+# synthesized levels made by one pass over chunks of 2**SYNTH_PASS_LEVELS
+# tile rows of the level below
+SYNTH_PASS_LEVELS = 4
+
+def tone_lut(window=None, gamma=1.0):
+    """Build a 65536 entry lookup table mapping uint16 intensities to uint8.
+
+       window (v0, v1) is stretched to the full 0..255 output range,
+       clipping values outside the window.  Without a window, the low
+       byte is truncated assuming full-range data.  A gamma other than
+       1.0 raises the windowed intensity to the power 1/gamma.
+    """
+    values = np.arange(65536, dtype=np.uint16)
+    if window is None and gamma == 1.0:
+        return (values / 256).astype(np.uint8)
+    if window is None:
+        window = (0, 65535)
+    v0, v1 = window
+    if gamma == 1.0:
+        return ((np.clip(values, v0, v1).astype(np.float32) - v0) * (1./(v1 - v0)) * 255).astype(np.uint8)
+    scaled = (np.clip(values, v0, v1).astype(np.float64) - v0) * (1./(v1 - v0))
+    return (np.power(scaled, 1./gamma) * 255).astype(np.uint8)
+
+def apply_lut(lut, data, out=None):
+    """Map integer data through lut into out, allocated if None.
+
+       The lookup runs in chunks of LUT_CHUNK pixels so no full-size
+       float or index temporary is made.
+    """
+    if out is None:
+        out = np.empty(data.shape, dtype=lut.dtype)
+    src = data.reshape(-1)
+    dst = out.reshape(-1)
+    for i in range(0, src.size, LUT_CHUNK):
+        np.take(lut, src[i:i+LUT_CHUNK], out=dst[i:i+LUT_CHUNK], mode='clip')
+    return out
+
+def float_to_uint8(data, window=None, gamma=1.0, out=None):
+    """Map floating-point data to uint8 through window (v0, v1), default (0.0, 1.0).
+
+       Values are windowed and scaled as in tone_lut, in chunks of
+       LUT_CHUNK pixels.
+    """
+    if out is None:
+        out = np.empty(data.shape, dtype=np.uint8)
+    v0, v1 = window if window is not None else (0.0, 1.0)
+    scale = 255. / (v1 - v0) if gamma == 1.0 else 1. / (v1 - v0)
+    src = data.reshape(-1)
+    dst = out.reshape(-1)
+    for i in range(0, src.size, LUT_CHUNK):
+        chunk = np.clip(src[i:i+LUT_CHUNK], v0, v1).astype(np.float32)
+        chunk -= v0
+        chunk *= scale
+        if gamma != 1.0:
+            np.power(chunk, 1./gamma, out=chunk)
+            chunk *= 255
+        dst[i:i+LUT_CHUNK] = chunk
+    return out
+
+class TileCache (object):
+    """Least-recently-used cache of decoded tile arrays with a byte budget.
+
+       Lookups, insertions, and evictions are O(1).  The most recently
+       inserted array is always retained, even if it alone exceeds the
+       budget.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key: (entry, dtype), value: data in least to most recently used order
+        self._entries = collections.OrderedDict()
+
+    def get(self, key, load):
+        """Return cached array for key or call load() to produce and cache it."""
+        try:
+            data = self._entries.pop(key)
+            self.hits += 1
+        except KeyError:
+            data = load()
+            self.misses += 1
+            self.nbytes += data.nbytes
+            while self.nbytes > self.capacity and self._entries:
+                victim_key, victim = self._entries.popitem(last=False)
+                self.nbytes -= victim.nbytes
+                self.evictions += 1
+        self._entries[key] = data
+        return data
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions, nbytes=self.nbytes, entries=len(self._entries))
+
+class Prefetcher (object):
+    """Background thread reading CZI byte ranges into the OS page cache in file order.
+
+       Each submitted batch of (start, stop) ranges is sorted by file
+       position and ranges less than gap bytes apart are merged, so
+       the disk or NFS server sees long sequential reads while the
+       caller decodes earlier subblocks.  Later decodes of the same
+       bytes are then served from the page cache.
+    """
+
+    def __init__(self, filename, gap=1024*1024, chunk=8*1024*1024):
+        self.gap = gap
+        self.bytes = 0
+        self.seconds = 0.0
+        self.seeks = 0
+        # separate unbuffered handle so file position is private to the thread
+        self._file = open(filename, 'rb', 0)
+        self._buffer = bytearray(chunk)
+        self._position = None
+        self._queue = Queue.Queue()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, ranges):
+        """Queue [(start, stop), ...] byte ranges to read in file order."""
+        if ranges:
+            self._queue.put(ranges)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def _merged(self, ranges):
+        ranges = sorted(ranges)
+        start, stop = ranges[0]
+        for a, b in ranges[1:]:
+            if a - stop > self.gap:
+                yield start, stop
+                start, stop = a, b
+            else:
+                stop = max(stop, b)
+        yield start, stop
+
+    def _run(self):
+        view = memoryview(self._buffer)
+        while True:
+            ranges = self._queue.get()
+            if ranges is None:
+                break
+            for start, stop in self._merged(ranges):
+                t0 = time.time()
+                if start != self._position:
+                    self._file.seek(start)
+                    self.seeks += 1
+                position = start
+                while position < stop:
+                    n = self._file.readinto(view[0:min(len(view), stop - position)])
+                    if not n:
+                        break
+                    position += n
+                self._position = position
+                self.bytes += position - start
+                self.seconds += time.time() - t0
+
+class BBoxIndex (object):
+    """Uniform grid bucket index of tile bounding boxes for intersection queries.
+
+       bboxes is an Nx4 int32 array packed as (v0.y, v0.x, v1.y, v1.x)
+       for each tile.  Grid cells are as large as the largest tile, so
+       each tile is bucketed into at most 2x2 cells and a query only
+       tests tiles bucketed near the query box.
+    """
+
+    def __init__(self, bboxes):
+        self.bboxes = bboxes
+        origin = bboxes[:,0:2].min(axis=0)
+        cell = np.maximum(bboxes[:,2:4] - bboxes[:,0:2], 1).max(axis=0)
+
+        # inclusive cell ranges covered by each bbox
+        c0 = (bboxes[:,0:2] - origin) // cell
+        c1 = (bboxes[:,2:4] - 1 - origin) // cell
+        ncells = c1.max(axis=0) + 1
+
+        # flatten (entry, cell) memberships and sort by cell for CSR-style lookup
+        members = []
+        cells = []
+        for dy in range(int((c1[:,0] - c0[:,0]).max()) + 1):
+            for dx in range(int((c1[:,1] - c0[:,1]).max()) + 1):
+                covered = ((c0[:,0] + dy) <= c1[:,0]) & ((c0[:,1] + dx) <= c1[:,1])
+                members.append(np.nonzero(covered)[0])
+                cells.append((c0[covered,0] + dy) * ncells[1] + (c0[covered,1] + dx))
+        members = np.concatenate(members)
+        cells = np.concatenate(cells)
+        order = np.argsort(cells, kind='mergesort')
+        self._members = members[order].astype(np.int32)
+        self._offsets = [0] + np.cumsum(np.bincount(cells, minlength=ncells[0] * ncells[1])).tolist()
+
+        # plain ints keep per-query cell arithmetic cheap
+        self._origin = tuple(origin.tolist())
+        self._cell = tuple(cell.tolist())
+        self._ncells = tuple(ncells.tolist())
+
+    def query(self, bbox):
+        """Return sorted indices of bboxes intersecting (v0.y, v0.x, v1.y, v1.x) bbox."""
+        y0, x0, y1, x1 = [ int(v) for v in bbox[0:4] ]
+        cy0 = max((y0 - self._origin[0]) // self._cell[0], 0)
+        cx0 = max((x0 - self._origin[1]) // self._cell[1], 0)
+        cy1 = min((y1 - 1 - self._origin[0]) // self._cell[0], self._ncells[0] - 1)
+        cx1 = min((x1 - 1 - self._origin[1]) // self._cell[1], self._ncells[1] - 1)
+        if cy1 < cy0 or cx1 < cx0:
+            return self._members[0:0]
+
+        # each grid row of the query is a contiguous run of buckets
+        runs = [
+            self._members[self._offsets[cy * self._ncells[1] + cx0]:self._offsets[cy * self._ncells[1] + cx1 + 1]]
+            for cy in range(cy0, cy1 + 1)
+        ]
+        candidates = np.unique(np.concatenate(runs) if len(runs) > 1 else runs[0])
+
+        # exact test on candidates; non-intersects are either above or below the desired bbox
+        boxes = self.bboxes[candidates]
+        intersects = (boxes[:,2] > y0) & (boxes[:,0] < y1) & (boxes[:,3] > x0) & (boxes[:,1] < x1)
+        return candidates[intersects]
+
+class CompositePlan (object):
+    """Source tile slices composited into each output tile of one zoom tier.
+
+       bboxes is an Nx4 array of source tile bounding boxes in native
+       canvas coordinates as in BBoxIndex.  origin is the native (y,
+       x) canvas origin and shape the (H, W) canvas shape at zoom.
+       All overlaps of source tiles with the output tile grid of
+       tilesize are found at once with vectorized integer math, in the
+       same reduced resolution coordinates get_tile_data uses.
+
+       clip holds the (y0, x0, y1, x1) part of each source tile inside
+       the canvas, which the output tiles partition.
+    """
+
+    def __init__(self, bboxes, origin, zoom, tilesize, shape):
+        th, tw = tilesize
+        H, W = shape
+        K = H // th + (H % th and 1 or 0)
+        J = W // tw + (W % tw and 1 or 0)
+
+        # source tiles in reduced resolution canvas coordinates, clipped to the canvas
+        boxes = bboxes.astype(np.int64) // zoom - np.array([origin[0] // zoom, origin[1] // zoom] * 2, dtype=np.int64)
+        clipped = np.clip(boxes, 0, np.array([H, W, H, W], dtype=np.int64))
+        self.clip = (clipped - np.concatenate([boxes[:,0:2], boxes[:,0:2]], axis=1)).tolist()
+        valid = (clipped[:,2] > clipped[:,0]) & (clipped[:,3] > clipped[:,1])
+
+        # inclusive-exclusive output tile ranges covered by each source tile
+        k0 = clipped[:,0] // th
+        j0 = clipped[:,1] // tw
+        nk = np.where(valid, (clipped[:,2] - 1) // th + 1 - k0, 0)
+        nj = np.where(valid, (clipped[:,3] - 1) // tw + 1 - j0, 0)
+
+        # expand to one (source, output tile) pair per overlap
+        counts = nk * nj
+        source = np.repeat(np.arange(len(boxes)), counts)
+        t = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        k = k0[source] + t // nj[source]
+        j = j0[source] + t % nj[source]
+
+        tile0 = np.stack([k * th, j * tw], axis=1)
+        tile1 = np.minimum(tile0 + np.array(tilesize, dtype=np.int64), np.array(shape, dtype=np.int64))
+        overlap0 = np.maximum(clipped[source,0:2], tile0)
+        overlap1 = np.minimum(clipped[source,2:4], tile1)
+        src0 = overlap0 - boxes[source,0:2]
+        dst0 = overlap0 - tile0
+        extent = overlap1 - overlap0
+
+        # rows of (source, src y0, x0, y1, x1, dst y0, x0, y1, x1) grouped by tile in source order
+        tile = k * J + j
+        order = np.lexsort((source, tile))
+        self._rows = np.concatenate([
+            source[:,None], src0, src0 + extent, dst0, dst0 + extent
+        ], axis=1)[order]
+        self._offsets = np.searchsorted(tile[order], np.arange(K * J + 1)).tolist()
+        self._J = J
+
+    def tile(self, k, j):
+        """Return [(source, sy0, sx0, sy1, sx1, dy0, dx0, dy1, dx1), ...] for output tile (k, j)."""
+        i = k * self._J + j
+        return self._rows[self._offsets[i]:self._offsets[i+1]].tolist()
 
 class LazyCziConverter (object):
 
-    def __init__(self, czifilename, renormalize=False):
-        self._fo = czifile.CziFile(czifilename)
+    def __init__(self, czifilename, renormalize=False, channel_ranges=None, cache_bytes=None, range_zoom=None, range_percentiles=None, z_mode='first', gamma=1.0, index_cache=None, prefetch=False, scene=None, fo=None, verbose=True):
+        """Open CZI file and index its subblocks by channel and zoom tier.
+
+           renormalize: find per-channel value ranges so that 16-bit
+           channels can be stretched to the full 8-bit output range.
+
+           channel_ranges: reuse per-channel value ranges already
+           found by another converter instead of scanning the file
+           again, e.g. in parallel tile workers.
+
+           cache_bytes: byte budget for decoded source tiles, default
+           1 GiB.
+
+           range_zoom, range_percentiles: how renormalize estimates
+           value ranges, as in _value_range.
+
+           z_mode: how to render a Z stack, one of Z_MODES.
+
+           gamma: exponent applied to 16-bit and float intensities
+           after windowing when converting to 8-bit tiles.
+
+           index_cache: sidecar subblock directory cache, as the
+           indexcache argument of czifile.CziFile.
+
+           prefetch: read the source subblocks of upcoming tile rows
+           in file order on a background thread, see prefetch_rows.
+
+           scene: index only the subblocks of this CZI scene (S axis
+           start), so the canvas is that scene's bounding box.  If
+           None (default), all scenes share one canvas.
+
+           fo: an open czifile.CziFile of czifilename to share, e.g.
+           between the converters of several scenes.
+
+           verbose: report CZI layout and cache configuration on
+           stderr.
+
+        """
+        assert z_mode in Z_MODES, z_mode
+        self._verbose = verbose
+        self._z_mode = z_mode
+        self._gamma = gamma
+        # uint16 to uint8 lookup tables built on first use per channel
+        self._luts = dict()
+        self._czifilename = czifilename
+        if fo is None:
+            # uncompressed subblocks are read as views of the mapped file, not copies
+            fo = czifile.CziFile(czifilename, memmap=True, indexcache=index_cache)
+        self._fo = fo
 
         # sanity check dimensions
         self._Z = self._fo.axes.find('Z')
@@ -37,24 +387,64 @@ class LazyCziConverter (object):
         assert self._fo.shape[self._C] == 1 or self._fo.shape[self._slc.stop] == 1, \
             "do not understand multi-channel interleaved shape %s" % self._fo.shape
 
-        # sort out segments into channel zoom tiers
+        directory = self._fo.subblock_directory
+
+        # find scenes, keeping only subblocks of the one to render
+        self._S = self._fo.axes.find('S')
+        if self._S >= 0:
+            if isinstance(directory, czifile.SubBlockDirectory):
+                sstart = directory.column('start', 'S')
+                self._scenes = sorted(np.unique(sstart).tolist())
+                if scene is not None:
+                    directory = directory[sstart == scene]
+            else:
+                self._scenes = sorted(set([ entry.start[self._S] for entry in directory ]))
+                if scene is not None:
+                    directory = [ entry for entry in directory if entry.start[self._S] == scene ]
+        else:
+            self._scenes = [ None ]
+        assert scene is None or scene in self._scenes, 'CZI has no scene %s' % scene
+        self._scene = scene
+
+        # find Z planes to render, or the single None plane without a Z axis
+        if self._Z is not None:
+            if isinstance(directory, czifile.SubBlockDirectory):
+                # vectorized over the directory records, keeping only subblocks of rendered planes
+                zstart = directory.column('start', 'Z')
+                self._planes = sorted(np.unique(zstart).tolist())
+            else:
+                self._planes = list(set([ entry.start[self._Z] for entry in directory ]))
+                self._planes.sort()
+            if z_mode == 'first':
+                self._planes = self._planes[0:1]
+            elif z_mode == 'middle':
+                self._planes = [ self._planes[len(self._planes)/2] ]
+            if isinstance(directory, czifile.SubBlockDirectory):
+                directory = directory[np.in1d(zstart, self._planes)]
+        else:
+            self._planes = [ None ]
+
+        # sort out segments into channel zoom tiers, also split by Z plane
         self._channel_tiers = [ dict() for c in range(self._fo.shape[self._C]) ]
+        self._plane_tiers = [ dict() for c in range(self._fo.shape[self._C]) ]
         self._channel_tier_maps = [ dict() for c in range(self._fo.shape[self._C]) ]
 
         v0 = None
         v1 = None
         tile_size = (0, 0)
 
-        for entry in self._fo.subblock_directory:
+        for entry in directory:
             assert len(entry.shape) == len(self._fo.shape)
             assert entry.axes == self._fo.axes
 
             channel = entry.start[self._C]
-            
-            # HACK: discard all but middle plane if there is a Z stack
+
             if self._Z is not None:
-                if entry.start[self._Z] != (entry.shape[self._Z]/2):
+                plane = entry.start[self._Z]
+                if plane not in self._planes:
                     continue
+            else:
+                plane = None
         
             # infer zoom from canvas size to tile size ratio
             zoom = map(lambda c, t: c/t, entry.shape[self._slc], entry.stored_shape[self._slc])
@@ -63,11 +453,13 @@ class LazyCziConverter (object):
         
             if zoom not in self._channel_tiers[channel]:
                 self._channel_tiers[channel][zoom] = []
+                self._plane_tiers[channel][zoom] = dict([ (p, []) for p in self._planes ])
 
             # tile bounding box in canvas coordinates
             bbox = (entry.start[self._slc], tuple(map(lambda s, l: s+l, entry.start[self._slc], entry.shape[self._slc])))
             
             self._channel_tiers[channel][zoom].append((bbox, entry))
+            self._plane_tiers[channel][zoom][plane].append((bbox, entry))
 
             # Figure total shape too...
             if v0 is None:
@@ -78,17 +470,19 @@ class LazyCziConverter (object):
                 v1 = map(lambda v, b: max(v, b), v1, bbox[1])
             tile_size = tuple(map(lambda a, b: max(a, b), tile_size, entry.stored_shape[self._slc]))
 
-        # build up tile bbox maps for each zoom tier for efficient intersection tests
+        # build up tile bbox maps for each zoom tier and plane for efficient intersection tests
         for channel in range(self._fo.shape[self._C]):
-            for zoom, bbox_entries in self._channel_tiers[channel].items():
-                # pack as (v0.y, v0.x, v1.y, v1.x) for each entry
-                bboxes = np.zeros( (len(bbox_entries), 4), dtype=np.int32 )
-                for i in range(bboxes.shape[0]):
-                    bboxes[i,0:2] = np.array(bbox_entries[i][0][0], dtype=np.int32)
-                    bboxes[i,2:4] = np.array(bbox_entries[i][0][1], dtype=np.int32)
-                # for fancy-indexing by boolean arrays, repeat entry indexes into array
-                boxmap = np.array( range(len(bbox_entries)), dtype=np.int32 )
-                self._channel_tier_maps[channel][zoom] = (bboxes, boxmap)
+            for zoom, plane_tiers in self._plane_tiers[channel].items():
+                self._channel_tier_maps[channel][zoom] = dict()
+                for plane, bbox_entries in plane_tiers.items():
+                    if not bbox_entries:
+                        continue
+                    # pack as (v0.y, v0.x, v1.y, v1.x) for each entry
+                    bboxes = np.zeros( (len(bbox_entries), 4), dtype=np.int32 )
+                    for i in range(bboxes.shape[0]):
+                        bboxes[i,0:2] = np.array(bbox_entries[i][0][0], dtype=np.int32)
+                        bboxes[i,2:4] = np.array(bbox_entries[i][0][1], dtype=np.int32)
+                    self._channel_tier_maps[channel][zoom][plane] = BBoxIndex(bboxes)
 
         channels = self._fo.metadata.findall('Metadata/DisplaySetting/Channels/Channel')
         assert channels, 'found no Metadata/DisplaySetting/Channels/Channel elements in CZI metadata'
@@ -102,56 +496,134 @@ class LazyCziConverter (object):
         self._zoom_levels = self._channel_tiers[0].keys()
         self._zoom_levels.sort()
         
-        sys.stderr.write('CZI %s tile-size %s %s\n  channels: %s\n  bounding-box: %s native or shape %s\n  zoom levels: %s\n' % (
+        self._log('CZI %s tile-size %s %s\n  channels: %s\n  bounding-box: %s native or shape %s\n  zoom levels: %s\n  Z planes: %s %s\n%s' % (
             ' '.join(map(lambda d, s: '%s=%d' % (d, s), self._fo.axes, self._fo.shape)),
             'x'.join(map(str, self._tile_size)), self._fo.dtype,
             ', '.join([
                 '%s (%s %s)' % (self._channel_names[i], self._channel_names_long[i], self._channel_colors[i])
                 for i in range(self._fo.shape[self._C])
             ]),
-            self._bbox_native, 'x'.join(map(str, self._bbox_zeroed[1])), self._zoom_levels
+            self._bbox_native, 'x'.join(map(str, self._bbox_zeroed[1])), self._zoom_levels,
+            self._z_mode, self._planes,
+            ('  scene: %s of %s\n' % (scene, self._scenes)) if scene is not None else ''
         ))
 
-        if renormalize and self._fo.dtype not in [np.uint8]:
-            sys.stderr.write('Finding per-channel value ranges for dynamic normalization...\n')
-            self._channel_ranges = [ self._value_range(channel) for channel in range(self._fo.shape[self._C]) ]
+        if channel_ranges is not None:
+            self._channel_ranges = channel_ranges
+        elif renormalize and self._fo.dtype not in [np.uint8]:
+            self._log('Finding per-channel value ranges for dynamic normalization...\n')
+            self._channel_ranges = [
+                self._value_range(channel, range_zoom, range_percentiles)
+                for channel in range(self._fo.shape[self._C])
+            ]
         else:
             self._channel_ranges = None
 
-        # HACK: try to configure a tile cache for row-major tile grid traversals
-        # 1. assume we will output tiles no larger than current tile size
-        # 2. assume that up to 3 tile rows might be active due to overlapping source tiles
-        try:
-            overlap_factor = max([float(e.text) for e in self._fo.metadata.findall('Metadata/Experiment/ExperimentBlocks/AcquisitionBlock/SubDimensionSetups/RegionsSetup/SampleHolder/Overlap') ])
-        except:
-            overlap_factor = max([float(e.text) for e in self._fo.metadata.findall('Metadata/Experiment/ExperimentBlocks/AcquisitionBlock/TilesSetup/SampleHolder/Overlap') ])
-
-        row_tile_count = math.ceil(self._bbox_zeroed[1][1] / (self._tile_size[1] - self._tile_size[1] * overlap_factor))
-        self._tile_cache_size = row_tile_count * 3 + 1
-        # use dict as cache... key: (entry, dtype), value: [data, clock]
-        self._tile_cache = dict()
-        self._tile_cache_clock = 0
-
-        sys.stderr.write('Estimating %d tiles per row at zoom level 1 or %d tile cache size\n' % (row_tile_count, self._tile_cache_size))
+        # decoded source tiles are shared by neighboring output tiles, so keep
+        # a byte-budgeted LRU cache sized independently of acquisition metadata
+        if cache_bytes is None:
+            cache_bytes = 1024 * 1024 * 1024
+        self._tile_cache = TileCache(cache_bytes)
+        self._decode_seconds = 0.0
+        self._composite_seconds = 0.0
+        # CompositePlan per (channel, zoom, plane, tilesize) and value range per (entry, dtype)
+        self._composite_plans = dict()
+        self._entry_ranges = dict()
+
+        # subblock byte extents run to the next segment in the file
+        if isinstance(self._fo.subblock_directory, czifile.SubBlockDirectory):
+            positions = self._fo.subblock_directory.records['file_position'].tolist()
+        else:
+            positions = [ entry.file_position for entry in self._fo.subblock_directory ]
+        header = self._fo.header
+        positions.extend([ header.directory_position, header.metadata_position, header.attachment_directory_position, os.path.getsize(czifilename) ])
+        self._segment_starts = np.unique(np.array([ p for p in positions if p > 0 ], dtype=np.int64))
+        # source reads in decode order, counting jumps that would seek
+        self._read_end = None
+        self._read_seeks = 0
+        self._read_bytes = 0
+        # the prefetch thread starts with the first prefetch_rows call
+        self._prefetch = prefetch
+        self._prefetcher = None
+        self._prefetched = set()
+
+        self._log('Using %d MB tile cache\n' % (cache_bytes / (1024 * 1024)))
 
         # get per-dimension distances and turn meter value into micrometer
         self.mpps = dict([
             (dx.get('Id'), float(dx.find('Value').text) * 1E6)
             for dx in self._fo.metadata.findall('Metadata/Scaling/Items/Distance')
         ])
-        sys.stderr.write('Image reported microns per pixel: %s\n' % self.mpps)
+        self._log('Image reported microns per pixel: %s\n' % self.mpps)
+
+    def _log(self, mesg):
+        if self._verbose:
+            sys.stderr.write(mesg)
 
     def canvas_size(self):
         return self._bbox_zeroed[1]
 
     def num_channels(self):
         return len(self._channel_tiers)
+
+    def planes(self):
+        """Return Z plane numbers rendered in this z_mode, or [None] without a Z axis."""
+        return list(self._planes)
+
+    def scenes(self):
+        """Return scene numbers in the CZI file, or [None] without an S axis."""
+        return list(self._scenes)
+
+    def scene_names(self):
+        """Return dict mapping scene numbers to names from CZI metadata, where given."""
+        return dict([
+            (int(s.get('Index')), s.get('Name'))
+            for s in self._fo.metadata.findall('Metadata/Information/Image/Dimensions/S/Scenes/Scene')
+            if s.get('Index') is not None and s.get('Name')
+        ])
+
+    def bounding_box(self):
+        """Return ((y0, x0), (y1, x1)) canvas bounds in native CZI coordinates."""
+        return self._bbox_native
+
+    def scene_converter(self, scene):
+        """Return a converter of one scene sharing this converter's open file and settings."""
+        return LazyCziConverter(
+            self._czifilename, channel_ranges=self._channel_ranges, cache_bytes=self._tile_cache.capacity,
+            z_mode=self._z_mode, gamma=self._gamma, prefetch=self._prefetch, scene=scene, fo=self._fo,
+            verbose=self._verbose
+        )
             
-    def _value_range(self, channelno):
-        v0, v1 = None, None
+    def _range_zoom(self, channelno, min_pixels=1024*1024):
+        """Choose the coarsest zoom tier with at least min_pixels canvas pixels."""
         zooms = self._channel_tiers[channelno].keys()
-        zooms.sort()
-        for bbox, entry in self._channel_tiers[channelno][1]:
+        zooms.sort(reverse=True)
+        H, W = self.canvas_size()
+        for zoom in zooms:
+            if (H/zoom) * (W/zoom) >= min_pixels:
+                return zoom
+        return zooms[-1]
+
+    def _value_range(self, channelno, zoom=None, percentiles=None):
+        """Estimate (v0, v1) intensity window for channel from one zoom tier.
+
+           zoom selects the CZI pyramid tier to decode, defaulting to
+           the coarsest tier with about a megapixel of canvas, so the
+           estimate costs a small fraction of a full-resolution decode.
+           Use zoom=1 for the exact full-resolution range.
+
+           percentiles, if not None, is a (low, high) pair in 0..100 to
+           clip the window to those pixel value percentiles.  Otherwise
+           the window is (0, max) as with raw max renormalization.
+
+        """
+        if zoom is None:
+            zoom = self._range_zoom(channelno)
+
+        v0, v1 = None, None
+        hist = None
+        samples = []
+        for bbox, entry in self._channel_tiers[channelno][zoom]:
             data = self._entry_asarray(entry)
             if v0 is None:
                 v0 = data.min()
@@ -159,25 +631,47 @@ class LazyCziConverter (object):
             else:
                 v0 = min(v0, data.min())
                 v1 = max(v1, data.max())
-        sys.stderr.write('Channel %d: %s .. %s (%s)\n' % (channelno, v0, v1, self._channel_names[channelno]))
-        return (v0, v1)
+            if percentiles is not None:
+                if data.dtype.kind == 'u' and data.dtype.itemsize <= 2:
+                    # exact histogram of integer intensities
+                    counts = np.bincount(data.ravel(), minlength=(1 << (8 * data.dtype.itemsize)))
+                    hist = counts if hist is None else hist + counts
+                else:
+                    # strided sample for other pixel types
+                    flat = data.ravel()
+                    samples.append(flat[::max(1, flat.size / 4096)])
+
+        if percentiles is None:
+            window = (0, v1)
+        elif hist is not None:
+            cumulative = np.cumsum(hist)
+            window = tuple([
+                data.dtype.type(np.searchsorted(cumulative, max(1, math.ceil(cumulative[-1] * p / 100.0))))
+                for p in percentiles
+            ])
+        else:
+            window = tuple([ data.dtype.type(v) for v in np.percentile(np.concatenate(samples), percentiles) ])
 
-    def _get_intersecting_bbox_entries(self, channelno, zoom, bbox_native):
-        """Find CZI tiles that intersect bbox in native canvas coordinates."""
+        if window[1] <= window[0]:
+            window = (window[0], window[0] + 1)
 
-        bboxes, boxmap = self._channel_tier_maps[channelno][zoom]
+        self._log('Channel %d: %s .. %s at zoom %d using window %s .. %s (%s)\n' % (
+            channelno, v0, v1, zoom, window[0], window[1], self._channel_names[channelno]
+        ))
+        return window
+
+    def _get_intersecting_bbox_entries(self, channelno, zoom, bbox_native, plane=None):
+        """Find CZI tiles of one Z plane that intersect bbox in native canvas coordinates."""
 
-        # non-intersects are either above or below the desired bbox
-        y_nonintersects = (bboxes[:,2] <= bbox_native[0]) + (bboxes[:,0] >= bbox_native[2])
-        x_nonintersects = (bboxes[:,3] <= bbox_native[1]) + (bboxes[:,1] >= bbox_native[3])
-        nonintersects = y_nonintersects + x_nonintersects
+        index = self._channel_tier_maps[channelno][zoom].get(plane)
+        if index is None:
+            return []
 
-        # use fancy-indexing with intersection boolean map to get sparse list of entry indices
-        # and project out those entries for the zoom tier
-        return [ (bboxes[i,:], self._channel_tiers[channelno][zoom][i][1]) for i in boxmap[~nonintersects] ]
+        # project out intersecting entries for the zoom tier in original directory order
+        return [ (index.bboxes[i,:], self._plane_tiers[channelno][zoom][plane][i][1]) for i in index.query(bbox_native) ]
                 
 
-    def get_tile_data(self, channelno, zoom, slc, dtype=np.uint8, fill=None, range_accum=None):
+    def get_tile_data(self, channelno, zoom, slc, dtype=np.uint8, fill=None, range_accum=None, plane=None, tilesize=None):
         """Project a tile array for the given channel, zoom, and YX slice.
 
            slc MUST have non-negative integer start and stop and no step.
@@ -194,13 +688,25 @@ class LazyCziConverter (object):
 
            where v0 and v1 are the minimum and maximum values in this
            tile, respectively. This considers only pixels acquired in
-           the source CZI and ignores fill values.
+           the source CZI and ignores fill values.  With tilesize, the
+           range of each source tile within the canvas is merged
+           instead, so the union over all output tiles of the zoom tier
+           is the same.
 
            Slice coordinates are in zero-based canvas pixel units,
            e.g. (slice(0,1), slice(0,1)) at 64:1 zoom will be a single
            pixel summarizing the same canvas area as (slice(0,64),
            slice(0,64)) at 1:1 zoom.
 
+           plane selects one Z plane to render.  If None (default),
+           the z_mode decides: the first or middle plane, or a max or mean
+           projection of all planes streamed one plane at a time, so
+           only one plane tile is held besides the result.
+
+           tilesize (H, W), if not None, is the output tile grid that
+           slc is one tile of.  Source slices then come from a
+           CompositePlan computed once for the whole zoom tier.
+
         """
         assert type(slc) == tuple
         assert len(slc) == 2
@@ -214,10 +720,13 @@ class LazyCziConverter (object):
             bounds = [slc.start * zoom, min(L/zoom, slc.stop) * zoom]
             return slice(*bounds)
 
+        t0 = time.time()
+        decode_seconds = self._decode_seconds
+
         # do a little sanity checking and convert back to 1:1 pixel units with cropping to canvas
         slc = map(slc_check, slc, self._bbox_zeroed[1])
         
-        # this should now be in same format as one row of self._channel_tier_maps[0]
+        # this should now be in same format as one row of BBoxIndex.bboxes
         bbox = np.array([slc[0].start, slc[1].start, slc[0].stop, slc[1].stop], dtype=np.int32)
 
         # native offset
@@ -227,94 +736,198 @@ class LazyCziConverter (object):
         bbox_native = bbox + native_offset
 
         # composite output buffer
-        output = np.zeros(((bbox[2]-bbox[0])/zoom, (bbox[3]-bbox[1])/zoom) + (self._fo.shape[-1],), dtype=dtype)
+        shape = ((bbox[2]-bbox[0])/zoom, (bbox[3]-bbox[1])/zoom) + (self._fo.shape[-1],)
+
+        if plane is None and self._z_mode in ['first', 'middle', 'planes']:
+            assert len(self._planes) == 1, 'z_mode %s requires a plane for get_tile_data' % self._z_mode
+            plane = self._planes[0]
+
+        if tilesize is not None:
+            tilesize = tuple(tilesize)
+            k, kr = divmod(int(bbox[0]) / zoom, tilesize[0])
+            j, jr = divmod(int(bbox[1]) / zoom, tilesize[1])
+            assert kr == 0 and jr == 0, 'slice %s is not aligned to tile size %s' % (slc, tilesize)
+            tile = (k, j, tilesize)
+        else:
+            tile = None
 
-        if fill is not None:
-            output[:,:,:] = fill
+        if plane is not None or self._planes == [None]:
+            output = np.zeros(shape, dtype=dtype)
+            if fill is not None:
+                output[:,:,:] = fill
+            self._composite_plane(channelno, zoom, bbox_native, plane, output, range_accum, tile=tile)
+        else:
+            # fold planes into accumulator while counting planes acquired per pixel
+            accum = np.zeros(shape, dtype=(np.float32 if self._z_mode == 'mean' else dtype))
+            counts = np.zeros(shape[0:2], dtype=np.uint16)
+            plane_output = np.zeros(shape, dtype=dtype)
+            coverage = np.zeros(shape[0:2], dtype=bool)
+            for p in self._planes:
+                coverage[:,:] = False
+                self._composite_plane(channelno, zoom, bbox_native, p, plane_output, coverage=coverage, tile=tile)
+                if self._z_mode == 'max':
+                    np.maximum(accum, plane_output, out=accum)
+                else:
+                    accum[coverage] += plane_output[coverage]
+                counts += coverage
+
+            acquired = counts > 0
+            if self._z_mode == 'mean':
+                output = np.zeros(shape, dtype=dtype)
+                output[acquired] = np.around(accum[acquired] / counts[acquired][:,None])
+            else:
+                output = accum
+            if fill is not None:
+                output[~acquired] = fill
+            if range_accum is not None and acquired.any():
+                merge_range(range_accum, output[acquired].min(), output[acquired].max())
+
+        # time spent here other than decoding source tiles
+        self._composite_seconds += (time.time() - t0) - (self._decode_seconds - decode_seconds)
         
-        # these entries overlap bbox by at least one pixel in canvas space
-        for ebbox_native, entry in self._get_intersecting_bbox_entries(channelno, zoom, bbox_native):
-
-            # find overlapping sub-rectangle in reduced resolution native canvas space
-            overlap_native = np.array(
-                tuple(map(max, bbox_native[0:2]/zoom, ebbox_native[0:2]/zoom))
-                + tuple(map(min, bbox_native[2:4]/zoom, ebbox_native[2:4]/zoom)),
-                dtype=np.int32
-            )
+        return output
 
-            # find reduced resolution grid coordinates of overlap in entry tile and in output tile
-            src_overlap = overlap_native.copy()
-            src_overlap[0:2] -= np.array(entry.start[self._slc][0:2], dtype=np.int32) / zoom
-            src_overlap[2:4] -= np.array(entry.start[self._slc][0:2], dtype=np.int32) / zoom
+    def _composite_plane(self, channelno, zoom, bbox_native, plane, output, range_accum=None, coverage=None, tile=None):
+        """Composite source tiles of one Z plane into output tile for bbox_native.
 
-            dst_overlap = overlap_native.copy()
-            dst_overlap[0:2] -= bbox_native[0:2] / zoom
-            dst_overlap[2:4] -= bbox_native[0:2] / zoom
+           range_accum is mutated as in get_tile_data.  coverage, if
+           not None, is a YX bool array set True where output pixels
+           were acquired.  tile, if not None, is (k, j, tilesize)
+           locating the output tile in the tier's CompositePlan.
+        """
+        index = self._channel_tier_maps[channelno][zoom].get(plane)
+        if index is None:
+            return
+        tier = self._plane_tiers[channelno][zoom][plane]
+
+        if tile is not None:
+            k, j, tilesize = tile
+            plan = self._composite_plan(channelno, zoom, plane, tilesize)
+            sources = None
+            rows = plan.tile(k, j)
+        else:
+            # plan just this output tile from the source tiles intersecting it
+            sources = index.query(bbox_native)
+            plan = CompositePlan(index.bboxes[sources], bbox_native[0:2], zoom, output.shape[0:2], output.shape[0:2])
+            sources = sources.tolist()
+            rows = plan.tile(0, 0)
 
-            assert src_overlap[0] >= 0
-            assert src_overlap[1] >= 0
-            assert src_overlap[2] <= entry.stored_shape[self._slc][0]
-            assert src_overlap[3] <= entry.stored_shape[self._slc][1]
+        for source, sy0, sx0, sy1, sx1, dy0, dx0, dy1, dx1 in rows:
+            entry = tier[source if sources is None else sources[source]][1]
 
-            #print overlap_native, zoom, src_overlap, dst_overlap
-            
             # get decoded tile data to slice and composite
-            data = self._entry_asarray_cached(entry, dtype)
-
-            # avoid empty slicing due to reduced resolution
-            if (src_overlap[2] - src_overlap[0]) > 0 and (src_overlap[3] - src_overlap[1]) > 0:
-                data_sliced = data[
-                    src_overlap[0]:src_overlap[2],
-                    src_overlap[1]:src_overlap[3],
-                    :
-                ]
-            
-                if range_accum is not None:
-                    # accumulate active pixel value range
-                    v0 = data_sliced.min()
-                    v1 = data_sliced.max()
-                    if range_accum[0] is None:
-                        range_accum[0] = v0
-                        range_accum[1] = v1
-                    else:
-                        range_accum[0] = min(v0, range_accum[0])
-                        range_accum[1] = max(v1, range_accum[1])
-
-                output[
-                    dst_overlap[0]:dst_overlap[2],
-                    dst_overlap[1]:dst_overlap[3],
-                    :
-                ] = data_sliced
-        
-        return output
+            data = self._entry_asarray_cached(entry, output.dtype)
+            assert sy1 <= data.shape[0] and sx1 <= data.shape[1], (entry, data.shape, (sy0, sx0, sy1, sx1))
+            data_sliced = data[sy0:sy1, sx0:sx1, :]
+
+            if range_accum is not None:
+                # accumulate active pixel value range
+                if sources is None:
+                    merge_range(range_accum, *self._entry_range(entry, data, plan.clip[source]))
+                else:
+                    merge_range(range_accum, data_sliced.min(), data_sliced.max())
 
-    def _entry_asarray_cached(self, entry, dtype=None):
-        cache_key = (entry, dtype)
-        if cache_key in self._tile_cache:
-            # use cached copy and update last-use time
-            data = self._tile_cache[cache_key][0]
-            self._tile_cache[cache_key][1] = self._tile_cache_clock
-            #sys.stderr.write('.')
+            output[dy0:dy1, dx0:dx1, :] = data_sliced
+
+            if coverage is not None:
+                coverage[dy0:dy1, dx0:dx1] = True
+
+    def _composite_plan(self, channelno, zoom, plane, tilesize):
+        """Get the cached CompositePlan of one channel zoom tier and plane for output tilesize."""
+        key = (channelno, zoom, plane, tilesize)
+        plan = self._composite_plans.get(key)
+        if plan is None:
+            H, W = self._bbox_zeroed[1]
+            plan = CompositePlan(
+                self._channel_tier_maps[channelno][zoom][plane].bboxes, self._bbox_native[0], zoom, tilesize, (H / zoom, W / zoom)
+            )
+            self._composite_plans[key] = plan
+        return plan
+
+    def _entry_range(self, entry, data, clip):
+        """Get the cached (min, max) of data decoded for entry within its canvas clip (y0, x0, y1, x1)."""
+        key = (entry, data.dtype)
+        value_range = self._entry_ranges.get(key)
+        if value_range is None:
+            part = data[clip[0]:clip[2], clip[1]:clip[3], :]
+            value_range = (part.min(), part.max())
+            self._entry_ranges[key] = value_range
+        return value_range
+
+    def _segment_extent(self, entry):
+        start = entry.file_position
+        i = np.searchsorted(self._segment_starts, start, side='right')
+        return start, int(self._segment_starts[min(i, len(self._segment_starts) - 1)])
+
+    def prefetch_rows(self, channelno, zoom, rows, tilesize, plane=None):
+        """Queue source subblocks of the given output tile rows for prefetching.
+
+           Subblocks already in the tile cache or queued by an earlier
+           call are skipped.  Planes
+           are chosen as in get_tile_data.  Does nothing unless the
+           converter was created with prefetch=True.
+        """
+        if not self._prefetch or not len(rows):
+            return
+        if self._prefetcher is None:
+            self._prefetcher = Prefetcher(self._czifilename)
+        H, W = self._bbox_zeroed[1]
+        y0 = min(rows[0] * tilesize[0] * zoom, H)
+        y1 = min((rows[-1] + 1) * tilesize[0] * zoom, H)
+        if y1 <= y0:
+            return
+        bbox_native = np.array([y0, 0, y1, W], dtype=np.int32) + np.array(
+            [self._bbox_native[0][0], self._bbox_native[0][1], self._bbox_native[0][0], self._bbox_native[0][1]],
+            dtype=np.int32
+        )
+        if plane is not None or self._z_mode in ['first', 'middle', 'planes']:
+            planes = [ plane if plane is not None else self._planes[0] ]
         else:
-            items = self._tile_cache.items()
-            if len(items) >= self._tile_cache_size:
-                # evict oldest item
-                items.sort(key=lambda item: item[1][1])
-                victim_key = items[0][0]
-                items = None
-                del self._tile_cache[victim_key]
-                #sys.stderr.write('E')
-            else:
-                #sys.stderr.write('L')
-                pass
+            planes = self._planes
+        ranges = []
+        for p in planes:
+            for ebbox_native, entry in self._get_intersecting_bbox_entries(channelno, zoom, bbox_native, p):
+                if entry.file_position in self._prefetched or (entry, np.dtype(np.uint8)) in self._tile_cache:
+                    continue
+                self._prefetched.add(entry.file_position)
+                ranges.append(self._segment_extent(entry))
+        self._prefetcher.submit(ranges)
+
+    def close(self):
+        """Stop prefetching and drop cached source tiles; the converter remains usable."""
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
+        self._prefetched = set()
+        self._tile_cache = TileCache(self._tile_cache.capacity)
 
-            # insert new item
+    def _entry_asarray_cached(self, entry, dtype=None):
+        def load():
+            start, stop = self._segment_extent(entry)
+            if start != self._read_end:
+                self._read_seeks += 1
+            self._read_end = stop
+            self._read_bytes += stop - start
+            t0 = time.time()
             data = self._entry_asarray(entry, dtype)
-            self._tile_cache[cache_key] = [data, self._tile_cache_clock]
-            
-        self._tile_cache_clock += 1
-        
-        return data
+            self._decode_seconds += time.time() - t0
+            return data
+        return self._tile_cache.get((entry, dtype), load)
+
+    def stats(self):
+        """Return tile cache counters and tile decode and compositing times."""
+        stats = self._tile_cache.stats()
+        stats.update(decode_seconds=self._decode_seconds, composite_seconds=self._composite_seconds)
+        stats.update(read_seeks=self._read_seeks, read_bytes=self._read_bytes)
+        if self._prefetcher is not None:
+            stats.update(
+                prefetch_seeks=self._prefetcher.seeks,
+                prefetch_bytes=self._prefetcher.bytes,
+                prefetch_seconds=self._prefetcher.seconds
+            )
+        else:
+            stats.update(prefetch_seeks=0, prefetch_bytes=0, prefetch_seconds=0.0)
+        return stats
     
     def _entry_asarray(self, entry, dtype=None):
         """Get numpy array YXC for entry."""
@@ -327,45 +940,277 @@ class LazyCziConverter (object):
         if dtype != None:
             if data.dtype != dtype:
                 # need to truncate or renormalize
-                if data.dtype == np.uint16 and dtype == np.uint8:
-                    if self._channel_ranges is not None:
-                        v1 = self._channel_ranges[entry.start[self._C]][1]
-                        data = (data.astype(np.float32) * (1./v1) * 255).astype(np.uint8)
-                    else:
-                        # truncate assuming full-range
-                        data = (data / 256).astype(np.uint8)
+                if dtype == np.uint8 and data.dtype == np.uint16:
+                    # Gray16 or Bgr48 via per-channel lookup table
+                    data = apply_lut(self._channel_lut(entry.start[self._C]), data)
+                elif dtype == np.uint8 and data.dtype.kind == 'f':
+                    # Gray32Float or Bgr96Float, windowed in floating point
+                    window = self._channel_ranges[entry.start[self._C]] if self._channel_ranges is not None else None
+                    data = float_to_uint8(data, window, self._gamma)
                 else:
                     assert False, 'unimplemented conversion %s -> %s' % (data.dtype, dtype)
                     
         return data
 
-def array_to_jpeg(array, Y, X, jpegroot=None, quality=75):
-    """Save pixel array to JPEG.  Needs work."""
+    def _channel_lut(self, channelno):
+        """Get the cached uint16 to uint8 lookup table for channel."""
+        lut = self._luts.get(channelno)
+        if lut is None:
+            window = self._channel_ranges[channelno] if self._channel_ranges is not None else None
+            lut = tone_lut(window, self._gamma)
+            self._luts[channelno] = lut
+        return lut
+
+def jpeg_bytes(array, quality=75):
+    """Encode YXC pixel array as JPEG file content."""
+    if array.shape[2] == 1:
+        # drop single-channel dimension for grayscale array
+        array = array[:,:,0]
 
-    jpegname = '%d_%d.jpg' % (X, Y)
-        
-    if jpegroot:
-        jpegname = "%s/%s" % (jpegroot, jpegname)
+    buf = cStringIO.StringIO()
+    Image.fromarray(array).save(buf, 'JPEG', quality=quality)
+    return buf.getvalue()
 
-    dirname = os.path.dirname(jpegname)
-    try:
-        os.makedirs(dirname)
-    except:
-        # may already exist?
-        pass
+def write_tile_file(jpegname, data):
+    """Save encoded tile content as file jpegname."""
+    f = open(jpegname, 'wb')
+    f.write(data)
+    f.close()
 
-    if array.shape[2] == 1:
-        # drop single-channel dimension for grayscale array?
-        array = array[:,:,0]
+class TileContainer (object):
+    """Single SQLite file holding all JPEG tiles of one DZI pyramid.
 
-    try:
-        img = toimage(array)
-        img.save(jpegname, quality=quality)
-    except Exception, te:
-        print te, array.shape, Y, X, jpegroot, quality
-        raise te
+       The layout follows MBTiles, with tiles (zoom_level,
+       tile_column, tile_row, tile_data) and metadata (name, value)
+       tables, except tile_row counts from the top as in DZI.  A tile
+       is found through the unique tile index in a few page reads
+       regardless of pyramid size.
+
+       Usage as a reader:
 
-def metadata_to_xml(meta, channelno, channeldir):
+          c = TileContainer('slide.dzi/DAPI.mbtiles', readonly=True)
+          data = c.get(level, col, row)
+
+    """
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        if readonly:
+            assert os.path.exists(path), path
+        # tiles may be stored from TileWriter threads, serialized by our lock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.text_factory = str
+        self._lock = threading.Lock()
+        if not readonly:
+            self._db.execute('CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)')
+            self._db.execute('CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)')
+            self._db.commit()
+
+    def put(self, level, col, row, data, replace=True):
+        """Store tile content, keeping an existing tile unless replace is True."""
+        self._lock.acquire()
+        try:
+            self._db.execute(
+                'INSERT OR %s INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)' % ('REPLACE' if replace else 'IGNORE'),
+                (level, col, row, sqlite3.Binary(data))
+            )
+        finally:
+            self._lock.release()
+
+    def get(self, level, col, row):
+        """Return tile content or None if the tile is absent."""
+        self._lock.acquire()
+        try:
+            result = self._db.execute(
+                'SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?',
+                (level, col, row)
+            ).fetchone()
+        finally:
+            self._lock.release()
+        if result is not None:
+            return str(result[0])
+
+    def tiles(self):
+        """Yield (level, col, row) for every stored tile."""
+        for key in self._db.execute('SELECT zoom_level, tile_column, tile_row FROM tiles ORDER BY zoom_level, tile_row, tile_column').fetchall():
+            yield key
+
+    def set_metadata(self, name, value):
+        self._lock.acquire()
+        try:
+            self._db.execute('INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)', (name, value))
+        finally:
+            self._lock.release()
+
+    def metadata(self):
+        return dict(self._db.execute('SELECT name, value FROM metadata').fetchall())
+
+    def commit(self):
+        """Make stored tiles durable."""
+        self._lock.acquire()
+        try:
+            self._db.commit()
+        finally:
+            self._lock.release()
+
+    def close(self):
+        self.commit()
+        self._db.close()
+
+    def extract(self, dirname):
+        """Write tiles into the DZI directory layout under dirname for directory-based viewers."""
+        for level, col, row in self.tiles():
+            zoomdirname = '%s/%d' % (dirname, level)
+            if not os.path.isdir(zoomdirname):
+                os.makedirs(zoomdirname)
+            write_tile_file('%s/%d_%d.jpg' % (zoomdirname, col, row), self.get(level, col, row))
+        properties = self.metadata().get('ImageProperties.xml')
+        if properties is not None:
+            f = open('%s/ImageProperties.xml' % dirname, 'w')
+            f.write(properties)
+            f.close()
+
+class ContainerStore (object):
+    """Route tiles named as in the DZI directory layout into per-pyramid TileContainers.
+
+       Tile channeldir/level/col_row.jpg is stored in the container
+       channeldir.mbtiles, so tile naming is the same for both kinds
+       of output.
+    """
+
+    def __init__(self, replace=True):
+        self.replace = replace
+        self.containers = dict()
+        self._lock = threading.Lock()
+
+    def container(self, channeldir):
+        # opened on first use, possibly by concurrent TileWriter threads
+        self._lock.acquire()
+        try:
+            if channeldir not in self.containers:
+                self.containers[channeldir] = TileContainer('%s.mbtiles' % channeldir)
+            return self.containers[channeldir]
+        finally:
+            self._lock.release()
+
+    def __call__(self, jpegname, data):
+        zoomdirname, basename = os.path.split(jpegname)
+        channeldir, level = os.path.split(zoomdirname)
+        col, row = basename[0:-len('.jpg')].split('_')
+        self.container(channeldir).put(int(level), int(col), int(row), data, self.replace)
+
+    def commit(self):
+        for container in self.containers.values():
+            container.commit()
+
+    def close(self):
+        for container in self.containers.values():
+            container.close()
+
+class TileWriter (object):
+    """Thread pool encoding and writing JPEG tiles while compositing continues.
+
+       PIL releases the GIL while encoding, so encoding and file I/O
+       overlap with decoding and compositing of later tiles.  The tile
+       queue is bounded so compositing cannot run far ahead.  With
+       zero threads, submit() encodes and writes synchronously.
+
+       The first encode or write error is raised again by the next
+       submit(), flush(), or close().
+
+       store(jpegname, data) saves each encoded tile, by default as a
+       file.
+    """
+
+    def __init__(self, threads=2, quality=75, store=write_tile_file):
+        self.quality = quality
+        self.store = store
+        self.encode_seconds = 0.0
+        self.write_seconds = 0.0
+        self._submitted = 0
+        self._written = 0
+        self._finished = set()
+        self._error = None
+        self._lock = threading.Lock()
+        self._queue = Queue.Queue(maxsize=2 * threads)
+        self._threads = [ threading.Thread(target=self._run) for i in range(threads) ]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, array, jpegname):
+        """Queue tile array to be saved as jpegname."""
+        self._check()
+        seq = self._submitted
+        self._submitted += 1
+        if self._threads:
+            self._queue.put((seq, array, jpegname))
+        else:
+            self._save(seq, array, jpegname)
+
+    def submitted(self):
+        return self._submitted
+
+    def written(self):
+        """Return n such that the first n submitted tiles are all written."""
+        self._lock.acquire()
+        try:
+            return self._written
+        finally:
+            self._lock.release()
+
+    def flush(self):
+        """Wait until every submitted tile is written."""
+        self._queue.join()
+        self._check()
+
+    def close(self):
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._check()
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error[0], self._error[1], self._error[2]
+
+    def _save(self, seq, array, jpegname):
+        t0 = time.time()
+        data = jpeg_bytes(array, self.quality)
+        t1 = time.time()
+        self.store(jpegname, data)
+        t2 = time.time()
+
+        self._lock.acquire()
+        try:
+            self.encode_seconds += t1 - t0
+            self.write_seconds += t2 - t1
+            # advance the contiguous written count past out-of-order completions
+            self._finished.add(seq)
+            while self._written in self._finished:
+                self._finished.remove(self._written)
+                self._written += 1
+        finally:
+            self._lock.release()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None:
+                    self._save(*item)
+            except:
+                if self._error is None:
+                    self._error = sys.exc_info()
+            finally:
+                self._queue.task_done()
+
+def metadata_to_xml(meta, channelno, channeldir, container=None):
     color_argb = meta['channel'][channelno]['color']
     if color_argb is not None and color_argb[0] == '#' and len(color_argb[1:]) == 8:
         alpha = '%f' % (int(color_argb[1:3], 16) / 255.0)
@@ -404,8 +1249,8 @@ def metadata_to_xml(meta, channelno, channeldir):
 />""" % dict(
     P=channeldir,
     CN=meta['channel'][channelno]['cname_long'],
-    W=meta['canvas_size'][0],
-    H=meta['canvas_size'][1],
+    W=meta['channel'][channelno].get('canvas_size', meta['canvas_size'])[0],
+    H=meta['channel'][channelno].get('canvas_size', meta['canvas_size'])[1],
     PPM=pix_per_meter,
     NT=meta['channel'][channelno]['ntiles'],
     TW=meta['tile_size'][0],
@@ -415,21 +1260,596 @@ def metadata_to_xml(meta, channelno, channeldir):
     V0=(meta['channel'][channelno]['valuerange'][0] / 255.0),
     V1=(meta['channel'][channelno]['valuerange'][1] / 255.0),
 )
-    f = open('%s/ImageProperties.xml' % channeldir, 'w')
-    f.write(doc)
-    f.close()
+    if container is not None:
+        container.set_metadata('ImageProperties.xml', doc)
+    else:
+        f = open('%s/ImageProperties.xml' % channeldir, 'w')
+        f.write(doc)
+        f.close()
     
-def main(czifilename, dzidirname=None):
+def merge_range(range_accum, v0, v1):
+    """Merge value range [v0, v1] into range_accum in place.
+
+       This follows the range_accum conventions of get_tile_data, so
+       [None, None] on either side means no pixels were seen.
+    """
+    if v0 is None:
+        return
+    if range_accum[0] is None:
+        range_accum[0] = v0
+        range_accum[1] = v1
+    else:
+        range_accum[0] = min(v0, range_accum[0])
+        range_accum[1] = max(v1, range_accum[1])
+
+def tile_grid(converter, zoom, tilesize):
+    """Return (H, W, K, J) canvas shape and output tile grid shape for zoom."""
+    H, W = map(lambda x: x/zoom, converter.canvas_size())
+    K, J = map(lambda c, t: c/t + (c%t and 1 or 0), (H, W), tilesize)
+    return H, W, K, J
+
+class Checkpoint (object):
+    """Per-tile completion bitmaps and value ranges of a conversion in progress.
+
+       With a path, the state is saved as a JSON manifest, rewritten
+       atomically at most every interval seconds, so that a restarted
+       conversion can skip completed tiles without decoding them.  A
+       manifest whose signature does not match the current conversion
+       settings is ignored.
+    """
+
+    def __init__(self, path, signature, interval=60, sync=None):
+        self.path = path
+        # called before each manifest write to make finished tiles durable
+        self.sync = sync
+        # normalize through JSON so it compares equal to a loaded manifest
+        self.signature = json.loads(json.dumps(signature))
+        self.interval = interval
+        # key: (channel, zoom), value: KxJ bool array of finished tiles
+        self.done = dict()
+        # key: channel, value: [v0, v1] over finished tiles
+        self.pixel_ranges = dict()
+        self._written = time.time()
+        self._loaded = None
+        if path and os.path.exists(path):
+            f = open(path)
+            manifest = json.load(f)
+            f.close()
+            if manifest.get('signature') == self.signature:
+                self._loaded = manifest
+
+    def add_level(self, channel, zoom, K, J):
+        """Register the KxJ tile grid of one channel zoom tier, restoring saved progress."""
+        done = np.zeros((K, J), dtype=bool)
+        saved = None
+        if self._loaded is not None:
+            saved = self._loaded['channels'].get(str(channel))
+        if saved is not None:
+            level = saved['zooms'].get(str(zoom))
+            if level is not None and tuple(level['grid']) == (K, J):
+                bits = np.frombuffer(base64.b64decode(level['done']), dtype=np.uint8)
+                done = np.unpackbits(bits)[0:K*J].reshape((K, J)).astype(bool)
+        self.done[(channel, zoom)] = done
+        if channel not in self.pixel_ranges:
+            self.pixel_ranges[channel] = list(saved['pixel_range']) if saved is not None else [None, None]
+
+    def row_done(self, channel, zoom, k, v0, v1):
+        self.done[(channel, zoom)][k,:] = True
+        merge_range(self.pixel_ranges[channel], v0, v1)
+        if self.path and (time.time() - self._written) >= self.interval:
+            self.write()
+
+    def ntiles_done(self, channel=None):
+        return sum([ int(done.sum()) for (c, zoom), done in self.done.items() if channel is None or c == channel ])
+
+    def write(self):
+        if self.sync is not None:
+            self.sync()
+        channels = dict()
+        for (channel, zoom), done in self.done.items():
+            if channel not in channels:
+                channels[channel] = dict(
+                    pixel_range=[ int(v) if v is not None else None for v in self.pixel_ranges[channel] ],
+                    zooms=dict()
+                )
+            channels[channel]['zooms'][zoom] = dict(
+                grid=done.shape,
+                done=base64.b64encode(np.packbits(done.ravel()).tostring())
+            )
+        tmpname = self.path + '.tmp'
+        f = open(tmpname, 'w')
+        json.dump(dict(signature=self.signature, channels=channels), f)
+        f.close()
+        os.rename(tmpname, self.path)
+        self._written = time.time()
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+def render_tile_rows(converter, writer, channel, zoom, rows, tilesize, dzizoomdirname, fill=None, skip_existing=False, range_accum=None, done=None, plane=None, tiles=None):
+    """Render output tiles in the given tile rows of one channel zoom tier and queue them on writer.
+
+       done, if not None, is a bool array with one row per tile row
+       marking tiles to skip without decoding.
+
+       plane selects one Z plane as in get_tile_data.
+
+       tiles, if not None, is a list extended with each rendered tile
+       array in row-major order.
+
+       Returns the number of tiles rendered.  range_accum is mutated
+       as in get_tile_data.
+    """
+    H, W, K, J = tile_grid(converter, zoom, tilesize)
+    count = 0
+    for i, k in enumerate(rows):
+        for j in range(J):
+            if done is not None and done[i,j]:
+                continue
+
+            tile = converter.get_tile_data(
+                channel, zoom,
+                (
+                    slice(k*tilesize[0], (k+1)*tilesize[0]),
+                    slice(j*tilesize[1], (j+1)*tilesize[1]),
+                ),
+                fill=fill,
+                range_accum=range_accum,
+                plane=plane,
+                tilesize=tilesize
+            )
+
+            if skip_existing and os.access('%s/%d_%d.jpg' % (dzizoomdirname, j, k), os.F_OK):
+                pass
+            else:
+                writer.submit(tile, '%s/%d_%d.jpg' % (dzizoomdirname, j, k))
+            if tiles is not None:
+                tiles.append(tile)
+            count += 1
+    return count
+
+STATS_KEYS = [
+    'hits', 'misses', 'evictions', 'decode_seconds', 'composite_seconds', 'encode_seconds', 'write_seconds',
+    'read_seeks', 'read_bytes', 'prefetch_seeks', 'prefetch_bytes', 'prefetch_seconds',
+]
+
+def render_stats(converter, writer):
+    stats = converter.stats()
+    stats.update(encode_seconds=writer.encode_seconds, write_seconds=writer.write_seconds)
+    return stats
+
+def reduce_tiles(children, shape, tilesize):
+    """Box-reduce a 2x2 group of child tiles into one parent tile of YXC shape.
+
+       children is [[c00, c01], [c10, c11]] with None for child tiles
+       beyond the child level edge, which the parent never samples.
+    """
+    ph, pw, spp = shape
+    if ph == 0 or pw == 0:
+        return np.zeros(shape, dtype=np.uint8)
+    # 2x2 neighborhood sums fit uint16 for uint8 tiles
+    mosaic = np.zeros((2*ph, 2*pw, spp), dtype=np.uint16)
+    T = tilesize
+    for y in range(2):
+        for x in range(2):
+            child = children[y][x]
+            if child is None:
+                continue
+            region = mosaic[y*T[0]:min((y+1)*T[0], 2*ph), x*T[1]:min((x+1)*T[1], 2*pw)]
+            region[...] = child[0:region.shape[0], 0:region.shape[1]]
+    total = mosaic[0::2,0::2] + mosaic[1::2,0::2] + mosaic[0::2,1::2] + mosaic[1::2,1::2]
+    return ((total + 2) / 4).astype(np.uint8)
+
+def pyramid_levels(converter, tilesize):
+    """Return [(zoom, stored), ...] for every power-of-two DZI level.
+
+       Levels run from zoom 1 down to the first level fitting in one
+       output tile, or to the coarsest CZI pyramid tier if that is
+       smaller.  stored is False for levels missing from the CZI
+       pyramid, which are synthesized from the next finer level.
+    """
+    stored = set(converter._zoom_levels)
+    assert 1 in stored, 'CZI has no full resolution tier %s' % converter._zoom_levels
+    levels = [ (1, True) ]
+    while True:
+        zoom = levels[-1][0]
+        H, W, K, J = tile_grid(converter, zoom, tilesize)
+        if (K <= 1 and J <= 1) and not [ z for z in stored if z > zoom ]:
+            break
+        levels.append((zoom * 2, (zoom * 2) in stored))
+    return levels
+
+def save_tile_row(filename, tiles):
+    """Save a row of tile arrays losslessly for a later synthesis pass."""
+    tmpname = filename + '.tmp'
+    f = open(tmpname, 'wb')
+    np.save(f, np.concatenate(tiles, axis=1))
+    f.close()
+    os.rename(tmpname, filename)
+
+def load_tile_row(filename, tilesize):
+    """Return the list of tile arrays saved by save_tile_row."""
+    row = np.load(filename)
+    return [ row[:,x:x+tilesize[1]] for x in range(0, row.shape[1], tilesize[1]) ]
+
+def render_task(converter, writer, task, report):
+    """Render one planned tile row band, calling report(row) once each tile row is written.
+
+       Each row is (pyramid, zoom, k, count, v0, v1, stats) where
+       stats has the STATS_KEYS counters and times accrued since the
+       previous report.
+
+       The band is rendered from the CZI at zoom, then synthesized
+       levels listed in the task as (zoom, dzizoomdirname) are made
+       bottom up by box-reducing pairs of finished tile rows from the
+       level below, holding at most two tile rows per level.
+
+       If the task has a source filename pattern, the band is instead
+       loaded from tile rows saved by an earlier pass, and is not
+       reported again.  If it has a persist filename pattern, each
+       tile row of the top synthesized level is saved for a later pass
+       before it is reported.
+    """
+    pyramid, scene, channel, plane, zoom, rows, tilesize, dzizoomdirname, fill, skip_existing, done, synth, source, persist = task
+    last = render_stats(converter, writer)
+
+    def report_row(row):
+        # attribute counters and times to rows as they are reported
+        now = render_stats(converter, writer)
+        report(row + (dict([ (key, now[key] - last[key]) for key in STATS_KEYS ]),))
+        last.update(now)
+
+    # rows rendered but still waiting on queued tile writes
+    pending = collections.deque()
+
+    # levels are (zoom, dzizoomdirname, K) with child tile rows waiting to be reduced
+    levels = [ (zoom, dzizoomdirname, tile_grid(converter, zoom, tilesize)[2]) ]
+    levels.extend([ (z, d, tile_grid(converter, z, tilesize)[2]) for z, d in synth ])
+    waiting = [ [] for level in levels ]
+
+    def reduce_row(m, k, tiles):
+        # cascade one finished tile row k of level m into the synthesized level above
+        if m + 1 >= len(levels):
+            if persist is not None:
+                save_tile_row(persist % k, tiles)
+            return
+        waiting[m].append(tiles)
+        if len(waiting[m]) < 2 and k + 1 < levels[m][2]:
+            return
+        upper, lower = waiting[m][0], (waiting[m][1] if len(waiting[m]) > 1 else None)
+        waiting[m] = []
+        pzoom, pdirname, pK = levels[m+1]
+        pk = k / 2
+        if pk >= pK:
+            # an odd last child row whose pixels the parent canvas drops
+            return
+        H, W, K, J = tile_grid(converter, pzoom, tilesize)
+        ptiles = []
+        for pj in range(J):
+            shape = (min(tilesize[0], H - pk*tilesize[0]), min(tilesize[1], W - pj*tilesize[1]), upper[0].shape[2])
+            children = [
+                [ row[2*pj] if row is not None and 2*pj < len(row) else None,
+                  row[2*pj+1] if row is not None and 2*pj+1 < len(row) else None ]
+                for row in [upper, lower]
+            ]
+            tile = reduce_tiles(children, shape, tilesize)
+            jpegname = '%s/%d_%d.jpg' % (pdirname, pj, pk)
+            if not (skip_existing and os.access(jpegname, os.F_OK)):
+                writer.submit(tile, jpegname)
+            ptiles.append(tile)
+        pending.append((writer.submitted(), (pyramid, pzoom, pk, J, None, None)))
+        reduce_row(m + 1, pk, ptiles)
+
+    if source is not None:
+        for k in rows:
+            reduce_row(0, k, load_tile_row(source % k, tilesize))
+            while pending and pending[0][0] <= writer.written():
+                report_row(pending.popleft()[1])
+    else:
+        # keep source reads for the next tile row one row ahead of decoding
+        converter.prefetch_rows(channel, zoom, rows[0:1], tilesize, plane)
+
+        for i in range(len(rows)):
+            if i + 1 < len(rows):
+                converter.prefetch_rows(channel, zoom, rows[i+1:i+2], tilesize, plane)
+            pixel_range = [None, None]
+            tiles = [] if synth else None
+            count = render_tile_rows(
+                converter, writer, channel, zoom, rows[i:i+1], tilesize, dzizoomdirname,
+                fill=fill, skip_existing=skip_existing, range_accum=pixel_range,
+                done=done[i:i+1], plane=plane, tiles=tiles
+            )
+            pending.append((writer.submitted(), (pyramid, zoom, rows[i], count, pixel_range[0], pixel_range[1])))
+            if synth:
+                reduce_row(0, rows[i], tiles)
+            while pending and pending[0][0] <= writer.written():
+                report_row(pending.popleft()[1])
+
+    writer.flush()
+    while pending:
+        report_row(pending.popleft()[1])
+
+def plan_synthesis(converter, pyramid, scene, channel, plane, zoom, dzizoomdirname, synth, tilesize, checkpoint, fill=None, skip_existing=False, workspace=None):
+    """Return [(tasks, nreports), ...] passes rendering a stored level and the synthesized levels above it.
+
+       The passes must run in order.  The first renders chunks of
+       2**SYNTH_PASS_LEVELS tile rows from the CZI at zoom and reduces
+       each into whole tile rows of up to SYNTH_PASS_LEVELS synthesized
+       levels.  Higher levels need more tile rows than one chunk, so
+       each chunk saves its top tile row in workspace and the next pass
+       reduces chunks of those rows in turn.
+
+       Chunks are aligned and sized independently of the number of
+       workers, so a restart plans the same chunks and skips finished
+       ones.  Any other chunk is rendered again whole, so its tile rows
+       are cleared in the checkpoint first.
+    """
+    C = 2 ** SYNTH_PASS_LEVELS
+    # the stored level and each level above it as (zoom, dzizoomdirname, K, done)
+    chain = [ (z, d, tile_grid(converter, z, tilesize)[2], checkpoint.done[(pyramid, z)]) for z, d in [ (zoom, dzizoomdirname) ] + list(synth) ]
+    rowfiles = [ '%s/%d_%d_%%d.npy' % (workspace, pyramid, z) for z, d, K, done in chain ]
+
+    passes = []
+    for i0 in range(0, len(chain) - 1, SYNTH_PASS_LEVELS):
+        i1 = min(i0 + SYNTH_PASS_LEVELS, len(chain) - 1)
+        source = rowfiles[i0] if i0 > 0 else None
+        persist = rowfiles[i1] if i1 < len(chain) - 1 else None
+        H, W, K, J = tile_grid(converter, chain[i0][0], tilesize)
+        tasks = []
+        nreports = 0
+        for k0 in range(0, K, C):
+            k1 = min(k0 + C, K)
+            # tile rows of each level made by the chunk, less any dropped with an odd last child row,
+            # and in the first pass its rows of the stored level
+            spans = []
+            for m in range(0 if source is None else 1, i1 - i0 + 1):
+                z, d, Km, done = chain[i0 + m]
+                spans.append((done, min(k0 >> m, Km), min((k1 + (1 << m) - 1) >> m, Km)))
+            finished = min([ done[a:b,:].all() for done, a, b in spans ])
+            if persist is not None and k0 / C < chain[i1][2] and not os.path.exists(persist % (k0 / C)):
+                finished = False
+            if finished:
+                continue
+            for done, a, b in spans:
+                done[a:b,:] = False
+            tasks.append((
+                pyramid, scene, channel, plane, chain[i0][0], range(k0, k1), tilesize, chain[i0][1], fill, skip_existing,
+                np.zeros((k1 - k0, J), dtype=bool), [ (z, d) for z, d, Km, done in chain[i0+1:i1+1] ], source, persist
+            ))
+            nreports += sum([ b - a for done, a, b in spans ])
+        passes.append((tasks, nreports))
+    return passes
+
+# per-process converter, tile writer, and connection to the parent for parallel tile workers
+_worker_converter = None
+_worker_scene_converters = dict()
+_worker_writer = None
+_worker_conn = None
+_worker_lock = None
+
+def _worker_init(czifilename, channel_ranges, cache_bytes, z_mode, gamma, index_cache, prefetch, quality, jpeg_threads, container):
+    global _worker_converter, _worker_writer
+    _worker_converter = LazyCziConverter(
+        czifilename, channel_ranges=channel_ranges, cache_bytes=cache_bytes, z_mode=z_mode, gamma=gamma,
+        index_cache=index_cache, prefetch=prefetch, verbose=False
+    )
+    if container:
+        # the parent process is the only container writer
+        _worker_writer = TileWriter(jpeg_threads, quality, _worker_store)
+    else:
+        _worker_writer = TileWriter(jpeg_threads, quality)
+
+def _worker_send(message):
+    # tile writer threads and the render loop share the connection
+    _worker_lock.acquire()
+    try:
+        _worker_conn.send(message)
+    finally:
+        _worker_lock.release()
+
+def _worker_store(jpegname, data):
+    _worker_send(('tile', jpegname, data))
+
+def _worker_report(row):
+    _worker_send(('row', row))
+
+def _worker_scene_converter(scene):
+    """Return this worker's converter for scene, closing the one of any previous scene."""
+    if scene is None:
+        return _worker_converter
+    if scene not in _worker_scene_converters:
+        for converter in _worker_scene_converters.values():
+            converter.close()
+        _worker_scene_converters.clear()
+        _worker_scene_converters[scene] = _worker_converter.scene_converter(scene)
+    return _worker_scene_converters[scene]
+
+def _worker_render(task):
+    render_task(_worker_scene_converter(task[1]), _worker_writer, task, _worker_report)
+
+def _worker_main(conn, initializer, initargs):
+    """Render tasks asked of the parent over conn until it answers None."""
+    global _worker_conn, _worker_lock
+    _worker_conn = conn
+    _worker_lock = threading.Lock()
+    try:
+        initializer(*initargs)
+        while True:
+            _worker_send(('next',))
+            task = conn.recv()
+            if task is None:
+                break
+            _worker_render(task)
+        _worker_writer.close()
+    except:
+        try:
+            _worker_send(('error', traceback.format_exc()))
+        except:
+            pass
+        sys.exit(1)
+
+def render_parallel(workers, initializer, initargs, tasks, nreports, store, report):
+    """Render tasks in worker processes, calling report(row) for each of nreports tile rows.
+
+       Each worker runs initializer(*initargs) to set up its converter
+       and tile writer, then asks for one task at a time.  Tiles sent
+       back by workers storing through the parent are passed to
+       store(jpegname, data).
+
+       A worker that fails, or dies without a word, e.g. to the OOM
+       killer, aborts the conversion with RuntimeError instead of
+       leaving its tile rows unreported forever.
+    """
+    tasks = collections.deque(tasks)
+    remaining = nreports
+    # key: parent end file descriptor, value: (connection, process)
+    conns = dict()
+    try:
+        for i in range(workers):
+            conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker_main, args=(child_conn, initializer, initargs))
+            process.daemon = True
+            process.start()
+            # only the worker holds its end, so the parent reads EOF once the worker is gone
+            child_conn.close()
+            conns[conn.fileno()] = (conn, process)
+
+        while conns:
+            ready, _, _ = select.select(conns.keys(), [], [], 1.0)
+            if not ready:
+                for conn, process in conns.values():
+                    if process.exitcode:
+                        raise RuntimeError('tile worker %d exited with code %d' % (process.pid, process.exitcode))
+            for fd in ready:
+                conn, process = conns[fd]
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    process.join()
+                    del conns[fd]
+                    conn.close()
+                    if process.exitcode:
+                        raise RuntimeError('tile worker %d exited with code %d' % (process.pid, process.exitcode))
+                    continue
+                if message[0] == 'next':
+                    conn.send(tasks.popleft() if tasks else None)
+                elif message[0] == 'tile':
+                    # arrives before the report of its tile row
+                    store(*message[1:])
+                elif message[0] == 'row':
+                    report(message[1])
+                    remaining -= 1
+                else:
+                    raise RuntimeError('tile worker %d failed:\n%s' % (process.pid, message[1]))
+
+        if remaining:
+            raise RuntimeError('tile workers finished with %d tile rows unreported' % remaining)
+    finally:
+        for conn, process in conns.values():
+            process.terminate()
+        for conn, process in conns.values():
+            process.join()
+            conn.close()
+
+def main(czifilename, dzidirname=None, workers=None):
     """Convert CZI to DZI.  work in progress...
-    
+
+       workers: number of tile rendering processes, defaulting to
+       DZI_WORKERS or 1.  With more than one worker, the output tile
+       grid of each channel zoom tier is split into bands of tile rows
+       rendered by a process pool, each with its own converter and
+       tile cache.  Output is identical to the serial mode.  A worker
+       that dies, e.g. to the OOM killer, aborts the conversion with an
+       error; a restart resumes from the checkpoint.
+
+       Progress is checkpointed to checkpoint.json in the DZI
+       directory every DZI_CHECKPOINT_SECONDS (default 60, 0 disables)
+       so an interrupted conversion resumes where it left off.  Levels
+       missing from the CZI pyramid are synthesized in fixed chunks of
+       tile rows, the same for any number of workers, so a restart only
+       redoes unfinished chunks; tile rows passed between synthesis
+       passes are kept in a synthesis directory in the DZI directory.
+       The checkpoint and that directory are removed once the
+       conversion completes.
+
+       With DZI_CONTAINER=mbtiles, the tiles of each pyramid are
+       stored in one TileContainer file instead of one file per tile.
+
+       A Z stack is rendered according to CZI_Z_MODE: 'first'
+       (default) or 'middle' for the first or middle plane only,
+       'planes' for a separate pyramid per channel and plane, or
+       'max' or 'mean' for an intensity projection over all planes.
+
+       A CZI file with several scenes, e.g. tissue sections on one
+       slide, is rendered as one canvas spanning all of them unless
+       CZI_SCENES is true, which gives separate pyramids per scene,
+       each bounded by its scene.  Tiles of all scenes are rendered by
+       the same worker pool, and the scenes are listed in info.json.
     """
     if dzidirname is None:
         assert czifilename[-4:] == '.czi'
         dzidirname = czifilename[0:-4] + '.dzi'
 
     renormalize = os.getenv('CZI_RENORMALIZE', 'f').lower() in ['t', 'true']
+
+    range_zoom = os.getenv('CZI_RANGE_ZOOM')
+    if range_zoom:
+        range_zoom = int(range_zoom)
+    else:
+        range_zoom = None
+
+    range_percentiles = os.getenv('CZI_RENORMALIZE_PERCENTILES')
+    if range_percentiles:
+        range_percentiles = tuple([ float(p) for p in range_percentiles.split(',') ])
+        assert len(range_percentiles) == 2
+    else:
+        range_percentiles = None
+
+    cache_bytes = os.getenv('CZI_TILE_CACHE_MB')
+    if cache_bytes:
+        cache_bytes = int(cache_bytes) * 1024 * 1024
+    else:
+        cache_bytes = None
+
+    z_mode = os.getenv('CZI_Z_MODE', 'first').lower()
+    if z_mode not in Z_MODES:
+        raise ValueError('CZI_Z_MODE must be one of %s' % ', '.join(Z_MODES))
+
+    gamma = float(os.getenv('CZI_GAMMA', '1.0'))
+    assert gamma > 0, gamma
+
+    index_cache = os.getenv('CZI_INDEX_CACHE')
+    if not index_cache or index_cache.lower() in ['f', 'false']:
+        index_cache = None
+    elif index_cache.lower() in ['t', 'true']:
+        index_cache = True
+
+    if workers is None:
+        workers = int(os.getenv('DZI_WORKERS', '1'))
+    assert workers >= 1, workers
+
+    prefetch = os.getenv('CZI_PREFETCH', 'f').lower() in ['t', 'true']
+
+    split_scenes = os.getenv('CZI_SCENES', 'f').lower() in ['t', 'true']
         
-    converter = LazyCziConverter(czifilename, renormalize=renormalize)
+    converter = LazyCziConverter(
+        czifilename, renormalize=renormalize, cache_bytes=cache_bytes,
+        range_zoom=range_zoom, range_percentiles=range_percentiles, z_mode=z_mode,
+        gamma=gamma, index_cache=index_cache, prefetch=(prefetch and workers == 1)
+    )
+
+    # one converter per scene, each with a canvas bounded by its subblocks
+    scenes = converter.scenes()
+    if len(scenes) > 1 and split_scenes:
+        scene_names = converter.scene_names()
+        converters = dict([ (scene, converter.scene_converter(scene)) for scene in scenes ])
+    else:
+        if len(scenes) > 1:
+            sys.stderr.write('Converting %d scenes as one canvas; set CZI_SCENES=true for a pyramid per scene\n' % len(scenes))
+        scenes = [ None ]
+        scene_names = dict()
+        converters = { None: converter }
 
     skip_existing = (os.getenv('DZI_SKIP_EXISTING') or '').lower() in ['t', 'true']
 
@@ -445,21 +1865,118 @@ def main(czifilename, dzidirname=None):
         quality = int(quality)
     else:
         quality = 75
+
+    container = os.getenv('DZI_CONTAINER', '').lower()
+    if container == 'mbtiles':
+        if not os.path.isdir(dzidirname):
+            os.makedirs(dzidirname)
+        store = ContainerStore(replace=not skip_existing)
+        # existing tiles are kept by the container store instead
+        skip_existing = False
+    elif container in ['', 'none', 'directory']:
+        store = None
+    else:
+        raise ValueError('DZI_CONTAINER must be mbtiles or directory')
+
+    checkpoint_interval = int(os.getenv('DZI_CHECKPOINT_SECONDS', '60'))
+    if checkpoint_interval > 0:
+        if not os.path.isdir(dzidirname):
+            os.makedirs(dzidirname)
+        checkpoint_path = '%s/checkpoint.json' % dzidirname
+    else:
+        checkpoint_path = None
+
+    # every power-of-two level, filling in any missing from the CZI pyramid
+    levels = dict([ (scene, pyramid_levels(converters[scene], tilesize)) for scene in scenes ])
+    skipped = sorted(set([
+        zoom for scene in scenes for zoom in converters[scene]._zoom_levels if zoom not in dict(levels[scene])
+    ]))
+    if skipped:
+        sys.stderr.write('Ignoring CZI pyramid tiers at zoom %s between power-of-two levels\n' % skipped)
+
+    if scenes != [ None ]:
+        def ntiles(c):
+            return sum([ K * J for H, W, K, J in [ tile_grid(c, zoom, tilesize) for zoom, stored in pyramid_levels(c, tilesize) ] ])
+        sys.stderr.write('Converting %d scenes separately, %d tiles per channel instead of %d for one canvas\n' % (
+            len(scenes), sum([ ntiles(converters[scene]) for scene in scenes ]), ntiles(converter)
+        ))
+
+    # any setting that changes tile content must invalidate saved progress
+    czistat = os.stat(czifilename)
+    signature = dict(
+        czi_size=czistat.st_size,
+        czi_mtime=czistat.st_mtime,
+        czi_guid=str(converter._fo.header.file_guid),
+        tilesize=tilesize,
+        quality=quality,
+        zooms=converter._zoom_levels,
+        levels=levels[None] if scenes == [ None ] else [ levels[scene] for scene in scenes ],
+        z_mode=z_mode,
+        gamma=gamma,
+        channel_ranges=[ map(str, r) for r in converter._channel_ranges ] if converter._channel_ranges is not None else None,
+        # tiles finished in one output backend are missing from the other
+        container='mbtiles' if store is not None else 'directory',
+    )
+    if scenes != [ None ]:
+        signature['scenes'] = scenes
+    checkpoint = Checkpoint(
+        checkpoint_path,
+        signature,
+        checkpoint_interval,
+        store.commit if store is not None else None
+    )
         
     H, W = converter.canvas_size()
     spp = converter._fo.shape[-1]
     doc = dict(channel=dict(), canvas_size=(W, H), tile_size=(tilesize[1], tilesize[0]), samples_per_pixel=spp, microns_per_pixel=converter.mpps)
 
-    # map zoom levels to DZI zoom tier numbers
-    zooms = list(converter._zoom_levels)
-    zooms.sort(reverse=True)
-    zoom_numbers = dict([ (zooms[i], i) for i in range(len(zooms)) ])
+    # one pyramid per scene and channel, or per scene, channel, and Z plane in planes mode
+    pyramids = []
+    for scene in scenes:
+        if z_mode == 'planes':
+            pyramids.extend([
+                (scene, channel, plane)
+                for channel in range(converters[scene].num_channels()) for plane in converters[scene].planes()
+            ])
+        else:
+            pyramids.extend([ (scene, channel, None) for channel in range(converters[scene].num_channels()) ])
+
+    if scenes != [ None ]:
+        doc['scenes'] = []
+        for scene in scenes:
+            (y0, x0), (y1, x1) = converters[scene].bounding_box()
+            doc['scenes'].append(dict(
+                scene=scene,
+                name=scene_names.get(scene),
+                bounding_box=dict(x=int(x0), y=int(y0), width=int(x1 - x0), height=int(y1 - y0)),
+                channel=[ pyramid for pyramid in range(len(pyramids)) if pyramids[pyramid][0] == scene ],
+            ))
+
+    # plan all tile row bands up front so the pool can work across channels and zooms,
+    # as passes of [tasks, tile rows the tasks will report including synthesized levels]
+    passes = [ [[], 0] ]
+    dzichanneldirnames = dict()
+    # tile rows saved between synthesis passes
+    synthdirname = '%s/synthesis' % dzidirname
     
-    for channel in range(converter.num_channels()):
+    for pyramid, (scene, channel, plane) in enumerate(pyramids):
+        scene_converter = converters[scene]
         cname = converter._channel_names[channel]
         cname_long = converter._channel_names_long[channel]
         color = converter._channel_colors[channel]
-        doc['channel'][channel] = dict(name=cname, zooms=dict(), ntiles=0, cname_long=cname_long, color=color)
+        doc['channel'][pyramid] = dict(name=cname, zooms=dict(), ntiles=0, cname_long=cname_long, color=color)
+
+        # map zoom levels to DZI zoom tier numbers
+        zooms = [ zoom for zoom, stored in levels[scene] ]
+        zooms.sort(reverse=True)
+        zoom_numbers = dict([ (zooms[i], i) for i in range(len(zooms)) ])
+
+        pname = cname
+        if scene is not None:
+            pname = '%s-S%d' % (cname, scene)
+            H, W = scene_converter.canvas_size()
+            doc['channel'][pyramid].update(scene=scene, canvas_size=(W, H))
+            doc['channel'][pyramid]['cname_long'] = cname_long = '%s %s' % (cname_long, scene_names.get(scene, 'S%d' % scene))
 
         if cname == 'Brigh':
             fill = np.array([[[255,255,255]]], dtype=np.uint8)
@@ -467,50 +1984,152 @@ def main(czifilename, dzidirname=None):
             fill = None
             
         # TODO: use channel name or number here...?
-        dzichanneldirname = "%s/%s" % (dzidirname, cname)
+        if plane is not None and z_mode == 'planes':
+            dzichanneldirnames[pyramid] = "%s/%s-Z%d" % (dzidirname, pname, plane)
+            doc['channel'][pyramid]['plane'] = plane
+            doc['channel'][pyramid]['cname_long'] = '%s Z%d' % (cname_long, plane)
+        else:
+            dzichanneldirnames[pyramid] = "%s/%s" % (dzidirname, pname)
 
-        pixel_range = [None, None]
+        # stored levels as [zoom, dzizoomdirname, synthesized levels above it]
+        sources = []
         
-        for zoom in converter._zoom_levels:
-            H, W = map(lambda x: x/zoom, converter.canvas_size())
-            K, J = map(lambda c, t: c/t + (c%t and 1 or 0), (H, W), tilesize)
+        for zoom, stored in levels[scene]:
+            H, W, K, J = tile_grid(scene_converter, zoom, tilesize)
 
-            dzizoomdirname = "%s/%d" % (dzichanneldirname, zoom_numbers[zoom])
+            dzizoomdirname = "%s/%d" % (dzichanneldirnames[pyramid], zoom_numbers[zoom])
             
-            sys.stderr.write('Channel %d zoom %d: Canvas %dx%d using %dx%d output grid of %dx%d q=%d tiles\n' % (
-                channel, zoom, W, H, J, K, tilesize[1], tilesize[0], quality
+            sys.stderr.write('Channel %d%s%s zoom %d: Canvas %dx%d using %dx%d output grid of %dx%d q=%d tiles%s\n' % (
+                channel, (' scene %d' % scene) if scene is not None else '', (' plane %d' % plane) if plane is not None else '',
+                zoom, W, H, J, K, tilesize[1], tilesize[0], quality,
+                '' if stored else ' synthesized'
             ))
             
-            doc['channel'][channel]['zooms'][zoom] = dict(shape=(W, H), tile_grid=(J, K))
-            doc['channel'][channel]['ntiles'] = doc['channel'][channel]['ntiles'] + K * J
-                                                          
-            for k in range(K):
-                for j in range(J):
-                    tile = converter.get_tile_data(
-                        channel, zoom,
-                        (
-                            slice(k*tilesize[0], (k+1)*tilesize[0]),
-                            slice(j*tilesize[1], (j+1)*tilesize[1]),
-                        ),
-                        fill=fill,
-                        range_accum=pixel_range
-                    )
-
-                    if skip_existing and os.access('%s/%d_%d.jpg' % (dzizoomdirname, j, k), os.F_OK):
-                        pass
-                    else:
-                        array_to_jpeg(tile, k, j, dzizoomdirname, quality)
-
-        doc['channel'][channel]['valuerange'] = [ int(v) for v in pixel_range ]
-        metadata_to_xml(doc, channel, dzichanneldirname)
+            if store is None and not os.path.isdir(dzizoomdirname):
+                os.makedirs(dzizoomdirname)
+
+            doc['channel'][pyramid]['zooms'][zoom] = dict(shape=(W, H), tile_grid=(J, K))
+            doc['channel'][pyramid]['ntiles'] = doc['channel'][pyramid]['ntiles'] + K * J
+
+            checkpoint.add_level(pyramid, zoom, K, J)
+
+            if stored:
+                source = [zoom, dzizoomdirname, []]
+                sources.append(source)
+            else:
+                source[2].append((zoom, dzizoomdirname))
+
+        for zoom, dzizoomdirname, synth in sources:
+            if synth:
+                # synthesized rows need every source row of a chunk, so unfinished chunks are redone whole
+                for i, (tasks, nreports) in enumerate(plan_synthesis(
+                        scene_converter, pyramid, scene, channel, plane, zoom, dzizoomdirname, synth, tilesize,
+                        checkpoint, fill, skip_existing, synthdirname)):
+                    if i == len(passes):
+                        passes.append([[], 0])
+                    passes[i][0].extend(tasks)
+                    passes[i][1] += nreports
+                continue
+
+            H, W, K, J = tile_grid(scene_converter, zoom, tilesize)
+            done = checkpoint.done[(pyramid, zoom)]
+
+            # one band per worker keeps most source tile reuse within one tile cache
+            band = max(1, int(math.ceil(float(K) / workers)))
+            for k0 in range(0, K, band):
+                k1 = min(k0 + band, K)
+                # drop tile rows finished before a restart
+                rows = [ k for k in range(k0, k1) if not done[k,:].all() ]
+                if rows:
+                    passes[0][0].append((pyramid, scene, channel, plane, zoom, rows, tilesize, dzizoomdirname, fill, skip_existing, done[rows,:], synth, None, None))
+                    passes[0][1] += len(rows)
+
+    jpeg_threads = int(os.getenv('DZI_JPEG_THREADS', '2'))
+
+    if len(passes) > 1 and not os.path.isdir(synthdirname):
+        os.makedirs(synthdirname)
+
+    if checkpoint.ntiles_done():
+        sys.stderr.write('Resuming with %d tiles already done\n' % checkpoint.ntiles_done())
+
+    stats = dict([ (key, 0) for key in STATS_KEYS ])
+    rendered = [0]
+
+    def row_done(row):
+        pyramid, zoom, k, count, v0, v1, row_stats = row
+        rendered[0] += count
+        checkpoint.row_done(pyramid, zoom, k, v0, v1)
+        for key, v in row_stats.items():
+            stats[key] += v
+
+    serial = passes
+    if workers > 1:
+        sys.stderr.write('Rendering %d tile row bands with %d worker processes\n' % (len(passes[0][0]), workers))
+        render_parallel(
+            workers, _worker_init,
+            (czifilename, converter._channel_ranges, cache_bytes, z_mode, gamma, index_cache, prefetch, quality, jpeg_threads, store is not None),
+            passes[0][0], passes[0][1], store, row_done
+        )
+        # later synthesis passes only reduce saved tile rows, 1/4**SYNTH_PASS_LEVELS of the pixels
+        serial = passes[1:]
+
+    if store is not None:
+        writer = TileWriter(jpeg_threads, quality, store)
+    else:
+        writer = TileWriter(jpeg_threads, quality)
+    try:
+        previous = None
+        for tasks, nreports in serial:
+            for task in tasks:
+                scene_converter = converters[task[1]]
+                if previous is not None and previous is not scene_converter:
+                    # tasks are planned scene by scene, so release the finished scene's tile cache
+                    previous.close()
+                previous = scene_converter
+                render_task(scene_converter, writer, task, row_done)
+    finally:
+        writer.close()
+
+    sys.stderr.write('Rendered %d tiles\n' % rendered[0])
+    sys.stderr.write('Tile cache: %(hits)d hits, %(misses)d misses, %(evictions)d evictions\n' % stats)
+    sys.stderr.write('Tile time: decode %(decode_seconds).1fs, composite %(composite_seconds).1fs, encode %(encode_seconds).1fs, write %(write_seconds).1fs\n' % stats)
+    sys.stderr.write('Source reads: %.1f MB with %d seeks in tile order, %.1f MB/s while decoding\n' % (
+        stats['read_bytes'] / 1048576.0, stats['read_seeks'],
+        stats['read_bytes'] / 1048576.0 / max(stats['decode_seconds'], 1e-6)
+    ))
+    if prefetch:
+        sys.stderr.write('Prefetch: %.1f MB with %d seeks in file order, %d seeks avoided, %.1f MB/s\n' % (
+            stats['prefetch_bytes'] / 1048576.0, stats['prefetch_seeks'],
+            stats['read_seeks'] - stats['prefetch_seeks'],
+            stats['prefetch_bytes'] / 1048576.0 / max(stats['prefetch_seconds'], 1e-6)
+        ))
+    converter.close()
+    for scene_converter in converters.values():
+        scene_converter.close()
+
+    for pyramid in range(len(pyramids)):
+        assert checkpoint.ntiles_done(pyramid) == doc['channel'][pyramid]['ntiles'], (checkpoint.ntiles_done(pyramid), doc['channel'][pyramid]['ntiles'])
+        doc['channel'][pyramid]['valuerange'] = [ int(v) for v in checkpoint.pixel_ranges[pyramid] ]
+        if store is not None:
+            metadata_to_xml(doc, pyramid, dzichanneldirnames[pyramid], store.container(dzichanneldirnames[pyramid]))
+        else:
+            metadata_to_xml(doc, pyramid, dzichanneldirnames[pyramid])
+
+    if store is not None:
+        store.close()
 
     # dump overall info to JSON for now...
     f = open(dzidirname + '/info.json', 'w')
     json.dump(doc, f, indent=2)
+    f.close()
+
+    checkpoint.remove()
+    if os.path.isdir(synthdirname):
+        shutil.rmtree(synthdirname)
 
 def usage(mesg):
     return """%s
-usage: czi2dzi.py czifile [dzidir]
+usage: czi2dzi.py [--workers N] czifile [dzidir]
 
 This command converts one CZI file to one or more DZI pyramids in the
 (optional) DZI target directory.  It creates one pyramid for each
@@ -521,28 +2140,54 @@ pyramid.
 The dzidir destination defaults to a name derived from the CZI
 filename if not specified.
 
+The --workers option renders tiles with N parallel processes
+(default DZI_WORKERS environment variable or 1).
+
+A Z stack is rendered per the CZI_Z_MODE environment variable: first
+(default) or middle for a single plane, planes for one pyramid per
+channel and plane, or max or mean for an intensity projection.
+
+A CZI file with several scenes is rendered as one canvas, or with
+CZI_SCENES=true as separate pyramids per scene, named e.g. DAPI-S1,
+each bounded by its scene.
+
+With DZI_CONTAINER=mbtiles, the tiles of each pyramid are written to
+one SQLite file dzidir/channel.mbtiles instead of one file per tile.
+
 """ % (mesg)
     
 if __name__ == "__main__":
-    if len(sys.argv) <= 1:
+    argv = sys.argv[1:]
+    workers = None
+
+    if '--workers' in argv:
+        i = argv.index('--workers')
+        try:
+            workers = int(argv[i+1])
+            assert workers >= 1
+        except:
+            raise ValueError(usage('The --workers option requires a positive integer.'))
+        argv = argv[0:i] + argv[i+2:]
+
+    if len(argv) < 1:
         raise ValueError(usage('First argument must be a CZI filepath.'))
     
-    if len(sys.argv) > 3:
+    if len(argv) > 2:
         raise ValueError(usage('At most two arguments are expected.'))
     
     try:
-        f = open(sys.argv[1])
+        f = open(argv[0])
         try:
-            fo = czifile.CziFile(sys.argv[1])
+            fo = czifile.CziFile(argv[0])
         except Exception, e:
             raise ValueError(usage('%s. First argument must be a DZI file.' % e))
     except:
         raise ValueError(usage('First argument must be a readable file.'))
 
-    if len(sys.argv) > 2:
-        if os.path.exists(sys.argv[2]):
-            if not os.path.isdir(sys.argv[2]):
+    if len(argv) > 1:
+        if os.path.exists(argv[1]):
+            if not os.path.isdir(argv[1]):
                 raise ValueError(usage('Second argument must be non-existent or an existing directory.'))
         
-    ret = main(*sys.argv[1:])
+    ret = main(*argv, workers=workers)
     sys.exit(ret)
@@ -13,7 +13,7 @@ setup(
     scripts=[
         "czi2dzi.py",
     ],
-    requires=["numpy", "scipy", "tifffile", "czifile"],
+    requires=["numpy", "scipy", "PIL", "tifffile", "czifile"],
     maintainer_email="support@misd.isi.edu",
     license='(new) BSD',
     classifiers=[
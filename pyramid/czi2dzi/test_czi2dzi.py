@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+"""Tests of czi2dzi tile pyramid planning and rendering.
+
+usage: python -m unittest test_czi2dzi
+"""
+
+import os
+import shutil
+import signal
+import tempfile
+import unittest
+
+import numpy as np
+
+import czi2dzi
+
+
+class StubConverter (object):
+    """Converter of a blank canvas with only a full resolution CZI tier.
+
+       Rendering tile row kill_row kills the process and fail_row
+       raises ValueError.  Rendered tiles are listed as (zoom, k, j).
+    """
+
+    def __init__(self, H, W, spp=3, kill_row=None, fail_row=None):
+        self.H, self.W, self.spp = H, W, spp
+        self.kill_row, self.fail_row = kill_row, fail_row
+        self._zoom_levels = [1]
+        self.rendered = []
+
+    def canvas_size(self):
+        return self.H, self.W
+
+    def get_tile_data(self, channelno, zoom, slc, fill=None, range_accum=None, plane=None, tilesize=None, **kwargs):
+        H, W, K, J = czi2dzi.tile_grid(self, zoom, tilesize)
+        if slc[0].start / tilesize[0] == self.kill_row:
+            os.kill(os.getpid(), signal.SIGKILL)
+        if slc[0].start / tilesize[0] == self.fail_row:
+            raise ValueError('cannot render tile row %d' % self.fail_row)
+        self.rendered.append((zoom, slc[0].start / tilesize[0], slc[1].start / tilesize[1]))
+        h = min(slc[0].stop, H) - slc[0].start
+        w = min(slc[1].stop, W) - slc[1].start
+        return np.full((h, w, self.spp), 128, dtype=np.uint8)
+
+    def prefetch_rows(self, channelno, zoom, rows, tilesize, plane=None):
+        pass
+
+    def stats(self):
+        return dict([ (key, 0) for key in czi2dzi.STATS_KEYS if key not in ('encode_seconds', 'write_seconds') ])
+
+
+def stub_worker_init(H, W, kill_row=None, fail_row=None):
+    czi2dzi._worker_converter = StubConverter(H, W, kill_row=kill_row, fail_row=fail_row)
+    czi2dzi._worker_writer = czi2dzi.TileWriter(0, 75, czi2dzi._worker_store)
+
+
+class Timeout (Exception):
+    pass
+
+
+class RenderParallelTest (unittest.TestCase):
+
+    def setUp(self):
+        # a hang fails the test instead of the whole run
+        def timeout(signum, frame):
+            raise Timeout()
+        self._handler = signal.signal(signal.SIGALRM, timeout)
+        signal.alarm(60)
+
+    def tearDown(self):
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, self._handler)
+
+    def render(self, H, W, workers, tilesize=(256, 256), kill_row=None, fail_row=None):
+        H, W, K, J = czi2dzi.tile_grid(StubConverter(H, W), 1, tilesize)
+        tasks = [
+            (0, None, 0, None, 1, [k], tilesize, 'z1', None, False, np.zeros((1, J), dtype=bool), [], None, None)
+            for k in range(K)
+        ]
+        written = dict()
+        rows = []
+
+        def store(jpegname, data):
+            written[jpegname] = data
+
+        czi2dzi.render_parallel(workers, stub_worker_init, (H, W, kill_row, fail_row), tasks, K, store, rows.append)
+        return written, rows
+
+    def test_parallel(self):
+        written, rows = self.render(1100, 600, 2)
+        self.assertEqual(sorted([ row[2] for row in rows ]), range(5))
+        self.assertEqual(sorted(written), sorted([ 'z1/%d_%d.jpg' % (j, k) for k in range(5) for j in range(3) ]))
+        serial, rows = self.render(1100, 600, 1)
+        self.assertEqual(written, serial)
+
+    def test_killed_worker(self):
+        # the lost band must not leave the parent waiting for its rows forever
+        self.assertRaises(RuntimeError, self.render, 1100, 600, 2, kill_row=3)
+
+    def test_failed_worker(self):
+        try:
+            self.render(1100, 600, 2, fail_row=3)
+        except RuntimeError, e:
+            self.assertTrue('cannot render tile row 3' in str(e), str(e))
+        else:
+            self.fail('worker error not raised')
+
+
+class Interrupt (Exception):
+    pass
+
+
+class RenderTaskTest (unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def checkpoint(self, converter, tilesize, path=None):
+        checkpoint = czi2dzi.Checkpoint(path, dict(tilesize=tilesize), interval=0)
+        for zoom, stored in czi2dzi.pyramid_levels(converter, tilesize):
+            H, W, K, J = czi2dzi.tile_grid(converter, zoom, tilesize)
+            checkpoint.add_level(0, zoom, K, J)
+        return checkpoint
+
+    def run_passes(self, converter, checkpoint, tilesize, written, reported, stop=None):
+        """Plan and render all levels serially as main does, raising Interrupt after stop reported rows."""
+        levels = czi2dzi.pyramid_levels(converter, tilesize)
+        self.assertEqual([ stored for zoom, stored in levels ], [True] + [False] * (len(levels) - 1))
+
+        def store(jpegname, data):
+            written[jpegname] = data
+
+        def report(row):
+            pyramid, zoom, k, count, v0, v1, stats = row
+            checkpoint.row_done(pyramid, zoom, k, v0, v1)
+            reported.append((zoom, k))
+            if len(reported) == stop:
+                raise Interrupt()
+
+        synth = [ (zoom, 'z%d' % zoom) for zoom, stored in levels[1:] ]
+        passes = czi2dzi.plan_synthesis(converter, 0, None, 0, None, 1, 'z1', synth, tilesize, checkpoint, workspace=self.workspace)
+        # tile rows a restart counts as done
+        self.planned_done = set([ (zoom, k) for (pyramid, zoom), d in checkpoint.done.items() for k in range(d.shape[0]) if d[k,:].all() ])
+        writer = czi2dzi.TileWriter(0, 75, store)
+        try:
+            for tasks, nreports in passes:
+                for task in tasks:
+                    czi2dzi.render_task(converter, writer, task, report)
+        finally:
+            writer.close()
+        return levels
+
+    def render(self, H, W, tilesize=(512, 512)):
+        converter = StubConverter(H, W)
+        checkpoint = self.checkpoint(converter, tilesize)
+        written = dict()
+        levels = self.run_passes(converter, checkpoint, tilesize, written, [])
+
+        for zoom, stored in levels:
+            H, W, K, J = czi2dzi.tile_grid(converter, zoom, tilesize)
+            self.assertTrue(checkpoint.done[(0, zoom)].all(), zoom)
+            names = sorted([ name for name in written if name.startswith('z%d/' % zoom) ])
+            self.assertEqual(names, sorted([ 'z%d/%d_%d.jpg' % (zoom, j, k) for k in range(K) for j in range(J) ]))
+        return levels
+
+    def test_even_rows(self):
+        self.render(1024, 700)
+        self.render(1536, 700)
+
+    def test_odd_last_child_row(self):
+        # 2*T*n+1 canvas rows: the last child row has a single pixel row
+        # that the parent canvas, with half as many rows rounded down, drops
+        for n in (1, 2, 3):
+            levels = self.render(2 * 512 * n + 1, 700)
+            self.assertEqual(czi2dzi.tile_grid(StubConverter(2 * 512 * n + 1, 700), 1, (512, 512))[2], 2 * n + 1)
+            self.assertEqual(czi2dzi.tile_grid(StubConverter(2 * 512 * n + 1, 700), 2, (512, 512))[2], n)
+
+    def test_synthesis_passes(self):
+        # 20 source tile rows make 5 synthesized levels, more than one pass
+        levels = self.render(1280, 100, (64, 64))
+        self.assertTrue(len(levels) - 1 > czi2dzi.SYNTH_PASS_LEVELS)
+
+    def test_resume(self):
+        tilesize = (64, 64)
+        path = '%s/checkpoint.json' % self.workspace
+        expected = dict()
+        self.run_passes(StubConverter(1280, 100), self.checkpoint(StubConverter(1280, 100), tilesize), tilesize, expected, [])
+
+        # interrupt just after the first chunk of 16 source tile rows and its 15 synthesized rows
+        converter = StubConverter(1280, 100)
+        written = dict()
+        self.assertRaises(
+            Interrupt, self.run_passes, converter, self.checkpoint(converter, tilesize, path), tilesize, written, [], 33
+        )
+        self.assertEqual(sorted(set([ k for zoom, k, j in converter.rendered ])), range(18))
+
+        converter = StubConverter(1280, 100)
+        checkpoint = self.checkpoint(converter, tilesize, path)
+        self.assertTrue(checkpoint.done[(0, 1)][0:18,:].all())
+        reported = []
+        self.run_passes(converter, checkpoint, tilesize, written, reported)
+        # only the unfinished chunk is rendered again, and rows counted as done are not reported again
+        self.assertEqual(sorted(set([ k for zoom, k, j in converter.rendered ])), range(16, 20))
+        self.assertEqual(len(self.planned_done), 31)
+        self.assertEqual(self.planned_done & set(reported), set())
+        self.assertEqual(len(reported), len(set(reported)))
+        self.assertEqual(written, expected)
+        for (pyramid, zoom), d in checkpoint.done.items():
+            self.assertTrue(d.all(), zoom)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""Compare in-memory JPEG-XR decoding to the temporary file path.
+
+usage: benchmark_jxr.py czifile [max_subblocks]
+
+Reads the compressed data of up to max_subblocks (default 200)
+JpegXrFile subblocks from a CZI file, decodes each through a temporary
+file and from memory, checks that the results are identical, and
+reports decoded megapixels and megabytes per second for each path.
+Decoding into a preallocated output array is timed as well.
+"""
+
+import sys
+import time
+
+import czifile
+from czifile import czifile as _module
+
+_czifile = getattr(_module, '_czifile', None)
+
+
+def timed(decode, streams, outs=None):
+    t0 = time.time()
+    if outs is None:
+        results = [ decode(data) for data in streams ]
+    else:
+        results = [ decode(data, out) for data, out in zip(streams, outs) ]
+    return time.time() - t0, results
+
+
+def main(czifilename, max_subblocks=200):
+    if not hasattr(_czifile, 'decode_jxr_bytes'):
+        sys.stderr.write('_czifile extension lacks decode_jxr_bytes\n')
+        return 1
+
+    czi = czifile.CziFile(czifilename)
+    streams = []
+    for entry in czi.filtered_subblock_directory:
+        if entry.compression != 4:
+            continue
+        subblock = entry.data_segment()
+        streams.append(subblock.data(raw=True))
+        if len(streams) >= int(max_subblocks):
+            break
+    czi.close()
+
+    if not streams:
+        sys.stderr.write('no JpegXrFile subblocks in %s\n' % czifilename)
+        return 1
+
+    # warm up the page cache and the decoder before timing
+    _module.decode_jxr_file(streams[0])
+
+    filetime, expected = timed(_module.decode_jxr_file, streams)
+    memtime, found = timed(_czifile.decode_jxr_bytes, streams)
+    outs = [ a.copy() for a in expected ]
+    outtime, _ = timed(_czifile.decode_jxr_bytes, streams, outs)
+
+    for a, b, c in zip(expected, found, outs):
+        assert a.shape == b.shape and a.dtype == b.dtype, (a.shape, b.shape)
+        assert (a == b).all() and (a == c).all()
+
+    pixels = sum([ a.shape[0] * a.shape[1] for a in expected ]) / 1e6
+    nbytes = sum([ a.nbytes for a in expected ]) / float(1024**2)
+    compressed = sum([ len(data) for data in streams ]) / float(1024**2)
+    sys.stdout.write('%d subblocks, %.1f MB compressed, %.1f MB decoded\n' % (len(streams), compressed, nbytes))
+    sys.stdout.write('%-18s %10s %10s %10s %8s\n' % ('path', 'seconds', 'Mpx/s', 'MB/s', 'speedup'))
+    for name, seconds in [('temporary file', filetime), ('memory', memtime), ('memory, out=', outtime)]:
+        sys.stdout.write('%-18s %10.3f %10.1f %10.1f %7.2fx\n' % (
+            name, seconds, pixels / seconds, nbytes / seconds, filetime / seconds
+        ))
+    return 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.stderr.write(__doc__)
+        sys.exit(2)
+    sys.exit(main(*sys.argv[1:]))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""Compare integer-factor resampling to spline interpolation.
+
+usage: benchmark_resample.py [repeat]
+
+Resamples synthetic Gray16 and Bgr24 subblocks of typical CZI tile
+sizes by the power-of-two factors of CZI pyramids, using
+czifile.resample and scipy.ndimage.zoom with bilinear interpolation
+per sample as SubBlockSegment.data did before, and reports the best
+time of repeat runs.
+"""
+
+import sys
+import time
+
+import numpy
+from scipy.ndimage.interpolation import zoom
+
+from czifile.czifile import resample
+
+
+def spline(data, shape, order=1):
+    factors = [float(j) / i for i, j in zip(data.shape, shape)]
+    out = numpy.empty(shape, data.dtype)
+    for i in range(data.shape[-1]):
+        out[..., i] = zoom(data[..., i], zoom=factors[:-1], order=order)
+    return out
+
+
+def best(func, args, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.time()
+        func(*args)
+        times.append(time.time() - t0)
+    return min(times)
+
+
+def main(repeat=3):
+    repeat = int(repeat)
+    rng = numpy.random.RandomState(0)
+    cases = [
+        ('Gray16', numpy.uint16, (1, 1024, 1024, 1)),
+        ('Gray16', numpy.uint16, (1, 1200, 1600, 1)),
+        ('Bgr24', numpy.uint8, (1, 1200, 1600, 3)),
+    ]
+    sys.stdout.write('%-8s %-14s %-8s %12s %12s %8s\n' % (
+        'pixel', 'stored', 'factor', 'spline ms', 'resample ms', 'speedup'))
+    for name, dtype, stored in cases:
+        info = numpy.iinfo(dtype)
+        for factor in (2, 4, 8, 0.5):
+            if factor >= 1:
+                # pyramid subblocks store fewer pixels than they cover
+                source = (1, stored[1] // factor, stored[2] // factor,
+                          stored[3])
+                shape = stored
+            else:
+                source = stored
+                shape = (1, int(stored[1] * factor), int(stored[2] * factor),
+                         stored[3])
+            data = rng.randint(0, info.max, source).astype(dtype)
+            slow = best(spline, (data, shape), repeat)
+            fast = best(resample, (data, shape), repeat)
+            assert resample(data, shape).shape == tuple(shape)
+            sys.stdout.write('%-8s %-14s %-8s %12.2f %12.2f %7.1fx\n' % (
+                name, 'x'.join(str(i) for i in source[1:3]),
+                ('x%i' % factor) if factor >= 1 else ('/%i' % (1 / factor)),
+                slow * 1e3, fast * 1e3, slow / fast))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -111,6 +111,12 @@ cdef extern from "windowsmediaphoto.h":
     ctypedef unsigned char U8
     ctypedef unsigned int U32
 
+    ctypedef struct WMPStream:
+        pass
+
+    cdef ERR CreateWS_Memory(WMPStream**, void*, size_t)
+    cdef ERR CloseWS_Memory(WMPStream**)
+
 
 cdef extern from "guiddef.h":
     ctypedef struct GUID:
@@ -127,7 +133,7 @@ cdef extern from "JXRGlue.h":
     ctypedef struct PKCodecFactory:
         pass
     ctypedef struct PKImageDecode:
-        pass
+        ERR (*Initialize)(PKImageDecode*, WMPStream*)
     ctypedef struct PKImageEncode:
         pass
     ctypedef struct PKFormatConverter:
@@ -139,6 +145,7 @@ cdef extern from "JXRGlue.h":
     cdef ERR PKCreateCodecFactory_Release(PKCodecFactory**)
     cdef ERR PKCodecFactory_CreateFormatConverter(PKFormatConverter**)
     cdef ERR PKCodecFactory_CreateDecoderFromFile(const char*, PKImageDecode**)
+    cdef ERR PKImageDecode_Create_WMP(PKImageDecode**)
     cdef ERR PKImageDecode_GetSize(PKImageDecode*, I32*, I32*)
     cdef ERR PKImageDecode_Release(PKImageDecode**)
     cdef ERR PKImageDecode_GetPixelFormat(PKImageDecode*, PKPixelFormatGUID*)
@@ -146,7 +153,7 @@ cdef extern from "JXRGlue.h":
     cdef ERR PKFormatConverter_Initialize(PKFormatConverter*, PKImageDecode*,
                                           char*, PKPixelFormatGUID)
     cdef ERR PKFormatConverter_Copy(PKFormatConverter*, const PKRect*,
-                                    U8*, U32)
+                                    U8*, U32) nogil
     cdef ERR PKFormatConverter_Convert(PKFormatConverter*, const PKRect*,
                                        U8*, U32)
 
@@ -192,24 +199,76 @@ class WmpError(Exception):
         Exception.__init__(self, msg)
 
 
-def decode_jxr(char* filename):
-    """Return image data from JXR file as numpy array."""
-    # TODO: create decoder from in memory byte stream
-    cdef numpy.ndarray out
+def decode_jxr(char* filename, out=None):
+    """Return image data from JXR file as numpy array.
+
+    If out is provided, decode into it. It must have the shape and dtype
+    of the image and contiguous rows.
+
+    """
+    cdef PKImageDecode* decoder = NULL
+    cdef ERR err
+
+    try:
+        err = PKCodecFactory_CreateDecoderFromFile(filename, &decoder)
+        if err:
+            raise WmpError("PKCodecFactory_CreateDecoderFromFile", err)
+        return _jxr_copy(decoder, out)
+    finally:
+        if decoder != NULL:
+            PKImageDecode_Release(&decoder)
+
+
+def decode_jxr_bytes(data, out=None):
+    """Return image data from in memory JXR stream as numpy array.
+
+    Data may be bytes or any object exposing the buffer interface, e.g.
+    a slice of a memory-mapped file. If out is provided, decode into it.
+    It must have the shape and dtype of the image and contiguous rows.
+
+    """
+    cdef numpy.ndarray buf = numpy.frombuffer(data, numpy.uint8)
+    cdef WMPStream* stream = NULL
     cdef PKImageDecode* decoder = NULL
+    cdef ERR err
+
+    try:
+        err = CreateWS_Memory(&stream, <void*>buf.data, buf.shape[0])
+        if err:
+            raise WmpError("CreateWS_Memory", err)
+
+        err = PKImageDecode_Create_WMP(&decoder)
+        if err:
+            raise WmpError("PKImageDecode_Create_WMP", err)
+
+        # JXRGlue.h declares no PKImageDecode_Initialize_WMP prototype
+        err = decoder.Initialize(decoder, stream)
+        if err:
+            raise WmpError("PKImageDecode_Initialize", err)
+
+        return _jxr_copy(decoder, out)
+
+    finally:
+        # the decoder does not own the stream
+        if decoder != NULL:
+            PKImageDecode_Release(&decoder)
+        if stream != NULL:
+            CloseWS_Memory(&stream)
+
+
+cdef _jxr_copy(PKImageDecode* decoder, out):
+    """Copy pixels from initialized decoder to new or provided array."""
+    cdef numpy.ndarray dst
     cdef PKFormatConverter* converter = NULL
     cdef PKPixelFormatGUID pixel_format
     cdef PKRect rect
     cdef I32 width
     cdef I32 height
     cdef U32 stride
+    cdef U8* buffer
     cdef ERR err
 
     try:
-        err = PKCodecFactory_CreateDecoderFromFile(filename, &decoder)
-        if err:
-            raise WmpError("PKCodecFactory_CreateDecoderFromFile", err)
-
         err = PKCodecFactory_CreateFormatConverter(&converter)
         if err:
             raise WmpError("PKCodecFactory_CreateFormatConverter", err)
@@ -266,26 +325,41 @@ def decode_jxr(char* filename):
         shape = height, width
         if samples > 1:
             shape += samples,
-        out = numpy.empty(shape, dtype)
-
-        stride = out.strides[0]
+        if out is None:
+            dst = numpy.empty(shape, dtype)
+        else:
+            # check the Python object, dst.shape and dst.strides are C arrays
+            if out.shape != shape or out.dtype != numpy.dtype(dtype):
+                raise ValueError("output array must be %s %s, not %s %s" % (
+                    shape, numpy.dtype(dtype), out.shape, out.dtype))
+            if not out.flags.writeable:
+                raise ValueError("output array is not writeable")
+            # rows may be padded but pixels within a row must be packed
+            if (out.strides[0] < 0 or
+                    out.strides[1] != samples * out.itemsize or
+                    (samples > 1 and out.strides[2] != out.itemsize)):
+                raise ValueError("output array rows must be contiguous")
+            dst = out
+
+        stride = dst.strides[0]
+        buffer = <U8*>dst.data
         rect.X = 0
         rect.Y = 0
-        rect.Width = out.shape[1]
-        rect.Height = out.shape[0]
+        rect.Width = width
+        rect.Height = height
 
         # TODO: check alignment issues
-        err = PKFormatConverter_Copy(converter, &rect, <U8*>out.data, stride)
+        # decode without the GIL so subblocks can be decoded in threads
+        with nogil:
+            err = PKFormatConverter_Copy(converter, &rect, buffer, stride)
         if err:
             raise WmpError("PKFormatConverter_Copy", err)
 
-        return out
+        return dst
 
     finally:
         if converter != NULL:
             PKFormatConverter_Release(&converter)
-        if decoder != NULL:
-            PKImageDecode_Release(&decoder)
 
 # jpeglib
 
@@ -103,6 +103,7 @@ from __future__ import division, print_function
 import sys
 import os
 import re
+import itertools
 import uuid
 import struct
 import warnings
@@ -133,7 +134,7 @@ except ImportError:
 
 __version__ = '2015.08.17'
 __docformat__ = 'restructuredtext en'
-__all__ = 'imread', 'CziFile'
+__all__ = 'imread', 'CziFile', 'SubBlockDirectory'
 
 
 def imread(filename, *args, **kwargs):
@@ -169,7 +170,8 @@ class CziFile(object):
 
     """
 
-    def __init__(self, arg, multifile=True, filesize=None, detectmosaic=True):
+    def __init__(self, arg, multifile=True, filesize=None, detectmosaic=True,
+                 memmap=False, indexcache=None):
         """Open CZI file and read header.
 
         Raise ValueError if file is not a ZISRAW file.
@@ -185,6 +187,15 @@ class CziFile(object):
         detectmosaic : bool
             If True (default), mosaic images will be reconstructed from
             SubBlocks with a tile index.
+        memmap : bool
+            If True, the file is memory-mapped and uncompressed SubBlock
+            data are returned as read-only views into the mapped file
+            instead of copies. Ignored if the file has no fileno.
+        indexcache : str or bool
+            Name of a sidecar file caching the SubBlock directory between
+            opens, or True for the CZI file name plus '.index.npz'.
+            The cache is rebuilt if file size, modification time, or GUID
+            changed. Default is no cache.
 
         Notes
         -----
@@ -193,7 +204,8 @@ class CziFile(object):
         'with' statement.
 
         """
-        self._fh = FileHandle(arg, size=filesize)
+        handle = MappedFileHandle if memmap else FileHandle
+        self._fh = handle(arg, size=filesize)
         try:
             if self._fh.read(10) != b'ZISRAWFILE':
                 raise ValueError("not a CZI file")
@@ -206,7 +218,7 @@ class CziFile(object):
             # open master file instead
             self._fh.close()
             name, _ = match_filename(arg)
-            self._fh = FileHandle(name)
+            self._fh = handle(name)
             self.header = Segment(self._fh, 0).data()
             assert(self.header.primary_file_guid == self.header.file_guid)
             assert(self.header.file_part == 0)
@@ -214,6 +226,9 @@ class CziFile(object):
         if self.header.update_pending:
             warnings.warn("file is pending update")
         self._filter_mosaic = detectmosaic
+        if indexcache is True:
+            indexcache = self._fh.path + '.index.npz'
+        self._indexcache = indexcache
 
     def segments(self, kind=None):
         """Return iterator over Segment data of specified kind.
@@ -263,9 +278,28 @@ class CziFile(object):
 
         """
         if self.header.directory_position:
+            if self._indexcache and self._fh.is_file:
+                stat = os.stat(self._fh.path)
+                key = '%i %r %s' % (stat.st_size, stat.st_mtime,
+                                    self.header.file_guid)
+                if os.path.exists(self._indexcache):
+                    try:
+                        entries = SubBlockDirectory.load(
+                            self._indexcache, key, self._fh)
+                        if entries is not None:
+                            return entries
+                    except Exception as e:
+                        warnings.warn("failed to read index cache: %s" % e)
             segment = Segment(self._fh, self.header.directory_position)
             if segment.sid == SubBlockDirectorySegment.SID:
-                return segment.data().entries
+                entries = segment.data().entries
+                if (self._indexcache and self._fh.is_file and
+                        isinstance(entries, SubBlockDirectory)):
+                    try:
+                        entries.save(self._indexcache, key)
+                    except Exception as e:
+                        warnings.warn("failed to write index cache: %s" % e)
+                return entries
         warnings.warn("SubBlockDirectory segment not found")
         return list(segment.directory_entry for segment in
                     self.segments(SubBlockSegment.SID))
@@ -296,6 +330,76 @@ class CziFile(object):
         for entry in self.attachment_directory:
             yield entry.data_segment()
 
+    def thumbnail(self, names=('Thumbnail', 'SlidePreview', 'Label')):
+        """Return first embedded preview image attachment found.
+
+        Return tuple of attachment name, content file type, and data, or
+        None if none of the named attachments exists. Data are the bytes
+        of an embedded image file, e.g. JPG, or a numpy array if the
+        attachment is an embedded CZI file. Image subblocks of this file
+        are not read.
+
+        Parameters
+        ----------
+        names : sequence of str
+            Attachment names in order of preference.
+
+        """
+        entries = {}
+        for entry in self.attachment_directory:
+            entries.setdefault(entry.name, entry)
+        for name in names:
+            entry = entries.get(name)
+            if entry is None:
+                continue
+            segment = entry.data_segment()
+            if CONTENT_FILE_TYPE.get(entry.content_file_type) is CziFile:
+                with segment.data() as czi:
+                    data = czi.asarray(bgr2rgb=True)
+            else:
+                data = segment.data(raw=True)
+            return entry.name, entry.content_file_type, data
+        return None
+
+    def save_thumbnail(self, filename, size=512, quality=90):
+        """Write first embedded preview image to JPEG file.
+
+        Return name of the attachment written, or None if the file has no
+        preview image. Like thumbnail(), only the attachment is read.
+        JPEG attachments that fit in size x size pixels are copied
+        unchanged, others are scaled down. Requires Pillow.
+
+        """
+        found = self.thumbnail()
+        if found is None:
+            return None
+        name, content_file_type, data = found
+
+        from io import BytesIO
+        from PIL import Image
+
+        if isinstance(data, numpy.ndarray):
+            # first YXS plane of an embedded CZI image
+            data = data.reshape((-1, ) + data.shape[-3:])[0]
+            if data.shape[-1] == 1:
+                data = data[..., 0]
+            if data.dtype != numpy.uint8:
+                scale = 255.0 / max(float(data.max()), 1.0)
+                data = (data.astype(numpy.float32) * scale).astype(
+                    numpy.uint8)
+            image = Image.fromarray(data)
+        else:
+            image = Image.open(BytesIO(data))
+            if image.format == 'JPEG' and max(image.size) <= size:
+                with open(filename, 'wb') as fh:
+                    fh.write(data)
+                return name
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        image.thumbnail((size, size), Image.ANTIALIAS)
+        image.save(filename, 'JPEG', quality=quality)
+        return name
+
     def save_attachments(self, directory=None):
         """Save all attachments to files."""
         if directory is None:
@@ -310,6 +414,12 @@ class CziFile(object):
         """Return sorted list of DirectoryEntryDV if mosaic, else all."""
         if not self._filter_mosaic:
             return self.subblock_directory
+        if isinstance(self.subblock_directory, SubBlockDirectory):
+            mosaic_index = self.subblock_directory.mosaic_index
+            if mosaic_index is None:
+                return self.subblock_directory
+            return self.subblock_directory[
+                numpy.argsort(mosaic_index, kind='mergesort')]
         filtered = [directory_entry
                     for directory_entry in self.subblock_directory
                     if directory_entry.mosaic_index is not None]
@@ -320,6 +430,15 @@ class CziFile(object):
     @lazyattr
     def shape(self):
         """Return shape of image data in file."""
+        directory = self.filtered_subblock_directory
+        if isinstance(directory, SubBlockDirectory):
+            index = directory.axes_index
+            records = directory.records
+            shape = numpy.max(records['start'][:, index] +
+                              records['size'][:, index], axis=0)
+            shape = tuple(int(i-j) for i, j in zip(shape, self.start[:-1]))
+            sampleshape = numpy.dtype(directory[0].dtype).shape
+            return shape + (sampleshape if sampleshape else (1,))
         shape = [[dim.start + dim.size
                   for dim in directory_entry.dimension_entries
                   if dim.dimension != b'M']
@@ -334,6 +453,11 @@ class CziFile(object):
     @lazyattr
     def start(self):
         """Return minimum start indices per dimension of sub images in file."""
+        directory = self.filtered_subblock_directory
+        if isinstance(directory, SubBlockDirectory):
+            start = directory.records['start'][:, directory.axes_index]
+            start = numpy.min(start, axis=0)
+            return tuple(start) + (0,)
         start = [[dim.start
                   for dim in directory_entry.dimension_entries
                   if dim.dimension != b'M']
@@ -351,11 +475,18 @@ class CziFile(object):
         """Return dtype of image data in file."""
         # subblock data can be of different pixel type
         dtype = self.filtered_subblock_directory[0].dtype[-2:]
+        if isinstance(self.filtered_subblock_directory, SubBlockDirectory):
+            for pixel_type in numpy.unique(
+                    self.filtered_subblock_directory.records['pixel_type']):
+                dtype = numpy.promote_types(
+                    dtype, PIXEL_TYPE[int(pixel_type)][-2:])
+            return dtype
         for directory_entry in self.filtered_subblock_directory:
             dtype = numpy.promote_types(dtype, directory_entry.dtype[-2:])
         return dtype
 
-    def asarray(self, bgr2rgb=False, resize=True, order=1, memmap=False):
+    def asarray(self, bgr2rgb=False, resize=True, order=1, memmap=False,
+                out=None, maxworkers=1):
         """Return image data from file(s) as numpy array.
 
         Parameters
@@ -366,29 +497,227 @@ class CziFile(object):
             If True (default), resize sub/supersampled subblock data.
         order : int
             The order of spline interpolation used to resize sub/supersampled
-            subblock data. Default is 1 (bilinear).
+            subblock data by non-integer factors. Default is 1 (bilinear).
+            Integer factors are resampled by pixel repetition or block
+            averaging.
         memmap : bool
             If True, return an array stored in a binary file on disk.
+        out : numpy.ndarray, str, or file
+            Where to copy the image data, as in create_output(), e.g. the
+            name of a file to memory-map, which persists after the CziFile
+            is closed. Pixels not covered by subblocks are left unchanged
+            in existing arrays. Overrides memmap.
+        maxworkers : int
+            Number of threads decoding subblocks. Default is 1.
+            Subblocks are read and copied into the output in file order,
+            a few per thread at a time, and subblocks of pyramid levels
+            are upsampled into the output in bands, so memory use besides
+            the output array is bounded by the size of a few stored
+            subblocks.
 
         """
-        if memmap:
+        if out is not None:
+            image = create_output(out, self.shape, self.dtype)
+        elif memmap:
             with tempfile.NamedTemporaryFile() as fh:
                 image = numpy.memmap(fh, dtype=self.dtype, shape=self.shape)
         else:
             image = numpy.zeros(self.shape, self.dtype)
 
-        for directory_entry in self.filtered_subblock_directory:
-            subblock = directory_entry.data_segment()
-            tile = subblock.data(bgr2rgb=bgr2rgb, resize=resize, order=order)
-            index = [slice(i-j, i-j+k) for i, j, k in
-                     zip(directory_entry.start, self.start, tile.shape)]
-            try:
-                image[index] = tile
-            except ValueError as e:
-                warnings.warn(str(e))
+        def decode(args):
+            subblock, data = args
+            return subblock.decode(data, bgr2rgb=bgr2rgb, resize=False)
+
+        directory = self.filtered_subblock_directory
+        batch = 4 * maxworkers if maxworkers > 1 else 1
+        for first in range(0, len(directory), batch):
+            entries = directory[first:first+batch]
+            # read stored data serially, the file handle is not thread safe
+            subblocks = [entry.data_segment() for entry in entries]
+            stored = [subblock.stored() for subblock in subblocks]
+            if len(subblocks) > 1:
+                tiles = self._decode_pool(maxworkers).imap(
+                    decode, zip(subblocks, stored))
+            else:
+                tiles = (decode(args) for args in zip(subblocks, stored))
+            for directory_entry, tile in zip(entries, tiles):
+                shape = directory_entry.shape if resize else tile.shape
+                index = tuple(slice(i-j, i-j+k) for i, j, k in
+                              zip(directory_entry.start, self.start, shape))
+                try:
+                    target = image[index]
+                    if target.shape != tuple(shape):
+                        raise ValueError(
+                            "subblock of shape %s at %s exceeds image" % (
+                                tuple(shape), directory_entry.start))
+                    resample_into(target, tile, order)
+                except ValueError as e:
+                    warnings.warn(str(e))
         return image
 
+    def read_region(self, bbox, zoom=1, channel=0, z=0, out=None, fill=0,
+                    bgr2rgb=False, maxworkers=1):
+        """Return image data of one YX region and pyramid level.
+
+        Only subblocks of the pyramid level that intersect the region
+        are read and decoded. Decoding may run in a thread pool, while
+        subblocks are composited into the output in file order.
+
+        Parameters
+        ----------
+        bbox : tuple of int
+            Region (y0, x0, y1, x1) in full resolution pixel coordinates
+            relative to the start of the image, as in asarray(). The
+            region may extend beyond the image.
+        zoom : int
+            Downsampling factor of the pyramid level to read. Default is
+            1 (full resolution). The output has (y1-y0)//zoom rows and
+            (x1-x0)//zoom columns.
+        channel, z : int
+            Index of channel and focal plane relative to the start of
+            the C and Z dimensions. Ignored if the dimension is absent.
+            Other dimensions except scenes are read at their first index.
+        out : numpy.ndarray
+            Array of shape (rows, columns, samples) to composite into.
+            By default, a new array of the image dtype is returned.
+        fill : number or None
+            Value of output pixels not covered by any subblock. If None,
+            these pixels of out are left unchanged.
+        bgr2rgb : bool
+            If True, exchange red and blue samples if applicable.
+        maxworkers : int
+            Number of threads decoding subblocks. Default is 1.
+
+        """
+        zoom = int(zoom)
+        if zoom < 1:
+            raise ValueError("invalid zoom %i" % zoom)
+        y0, x0, y1, x1 = [int(i) for i in bbox]
+        if y1 <= y0 or x1 <= x0:
+            raise ValueError("empty region %s" % (bbox, ))
+        iy = self.axes.index(b'Y')
+        ix = self.axes.index(b'X')
+        origin = numpy.array([(self.start[iy] + y0) // zoom,
+                              (self.start[ix] + x0) // zoom], numpy.int64)
+        shape = ((y1 - y0) // zoom, (x1 - x0) // zoom, self.shape[-1])
+        if out is None:
+            out = numpy.empty(shape, self.dtype)
+            if fill is None:
+                fill = 0
+        elif out.shape != shape:
+            raise ValueError("out shape %s does not match region %s" % (
+                out.shape, shape))
+        if fill is not None:
+            out[:] = fill
+
+        entries, bboxes = self._region_index(zoom, channel, z)
+        region = numpy.concatenate([origin, origin + shape[:2]])
+        selected = numpy.nonzero(
+            (bboxes[:, 0] < region[2]) & (bboxes[:, 2] > region[0]) &
+            (bboxes[:, 1] < region[3]) & (bboxes[:, 3] > region[1]))[0]
+        if not len(selected):
+            return out
+
+        # read stored data serially, the file handle is not thread safe
+        subblocks = [entries[int(i)].data_segment() for i in selected]
+        stored = [subblock.stored() for subblock in subblocks]
+
+        def decode(args):
+            subblock, data = args
+            data = subblock.decode(data, bgr2rgb=bgr2rgb, resize=False)
+            return data.reshape(data.shape[iy], data.shape[ix], -1)
+
+        if maxworkers > 1 and len(subblocks) > 1:
+            tiles = self._decode_pool(maxworkers).imap(
+                decode, zip(subblocks, stored))
+        else:
+            tiles = (decode(args) for args in zip(subblocks, stored))
+
+        for i, tile in zip(selected, tiles):
+            # overlap of subblock and region in reduced pixel coordinates
+            v0 = numpy.maximum(bboxes[i, 0:2], region[0:2])
+            v1 = numpy.minimum(bboxes[i, 0:2] + tile.shape[0:2],
+                               region[2:4])
+            if numpy.any(v1 <= v0):
+                continue
+            src = v0 - bboxes[i, 0:2], v1 - bboxes[i, 0:2]
+            dst = v0 - region[0:2], v1 - region[0:2]
+            out[dst[0][0]:dst[1][0], dst[0][1]:dst[1][1]] = tile[
+                src[0][0]:src[1][0], src[0][1]:src[1][1]]
+        return out
+
+    def _region_index(self, zoom, channel, z):
+        """Return subblocks of one pyramid level, channel, and focal plane.
+
+        Return a sequence of directory entries in file order and an
+        array of their bounding boxes (y0, x0, y1, x1) in pixel
+        coordinates of the pyramid level. Results are cached.
+
+        """
+        key = zoom, channel, z
+        cache = self.__dict__.setdefault('_region_indices', {})
+        if key in cache:
+            return cache[key]
+        directory = self.filtered_subblock_directory
+        axes = self.axes
+        selected = {}
+        for i in range(len(axes)):
+            ax = axes[i:i+1]
+            if ax in (b'Y', b'X', b'0', b'S'):
+                continue
+            index = {b'C': channel, b'Z': z}.get(ax, 0)
+            selected[i] = self.start[i] + index
+        iy = axes.index(b'Y')
+        ix = axes.index(b'X')
+
+        if isinstance(directory, SubBlockDirectory):
+            axes_index = directory.axes_index
+            records = directory.records
+            start = records['start'][:, axes_index]
+            size = records['size'][:, axes_index]
+            stored_size = records['stored_size'][:, axes_index]
+        else:
+            start = numpy.array([entry.start for entry in directory],
+                                numpy.int64).reshape(-1, len(axes))
+            size = numpy.array([entry.shape for entry in directory],
+                               numpy.int64).reshape(-1, len(axes))
+            stored_size = numpy.array(
+                [entry.stored_shape for entry in directory],
+                numpy.int64).reshape(-1, len(axes))
+        stored_size = numpy.maximum(stored_size, 1)
+        mask = ((size[:, iy] // stored_size[:, iy] == zoom) &
+                (size[:, ix] // stored_size[:, ix] == zoom))
+        for i, value in selected.items():
+            mask &= start[:, i] == value
+        indices = numpy.nonzero(mask)[0]
+
+        bboxes = numpy.empty((len(indices), 4), numpy.int64)
+        bboxes[:, 0] = start[indices, iy] // zoom
+        bboxes[:, 1] = start[indices, ix] // zoom
+        bboxes[:, 2] = bboxes[:, 0] + stored_size[indices, iy]
+        bboxes[:, 3] = bboxes[:, 1] + stored_size[indices, ix]
+        if isinstance(directory, SubBlockDirectory):
+            entries = directory[indices]
+        else:
+            entries = [directory[i] for i in indices]
+        cache[key] = entries, bboxes
+        return entries, bboxes
+
+    def _decode_pool(self, maxworkers):
+        """Return thread pool of maxworkers threads, reused between calls."""
+        workers, pool = self.__dict__.get('_decodepool', (0, None))
+        if workers != maxworkers:
+            if pool is not None:
+                pool.close()
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(maxworkers)
+            self._decodepool = maxworkers, pool
+        return pool
+
     def close(self):
+        workers, pool = self.__dict__.pop('_decodepool', (0, None))
+        if pool is not None:
+            pool.close()
         self._fh.close()
 
     def __enter__(self):
@@ -409,6 +738,30 @@ class CziFile(object):
             str(etree.tostring(self.metadata))))
 
 
+class MappedFileHandle(FileHandle):
+    """FileHandle with a read-only memory map of the whole file.
+
+    Attributes
+    ----------
+    memmap : numpy.memmap or None
+        Bytes of the file, or None if the file can not be memory-mapped.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        FileHandle.__init__(self, *args, **kwargs)
+        if self.is_file and self.size:
+            pos = self.tell()
+            self.memmap = self.memmap_array(numpy.uint8, (self.size, ))
+            self.seek(pos)
+        else:
+            self.memmap = None
+
+    def close(self):
+        self.memmap = None
+        FileHandle.close(self)
+
+
 class Segment(object):
     """ZISRAW Segment."""
 
@@ -544,54 +897,68 @@ class SubBlockSegment(object):
         return unicode(self._fh.read(self.metadata_size), 'utf-8')
 
     def data(self, raw=False, bgr2rgb=True, resize=True, order=1):
-        """Read image data from file and return as numpy array."""
-        self._fh.seek(self.data_offset)
+        """Read image data from file and return as numpy array.
+
+        If the file was opened with memmap=True, uncompressed data are
+        returned as a read-only view into the memory-mapped file unless
+        resizing or exchanging red and blue samples requires a copy.
+
+        """
         if raw:
+            self._fh.seek(self.data_offset)
             return self._fh.read(self.data_size)
-        elif self.compression:
+        return self.decode(self.stored(), bgr2rgb, resize, order)
+
+    def stored(self):
+        """Read stored, possibly compressed, data from file.
+
+        Return a read-only uint8 view into the memory-mapped file if
+        possible, else bytes if compressed, else a numpy array of the
+        pixel type.
+
+        """
+        filemap = getattr(self._fh, 'memmap', None)
+        if filemap is not None and self.compression in (0, 4):
+            # uncompressed or JXR data are read without copying
+            return numpy.frombuffer(filemap, numpy.uint8, self.data_size,
+                                    self.data_offset)
+        self._fh.seek(self.data_offset)
+        if self.compression:
+            return self._fh.read(self.data_size)
+        dtype = numpy.dtype(self.dtype)
+        return self._fh.read_array(dtype, self.data_size // dtype.itemsize)
+
+    def decode(self, data, bgr2rgb=True, resize=True, order=1):
+        """Return image data as numpy array from result of stored().
+
+        Does not access the file, so subblocks can be decoded in
+        parallel threads once their stored data were read.
+
+        """
+        if self.compression:
             if self.compression not in DECOMPRESS:
                 raise ValueError("compression unknown or not supported")
             # TODO: test this
-            data = self._fh.read(self.data_size)
             data = DECOMPRESS[self.compression](data)
             if self.compression == 2:
                 # LZW
                 data = numpy.fromstring(data, self.dtype)
         else:
             dtype = numpy.dtype(self.dtype)
-            data = self._fh.read_array(dtype, self.data_size // dtype.itemsize)
+            if data.dtype != dtype:
+                # view into memory-mapped file
+                data = numpy.frombuffer(data, dtype,
+                                        self.data_size // dtype.itemsize)
 
         data = data.reshape(self.stored_shape)
-        if self.stored_shape == self.shape or not resize:
-            if bgr2rgb and self.stored_shape[-1] in (3, 4):
-                tmp = data[..., 0].copy()
-                data[..., 0] = data[..., 2]
-                data[..., 2] = tmp
-            return data
-
-        # sub / supersampling
-        factors = [j / i for i, j in zip(self.stored_shape, self.shape)]
-        factors = [(1.0 if abs(1.0-f) < 0.0001 else f) for f in factors]
-        shape = list(self.stored_shape)
-        # remove leading dimensions with factor 1.0 for speed
-        for factor in factors:
-            if factor != 1.0:
-                break
-            shape = shape[1:]
-            factors = factors[1:]
-        data.shape = shape
-        # resize RGB components separately for speed
-        if shape[-1] in (3, 4) and factors[-1] == 1.0:
-            factors = factors[:-1]
-            old = data
-            data = numpy.empty(self.shape, self.dtype[-2:])
-            for i in range(shape[-1]):
-                j = {0: 2, 1: 1, 2: 0, 3: 3}[i] if bgr2rgb else i
-                data[..., i] = zoom(old[..., j], zoom=factors, order=order)
-        else:
-            data = zoom(data, zoom=factors, order=order)
-
-        data.shape = self.shape
+        if resize and self.stored_shape != self.shape:
+            data = resample(data, self.shape, order)
+        if bgr2rgb and self.stored_shape[-1] in (3, 4):
+            if not data.flags.writeable:
+                data = data.copy()
+            tmp = data[..., 0].copy()
+            data[..., 0] = data[..., 2]
+            data[..., 2] = tmp
         return data
 
     def attachments(self):
@@ -648,6 +1015,45 @@ class DirectoryEntryDV(object):
             [DimensionEntryDV1(fh) for _ in range(dimensions_count)]))
         self._fh = fh
 
+    @classmethod
+    def fromrecord(cls, record, dimensions, fh):
+        """Return DirectoryEntryDV from SubBlockDirectory record."""
+        self = cls.__new__(cls)
+        self.file_position = int(record['file_position'])
+        self.file_part = 0
+        self.compression = int(record['compression'])
+        self.pyramid_type = int(record['pyramid_type'])
+        self.dtype = PIXEL_TYPE[int(record['pixel_type'])]
+        self._record = record
+        self._dimensions = dimensions
+        self._fh = fh
+        # shortcut lazy attributes, leaving dimension_entries lazy
+        sampleshape = numpy.dtype(self.dtype).shape or (1, )
+        index = [i for i, d in enumerate(dimensions) if d != b'M']
+        start = record['start'].tolist()
+        self.axes = b''.join(dimensions[i] for i in index) + b'0'
+        self.start = tuple(start[i] for i in index) + (0, )
+        self.shape = tuple(record['size'][index].tolist()) + sampleshape
+        self.stored_shape = (tuple(record['stored_size'][index].tolist()) +
+                             sampleshape)
+        self.mosaic_index = (start[dimensions.index(b'M')]
+                             if b'M' in dimensions else None)
+        return self
+
+    @lazyattr
+    def dimension_entries(self):
+        record = self._record
+        entries = []
+        for i, name in enumerate(self._dimensions):
+            dim = DimensionEntryDV1.__new__(DimensionEntryDV1)
+            dim.dimension = name
+            dim.start = int(record['start'][i])
+            dim.size = int(record['size'][i])
+            dim.start_coordinate = float(record['start_coordinate'][i])
+            dim.stored_size = int(record['stored_size'][i])
+            entries.append(dim)
+        return entries
+
     @lazyattr
     def storage_size(self):
         return 32 + len(self.dimension_entries) * 20
@@ -720,10 +1126,145 @@ class DimensionEntryDV1(object):
             self.start_coordinate, self.stored_size)
 
 
+class SubBlockDirectory(object):
+    """SubBlock directory entries stored in a numpy structured array.
+
+    Used when all entries are DirectoryEntryDV with the same dimensions,
+    which allows vectorized filtering without creating Python objects per
+    entry. Indexing with an integer returns a DirectoryEntryDV, indexing
+    with a slice, boolean mask, or index array returns a SubBlockDirectory.
+
+    Attributes
+    ----------
+    dimensions : tuple of bytes
+        Dimension names in C order, including b'M'.
+    records : numpy.ndarray
+        One record per entry with fields file_position, compression,
+        pixel_type, pyramid_type, and per dimension start, size,
+        stored_size, and start_coordinate.
+
+    """
+    __slots__ = 'dimensions', 'records', '_fh'
+
+    @staticmethod
+    def dtype(ndim):
+        """Return structured dtype of records with ndim dimensions."""
+        return numpy.dtype([
+            ('file_position', '<i8'), ('compression', '<i4'),
+            ('pixel_type', '<i4'), ('pyramid_type', 'u1'),
+            ('start', '<i4', (ndim, )), ('size', '<i4', (ndim, )),
+            ('stored_size', '<i4', (ndim, )),
+            ('start_coordinate', '<f4', (ndim, ))])
+
+    @classmethod
+    def fromfile(cls, fh, entry_count):
+        """Read entry_count DirectoryEntryDV from file.
+
+        Return None if entries differ in their dimensions.
+
+        """
+        fpos = fh.tell()
+        ndim = struct.unpack('<28xi', fh.read(32))[0]
+        fh.seek(fpos)
+        dtype = numpy.dtype([
+            ('schema_type', 'S2'), ('pixel_type', '<i4'),
+            ('file_position', '<i8'), ('file_part', '<i4'),
+            ('compression', '<i4'), ('pyramid_type', 'u1'),
+            ('reserved', 'V5'), ('dimensions_count', '<i4'),
+            ('dimension_entries', [
+                ('dimension', 'S4'), ('start', '<i4'), ('size', '<i4'),
+                ('start_coordinate', '<f4'), ('stored_size', '<i4')],
+             (ndim, ))])
+        data = fh.read(entry_count * dtype.itemsize)
+        if len(data) != entry_count * dtype.itemsize:
+            return None
+        raw = numpy.frombuffer(data, dtype)
+        if entry_count and (
+                numpy.any(raw['schema_type'] != b'DV') or
+                numpy.any(raw['dimensions_count'] != ndim) or
+                numpy.any(raw['dimension_entries']['dimension'] !=
+                          raw['dimension_entries']['dimension'][0])):
+            return None
+        dims = raw['dimension_entries'][:, ::-1]
+        records = numpy.empty(entry_count, cls.dtype(ndim))
+        for name in ('file_position', 'compression', 'pixel_type',
+                     'pyramid_type'):
+            records[name] = raw[name]
+        for name in ('start', 'size', 'start_coordinate'):
+            records[name] = dims[name]
+        records['stored_size'] = numpy.where(
+            dims['stored_size'] != 0, dims['stored_size'], dims['size'])
+        if entry_count:
+            dimensions = tuple(stripnull(d) for d in dims['dimension'][0])
+        else:
+            dimensions = ()
+        return cls(dimensions, records, fh)
+
+    def __init__(self, dimensions, records, fh):
+        self.dimensions = dimensions
+        self.records = records
+        self._fh = fh
+
+    @property
+    def axes(self):
+        """Return axes of entries as in DirectoryEntryDV.axes."""
+        return b''.join(d for d in self.dimensions if d != b'M') + b'0'
+
+    @property
+    def axes_index(self):
+        """Return indices of dimensions other than b'M'."""
+        return [i for i, d in enumerate(self.dimensions) if d != b'M']
+
+    def column(self, field, dimension):
+        """Return field values of all entries for one dimension."""
+        return self.records[field][:, self.dimensions.index(dimension)]
+
+    @property
+    def mosaic_index(self):
+        """Return array of mosaic indices or None if there is no M axis."""
+        if b'M' in self.dimensions:
+            return self.column('start', b'M')
+
+    def save(self, filename, key):
+        """Save records to a numpy .npz index file tagged with key string."""
+        with open(filename, 'wb') as fh:
+            numpy.savez(fh, records=self.records,
+                        dimensions=numpy.array(self.dimensions, 'S4'),
+                        key=numpy.array(key))
+
+    @classmethod
+    def load(cls, filename, key, fh):
+        """Return SubBlockDirectory from index file or None if stale."""
+        with numpy.load(filename) as npz:
+            if str(npz['key']) != key:
+                return None
+            dimensions = tuple(stripnull(d) for d in npz['dimensions'])
+            return cls(dimensions, npz['records'], fh)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, numpy.integer)):
+            return DirectoryEntryDV.fromrecord(self.records[key],
+                                               self.dimensions, self._fh)
+        return SubBlockDirectory(self.dimensions, self.records[key], self._fh)
+
+    def __iter__(self):
+        for i in range(len(self.records)):
+            yield self[i]
+
+    def __str__(self):
+        return "SubBlockDirectory %s %i entries" % (
+            b''.join(self.dimensions), len(self.records))
+
+
 class SubBlockDirectorySegment(object):
     """ZISRAWDIRECTORY segment data.
 
     Contains entries of any kind, currently only DirectoryEntryDV.
+    Entries are a SubBlockDirectory if they share their dimensions,
+    else a tuple of DirectoryEntryDV.
 
     """
     __slots__ = 'entries',
@@ -741,7 +1282,12 @@ class SubBlockDirectorySegment(object):
     def __init__(self, fh):
         entry_count = struct.unpack('<i', fh.read(4))[0]
         fh.seek(124, 1)  # reserved
-        self.entries = tuple(DirectoryEntryDV(fh) for _ in range(entry_count))
+        fpos = fh.tell()
+        self.entries = SubBlockDirectory.fromfile(fh, entry_count)
+        if self.entries is None:
+            fh.seek(fpos)
+            self.entries = tuple(DirectoryEntryDV(fh)
+                                 for _ in range(entry_count))
 
     def __len__(self):
         return len(self.entries)
@@ -793,6 +1339,10 @@ class AttachmentSegment(object):
         """
         self._fh.seek(self.data_offset)
         cotype = self.attachment_entry.content_file_type
+        if not raw and CONTENT_FILE_TYPE.get(cotype) is CziFile:
+            # embedded file offsets are relative to the attachment data
+            return CziFile(FileHandle(self._fh, offset=self.data_offset,
+                                      size=self.data_size))
         if not raw and cotype in CONTENT_FILE_TYPE:
             return CONTENT_FILE_TYPE[cotype](self._fh, filesize=self.data_size)
         else:
@@ -1085,7 +1635,163 @@ def match_filename(filename):
     return name, part
 
 
-def decode_jxr(data):
+def create_output(out, shape, dtype):
+    """Return numpy array where image data of shape and dtype can be copied.
+
+    The 'out' parameter may have the following values or types:
+
+    None
+        A new array of shape and dtype filled with zeros is created.
+    numpy.ndarray
+        An existing writable array of shape and a dtype that dtype can
+        be cast to. The same array is returned after verification.
+    str or open file
+        The file name or file object used to create a memory-map to an
+        array stored in a binary file on disk. File names ending in
+        '.npy' are created with a numpy .npy header, so the array can be
+        reopened with numpy.load(filename, mmap_mode='r').
+
+    """
+    if out is None:
+        return numpy.zeros(shape, dtype)
+    if isinstance(out, numpy.ndarray):
+        if out.shape != tuple(shape):
+            raise ValueError("out shape %s does not match %s" % (
+                out.shape, tuple(shape)))
+        if not numpy.can_cast(dtype, out.dtype):
+            raise ValueError("can not cast %s to out dtype %s" % (
+                numpy.dtype(dtype), out.dtype))
+        if not out.flags.writeable:
+            raise ValueError("out array is not writeable")
+        return out
+    if isinstance(out, basestring) and out.endswith('.npy'):
+        return numpy.lib.format.open_memmap(out, mode='w+', dtype=dtype,
+                                            shape=tuple(shape))
+    return numpy.memmap(out, dtype=dtype, mode='w+', shape=tuple(shape))
+
+
+def resample(data, shape, order=1):
+    """Return array resampled to shape.
+
+    Dimensions with integer factors are upsampled by repeating pixels
+    and downsampled by averaging blocks of pixels, which is exact for
+    CZI pyramid levels and much faster than interpolation. Dimensions
+    with other factors are resized by spline interpolation of order.
+
+    """
+    shape = tuple(int(i) for i in shape)
+    if len(shape) != data.ndim:
+        raise ValueError("can not resample %s to %s" % (data.shape, shape))
+    up = {}
+    down = {}
+    factors = []
+    for i, (n, m) in enumerate(zip(data.shape, shape)):
+        if n == m:
+            factors.append(1.0)
+        elif m > n and m % n == 0:
+            up[i] = m // n
+            factors.append(1.0)
+        elif n > m and m and n % m == 0:
+            down[i] = n // m
+            factors.append(1.0)
+        else:
+            factors.append(m / n)
+
+    if down:
+        # average blocks by summing strided views, one per block offset
+        count = 1
+        for k in down.values():
+            count *= k
+        if data.dtype.kind == 'u' and data.itemsize <= 2 and count <= 65536:
+            dtype = numpy.uint32
+        elif data.dtype.kind in 'ui':
+            dtype = numpy.int64
+        else:
+            dtype = numpy.float64
+        total = numpy.zeros([m if i in down else n for i, (n, m) in
+                             enumerate(zip(data.shape, shape))], dtype)
+        for offset in itertools.product(*[range(down.get(i, 1))
+                                          for i in range(data.ndim)]):
+            total += data[tuple(slice(j, None, down[i]) if i in down
+                                else slice(None)
+                                for i, j in enumerate(offset))]
+        if data.dtype.kind in 'ui':
+            data = ((total + count // 2) // count).astype(data.dtype)
+        else:
+            data = (total / count).astype(data.dtype)
+
+    if up:
+        # repeat pixels by broadcasting a new axis after each dimension
+        index = []
+        broadcast = []
+        for i, n in enumerate(data.shape):
+            index.append(slice(None))
+            broadcast.append(n)
+            if i in up:
+                index.append(None)
+                broadcast.append(up[i])
+        upshape = [n * up.get(i, 1) for i, n in enumerate(data.shape)]
+        data = numpy.broadcast_to(data[tuple(index)], broadcast)
+        data = data.reshape(upshape)
+
+    if any(f != 1.0 for f in factors):
+        if data.shape[-1] > 1 and factors[-1] == 1.0:
+            # resize samples separately for speed
+            out = numpy.empty(shape, data.dtype)
+            for i in range(data.shape[-1]):
+                out[..., i] = zoom(data[..., i], zoom=factors[:-1],
+                                   order=order)
+            data = out
+        else:
+            data = zoom(data, zoom=factors, order=order)
+    return data
+
+
+def resample_into(out, data, order=1, maxbytes=2**24):
+    """Copy data resampled to the shape of out array into out.
+
+    Data resampled by integer factors are processed in bands along their
+    first dimension longer than 1, so no temporary array larger than
+    about maxbytes is created for subblocks of coarse pyramid levels
+    covering a large area. The result is the same as resample().
+
+    """
+    if data.shape == out.shape:
+        out[...] = data
+        return
+    axis = [i for i, n in enumerate(data.shape) if n > 1]
+    integer = all(n == m or (m > n and m % n == 0) or
+                  (n > m and m and n % m == 0)
+                  for n, m in zip(data.shape, out.shape))
+    if (not axis or not integer or len(data.shape) != len(out.shape) or
+            out.shape[axis[0]] % data.shape[axis[0]]):
+        out[...] = resample(data, out.shape, order)
+        return
+    axis = axis[0]
+    factor = out.shape[axis] // data.shape[axis]
+    rowbytes = out.itemsize * factor * int(numpy.prod(out.shape[axis+1:]))
+    step = max(1, maxbytes // max(rowbytes, 1))
+    for i in range(0, data.shape[axis], step):
+        j = min(i + step, data.shape[axis])
+        band = out[(slice(None), ) * axis + (slice(i*factor, j*factor), )]
+        band[...] = resample(data[(slice(None), ) * axis + (slice(i, j), )],
+                             band.shape, order)
+
+
+def decode_jxr(data, out=None):
+    """Decode JXR data stream into ndarray.
+
+    Data may be bytes or a buffer, e.g. a slice of a memory-mapped file.
+    If out is provided, decode into it.  The stream is decoded in memory
+    if the _czifile extension supports it, else via a temporary file.
+
+    """
+    if hasattr(_czifile, 'decode_jxr_bytes'):
+        return _czifile.decode_jxr_bytes(data, out)
+    return decode_jxr_file(data, out)
+
+
+def decode_jxr_file(data, out=None):
     """Decode JXR data stream into ndarray via temporary file."""
     fd, filename = tempfile.mkstemp(suffix='.jxr')
     with os.fdopen(fd, 'wb') as fh:
@@ -1093,7 +1799,10 @@ def decode_jxr(data):
     if isinstance(filename, unicode):
         filename = filename.encode('ascii')
     try:
-        out = _czifile.decode_jxr(filename)
+        if out is None:
+            out = _czifile.decode_jxr(filename)
+        else:
+            out[...] = _czifile.decode_jxr(filename)
     finally:
         os.remove(filename)
     return out
@@ -2,6 +2,7 @@
 import sys
 import os
 from distutils.core import setup, Extension
+import numpy
 from Cython.Distutils import build_ext
 from czifile.czifile import __version__ as version
 from czifile.czifile import __doc__ as long_description
@@ -12,6 +13,7 @@ include_dirs += [
     os.path.join(jxrlib_dir, *d.split('/'))
     for d in ('jxrgluelib', 'common/include', 'image/sys')
 ]
+include_dirs.append(numpy.get_include())
 define_macros = [('INITGUID', None)]
 ext = Extension(
     'czifile._czifile',
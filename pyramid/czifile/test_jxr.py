@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""Tests of in-memory JPEG-XR decoding against the temporary file path.
+
+usage: CZI_JXR_TEST_FILE=file.czi python -m unittest test_jxr
+
+The JpegXrFile subblocks of the CZI file named by CZI_JXR_TEST_FILE are
+decoded, or, without that variable, synthetic streams encoded with
+imagecodecs.  Tests are skipped if the _czifile extension is not built
+with decode_jxr_bytes or if no JPEG-XR streams are available.
+"""
+
+import os
+import unittest
+
+import numpy
+
+import czifile
+from czifile import czifile as _module
+
+_czifile = getattr(_module, '_czifile', None)
+
+
+def czi_streams(filename, max_subblocks=20):
+    """Return compressed data of JpegXrFile subblocks in CZI file."""
+    streams = []
+    czi = czifile.CziFile(filename)
+    try:
+        for entry in czi.filtered_subblock_directory:
+            if entry.compression != 4:
+                continue
+            streams.append(entry.data_segment().data(raw=True))
+            if len(streams) >= max_subblocks:
+                break
+    finally:
+        czi.close()
+    return streams
+
+
+def synthetic_streams():
+    """Return JPEG-XR streams of gray and BGR images or empty list."""
+    try:
+        import imagecodecs
+    except ImportError:
+        return []
+    y, x = numpy.ogrid[:301, :257]
+    gray = ((x + y) % 256).astype(numpy.uint8)
+    bgr = numpy.dstack([gray, gray[::-1], gray[:, ::-1]])
+    return [imagecodecs.jpegxr_encode(a, level=1.0) for a in (gray, bgr)] + [
+        imagecodecs.jpegxr_encode(a, level=0.9) for a in (gray, bgr)]
+
+
+class DecodeJxrBytesTest(unittest.TestCase):
+
+    def setUp(self):
+        if not hasattr(_czifile, 'decode_jxr_bytes'):
+            raise unittest.SkipTest(
+                '_czifile extension lacks decode_jxr_bytes')
+        filename = os.getenv('CZI_JXR_TEST_FILE')
+        self.streams = czi_streams(filename) if filename else (
+            synthetic_streams())
+        if not self.streams:
+            raise unittest.SkipTest(
+                'no JPEG-XR streams; set CZI_JXR_TEST_FILE')
+
+    def test_bytes(self):
+        for data in self.streams:
+            expected = _module.decode_jxr_file(data)
+            found = _czifile.decode_jxr_bytes(data)
+            self.assertEqual(found.dtype, expected.dtype)
+            self.assertEqual(found.shape, expected.shape)
+            self.assertTrue(numpy.array_equal(found, expected))
+
+    def test_out(self):
+        for data in self.streams:
+            expected = _module.decode_jxr_file(data)
+            out = numpy.zeros_like(expected)
+            found = _czifile.decode_jxr_bytes(data, out)
+            self.assertTrue(found is out)
+            self.assertTrue(numpy.array_equal(out, expected))
+
+    def test_buffer(self):
+        # as decode_jxr is called with slices of a memory-mapped file
+        for data in self.streams:
+            padded = numpy.frombuffer(b'\0' * 7 + data + b'\0' * 5, 'uint8')
+            found = _module.decode_jxr(padded[7:7+len(data)])
+            self.assertTrue(numpy.array_equal(
+                found, _module.decode_jxr_file(data)))
+
+
+if __name__ == '__main__':
+    unittest.main()
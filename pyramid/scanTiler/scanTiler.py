@@ -145,6 +145,7 @@ def load(config_filename):
     timeout = cfg.get('timeout', 30)
     limit = cfg.get('limit', 5)
     chunk_size = cfg.get('chunk_size', 10000000)
+    thumbnail_size = cfg.get('thumbnail_size', 512)
 
     # Establish Ermrest client connection
     try:
@@ -155,6 +156,7 @@ def load(config_filename):
                                chunk_size=chunk_size, \
                                namespace=namespace, \
                                thumbnails=thumbnails, \
+                               thumbnail_size=thumbnail_size, \
                                czi=czi, \
                                dzi=dzi, \
                                czi2dzi=czi2dzi, \
@@ -127,6 +127,7 @@ class ErmrestClient (object):
         self.mail_receiver = kwargs.get("mail_receiver")
         self.logger = kwargs.get("logger")
         self.thumbnails = kwargs.get("thumbnails")
+        self.thumbnail_size = kwargs.get("thumbnail_size", 512)
         self.dzi = kwargs.get("dzi")
         self.czi2dzi = kwargs.get("czi2dzi")
         self.viewer = kwargs.get("viewer")
@@ -215,7 +216,36 @@ class ErmrestClient (object):
         finally:
             self.webconn = None
 
-    def writeThumbnailFile(self, slide_id, scan_id):
+    def writeEmbeddedThumbnail(self, cziFile, thumbdir, name):
+        """
+            Write the preview image attached to the CZI file as the thumbnail
+            thumbdir/name.jpg, before the tiles are generated.
+            Returns True on success, or False if the thumbnail must be taken from the tiles.
+        """
+        try:
+            outdir = '%s/%s' % (self.thumbnails, thumbdir)
+            if not os.path.exists(outdir):
+                os.makedirs(outdir)
+            cf = czifile.CziFile(cziFile)
+            try:
+                attachment = cf.save_thumbnail('%s/%s.jpg' % (outdir, name), self.thumbnail_size)
+            finally:
+                cf.close()
+            if attachment == None:
+                self.logger.debug('No thumbnail attachment in the file "%s".' % (cziFile))
+                return False
+            self.logger.debug('Wrote the "%s" attachment of the file "%s" as thumbnail.' % (attachment, cziFile))
+            return True
+        except:
+            et, ev, tb = sys.exc_info()
+            self.logger.error('Can not extract the thumbnail attachment from the "%s" file.' % (cziFile))
+            self.logger.error('%s' % str(traceback.format_exception(et, ev, tb)))
+            return False
+
+    def thumbnailURL(self, thumbdir, name):
+        return '/thumbnails/%s/%s.jpg' % (urllib.quote(thumbdir, safe=''), urllib.quote(name, safe=''))
+
+    def writeThumbnailFile(self, slide_id, scan_id, embedded=False):
         scanDir='%s/%s' % (self.dzi, scan_id)
         channels = []
         for channel in os.listdir(scanDir):
@@ -224,8 +254,9 @@ class ErmrestClient (object):
         outdir = '%s/%s' % (self.thumbnails, slide_id)
         if not os.path.exists(outdir):
             os.makedirs(outdir)
-        shutil.copyfile('%s/%s/%s/0/0_0.jpg' % (self.dzi, scan_id, channels[0]), '%s/%s.jpg' % (outdir, scan_id))
-        thumbnail = '/thumbnails/%s/%s.jpg' % (urllib.quote(slide_id, safe=''), urllib.quote(scan_id, safe=''))
+        if not embedded:
+            shutil.copyfile('%s/%s/%s/0/0_0.jpg' % (self.dzi, scan_id, channels[0]), '%s/%s.jpg' % (outdir, scan_id))
+        thumbnail = self.thumbnailURL(slide_id, scan_id)
         urls = []
         for channel in channels:
             urls.append('url=/data/%s/%s/ImageProperties.xml' % (scan_id, channel))
@@ -305,6 +336,9 @@ class ErmrestClient (object):
         for slideId,scanId,disambiguator in scanids:
             f = self.getCziFile(slideId, scanId, disambiguator)
             mdate = self.getAcquisitionDate(f)
+            embedded = self.writeEmbeddedThumbnail(f, slideId, '%s-%d' % (slideId, disambiguator))
+            if embedded:
+                self.updateAttributes('Scan', 'id', ["Thumbnail"], {'id': scanId, 'Thumbnail': self.thumbnailURL(slideId, '%s-%d' % (slideId, disambiguator))})
             self.logger.debug('Converting czi to dzi tiles for slide "%s", scan "%d"' % (slideId, scanId))
             
             try:
@@ -334,7 +368,7 @@ class ErmrestClient (object):
                 self.reportFailure(slideId, scanId, 'czi2dzi error')
                 continue
             try:
-                thumbnail,urls = self.writeThumbnailFile(slideId, '%s-%d' % (slideId, disambiguator))
+                thumbnail,urls = self.writeThumbnailFile(slideId, '%s-%d' % (slideId, disambiguator), embedded)
             except:
                 et, ev, tb = sys.exc_info()
                 self.logger.error('got unexpected exception "%s"' % str(ev))
@@ -471,6 +505,22 @@ class ErmrestClient (object):
             self.sendMail('FAILURE Tiles: reportFailure ERROR', '%s\n' % str(traceback.format_exception(et, ev, tb)))
             
         
+    def updateAttributes(self, path, key, columns, row):
+        """
+            Update the columns of the row identified by its key column in the table.
+        """
+        try:
+            columns = ','.join([urllib.quote(col, safe='') for col in columns])
+            url = '%s/attributegroup/%s/%s;%s' % (self.path, path, urllib.quote(key, safe=''), columns)
+            headers = {'Content-Type': 'application/json'}
+            resp = self.send_request('PUT', url, json.dumps([row]), headers, False)
+            resp.read()
+            self.logger.debug('SUCCEEDED updated the table "%s" with "%s".' % (path, json.dumps(row))) 
+        except:
+            et, ev, tb = sys.exc_info()
+            self.logger.error('got unexpected exception "%s"' % str(ev))
+            self.logger.error('%s' % str(traceback.format_exception(et, ev, tb)))
+            
     def hasCziFile(self, slideId=None, scanId=None, disambiguator=None):
         """
             Check if the file exists in hatrac
@@ -535,7 +585,7 @@ class ErmrestClient (object):
         shutil.copyfile(srcFile, cziFile)
         return cziFile
 
-    def writeThumbnailImage(self, year, md5):
+    def writeThumbnailImage(self, year, md5, embedded=False):
         scanDir='%s/%s/%s' % (self.dzi, year, md5)
         channels = []
         for channel in os.listdir(scanDir):
@@ -544,8 +594,9 @@ class ErmrestClient (object):
         outdir = '%s/%s' % (self.thumbnails, year)
         if not os.path.exists(outdir):
             os.makedirs(outdir)
-        shutil.copyfile('%s/%s/%s/%s/0/0_0.jpg' % (self.dzi, year, md5, channels[0]), '%s/%s.jpg' % (outdir, md5))
-        thumbnail = '/thumbnails/%s/%s.jpg' % (urllib.quote(year, safe=''), urllib.quote(md5, safe=''))
+        if not embedded:
+            shutil.copyfile('%s/%s/%s/%s/0/0_0.jpg' % (self.dzi, year, md5, channels[0]), '%s/%s.jpg' % (outdir, md5))
+        thumbnail = self.thumbnailURL(year, md5)
         urls = []
         for channel in channels:
             urls.append('url=/data/%s/%s/%s/ImageProperties.xml' % (year, md5, channel))
@@ -590,6 +641,9 @@ class ErmrestClient (object):
             f = self.getHistologicalFile(filename, file_url)
             mdate = self.getAcquisitionDate(f)
             year = parse(creation_time).strftime("%Y")
+            embedded = self.writeEmbeddedThumbnail(f, year, md5)
+            if embedded:
+                self.updateAttributes('Histological_Images:HE_Slide', 'ID', ["Thumbnail"], {'ID': slideId, 'Thumbnail': self.thumbnailURL(year, md5)})
             self.logger.debug('Converting czi to dzi tiles for file "%s"' % (filename))
             
             try:
@@ -621,7 +675,7 @@ class ErmrestClient (object):
                 self.reportImageFailure(slideId, filename, 'czi2dzi error')
                 continue
             try:
-                thumbnail,urls = self.writeThumbnailImage(year, md5)
+                thumbnail,urls = self.writeThumbnailImage(year, md5, embedded)
             except:
                 et, ev, tb = sys.exc_info()
                 self.logger.error('got unexpected exception "%s"' % str(ev))
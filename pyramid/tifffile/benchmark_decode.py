@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""Compare serial and threaded decoding of tiled or stripped TIFF pages.
+
+usage: benchmark_decode.py [tifffile [page]] [--workers=1,2,4,8,16] [--repeat=3]
+
+Without a file, writes a synthetic 8192x8192 RGB page in 256x256
+deflate compressed tiles to a temporary file.  Pass a JPEG compressed
+whole slide image (e.g. an SVS file) to measure JPEG decoding.  Each
+worker count is checked to return the same array as the serial path,
+and the best time of repeat runs is reported in decoded megapixels and
+megabytes per second.
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy
+
+from tifffile.tifffile import TiffFile, TiffWriter
+
+
+def synthetic(filename, shape=(8192, 8192, 3), tile=(256, 256)):
+    # smooth gradients and noise compress about as well as tissue
+    y, x = numpy.ogrid[:shape[0], :shape[1]]
+    rng = numpy.random.RandomState(0)
+    data = numpy.empty(shape, numpy.uint8)
+    for i in range(shape[2]):
+        data[..., i] = ((x * (i + 1) + y) // 64 % 256).astype(numpy.uint8)
+        data[..., i] |= rng.randint(0, 16, shape[:2]).astype(numpy.uint8)
+    with TiffWriter(filename, bigtiff=data.nbytes > 2**31) as tif:
+        tif.save(data, photometric='rgb', tile=tile, compress=6)
+
+
+def best(func, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.time()
+        result = func()
+        times.append(time.time() - t0)
+    return min(times), result
+
+
+def main(argv):
+    workers = [1, 2, 4, 8, 16]
+    repeat = 3
+    args = []
+    for arg in argv:
+        if arg.startswith('--workers='):
+            workers = [int(w) for w in arg[10:].split(',')]
+        elif arg.startswith('--repeat='):
+            repeat = int(arg[9:])
+        else:
+            args.append(arg)
+
+    temporary = None
+    if args:
+        filename = args[0]
+    else:
+        fd, temporary = tempfile.mkstemp(suffix='.tif')
+        os.close(fd)
+        filename = temporary
+        synthetic(filename)
+
+    try:
+        with TiffFile(filename) as tif:
+            page = tif.pages[int(args[1]) if len(args) > 1 else 0]
+            if page.is_tiled:
+                segments = 'tiles %dx%d' % (page.tile_length, page.tile_width)
+            else:
+                segments = 'strips of %d rows' % page.rows_per_strip
+            sys.stdout.write('%s: %dx%d %s, %s, %d %s\n' % (
+                os.path.basename(filename), page.image_length,
+                page.image_width, page.dtype, page.compression,
+                len(page._byte_counts_offsets[0]), segments))
+
+            serial, expected = best(page.asarray, repeat)
+            pixels = page.image_length * page.image_width / 1e6
+            nbytes = expected.nbytes / float(1024**2)
+            sys.stdout.write('%-8s %10s %10s %10s %8s\n' % (
+                'workers', 'seconds', 'Mpx/s', 'MB/s', 'speedup'))
+            for maxworkers in workers:
+                if maxworkers == 1:
+                    seconds = serial
+                else:
+                    seconds, found = best(
+                        lambda: page.asarray(maxworkers=maxworkers), repeat)
+                    assert found.dtype == expected.dtype
+                    assert (found == expected).all(), maxworkers
+                    del found
+                sys.stdout.write('%-8d %10.3f %10.1f %10.1f %7.2fx\n' % (
+                    maxworkers, seconds, pixels / seconds, nbytes / seconds,
+                    serial / seconds))
+    finally:
+        if temporary is not None:
+            os.remove(temporary)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+"""Compare serial and threaded compression of TIFF strips or tiles.
+
+usage: benchmark_encode.py [--workers=1,2,4,8] [--repeat=3] [--compress=6]
+                           [--tile=256]
+
+Writes a synthetic stack of 16 2048x2048 8-bit pages, a smooth gradient
+with noise that compresses about as well as tissue, to a temporary file
+with TiffWriter.save.  Each worker count is checked to write the same
+file as the serial path, and the best time of repeat runs is reported in
+megabytes per second.  Use --tile=0 to write one strip per page and
+--compress=lzma for LZMA compression.
+"""
+
+import os
+import sys
+import time
+import datetime
+import tempfile
+
+import numpy
+
+from tifffile.tifffile import TiffWriter
+
+
+def synthetic(shape=(16, 2048, 2048)):
+    y, x = numpy.ogrid[:shape[1], :shape[2]]
+    rng = numpy.random.RandomState(0)
+    data = numpy.empty(shape, numpy.uint8)
+    for i in range(shape[0]):
+        data[i] = ((x + y + i) // 32 % 256).astype(numpy.uint8)
+        data[i] |= rng.randint(0, 16, shape[1:]).astype(numpy.uint8)
+    return data
+
+
+def main(argv):
+    workers = [1, 2, 4, 8]
+    repeat = 3
+    compress = 6
+    tile = 256
+    for arg in argv:
+        if arg.startswith('--workers='):
+            workers = [int(w) for w in arg[10:].split(',')]
+        elif arg.startswith('--repeat='):
+            repeat = int(arg[9:])
+        elif arg.startswith('--compress='):
+            compress = arg[11:]
+            compress = int(compress) if compress.isdigit() else compress
+        elif arg.startswith('--tile='):
+            tile = int(arg[7:])
+
+    data = synthetic()
+    # fixed date and time, so files written by all worker counts are equal
+    kwargs = dict(compress=compress, datetime=datetime.datetime(2000, 1, 1))
+    if tile:
+        kwargs['tile'] = (tile, tile)
+    fd, filename = tempfile.mkstemp(suffix='.tif')
+    os.close(fd)
+    try:
+        sys.stdout.write('%dx%dx%d %s, %s, compress=%s\n' % (
+            data.shape + (data.dtype, 'tiles %dx%d' % (tile, tile) if tile
+                          else 'strips', compress)))
+        sys.stdout.write('%-8s %10s %10s %10s %8s\n' % (
+            'workers', 'seconds', 'MB/s', 'written', 'speedup'))
+        nbytes = data.nbytes / float(1024**2)
+        expected = None
+        for maxworkers in workers:
+            times = []
+            for _ in range(repeat):
+                t0 = time.time()
+                with TiffWriter(filename) as tif:
+                    tif.save(data, maxworkers=maxworkers, **kwargs)
+                times.append(time.time() - t0)
+            with open(filename, 'rb') as fh:
+                written = fh.read()
+            if expected is None:
+                expected = written
+                serial = min(times)
+            assert written == expected, maxworkers
+            seconds = min(times)
+            sys.stdout.write('%-8d %10.3f %10.1f %10d %7.2fx\n' % (
+                maxworkers, seconds, nbytes / seconds, len(written),
+                serial / seconds))
+    finally:
+        os.remove(filename)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
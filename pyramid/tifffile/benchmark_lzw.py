@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""Compare LZW decoding throughput across image sizes.
+
+usage: benchmark_lzw.py [repeat]
+
+Encodes synthetic 8-bit images of increasing size as single-strip LZW
+compressed TIFF files with Pillow (libtiff), decodes each strip with
+the pure Python decode_lzw and, if built, the decode_lzw function of the
+_tifffile C extension, checks the results against the Pillow decoded
+pixels, and reports the best time of repeat runs in decoded megabytes
+per second.  The images are noise (little redundancy), a smooth
+gradient with noise (typical of tissue), and blank background.
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy
+from PIL import Image, TiffImagePlugin
+
+from tifffile import tifffile as _module
+from tifffile.tifffile import TiffFile
+
+
+def images(size, rng):
+    y, x = numpy.ogrid[:size, :size]
+    yield 'noise', rng.randint(0, 256, (size, size)).astype(numpy.uint8)
+    gradient = ((x + y) * 256 // (2 * size)).astype(numpy.uint8)
+    gradient |= rng.randint(0, 4, (size, size)).astype(numpy.uint8)
+    yield 'gradient', gradient
+    yield 'blank', numpy.zeros((size, size), numpy.uint8)
+
+
+def encode(image, filename):
+    TiffImagePlugin.WRITE_LIBTIFF = True
+    Image.fromarray(image).save(filename, compression='tiff_lzw')
+    with TiffFile(filename) as tif:
+        page = tif.pages[0]
+        byte_counts, offsets = page._byte_counts_offsets
+        tif.filehandle.seek(offsets[0])
+        return tif.filehandle.read(byte_counts[0])
+
+
+def best(func, data, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.time()
+        result = func(data)
+        times.append(time.time() - t0)
+    return min(times), result
+
+
+def main(repeat=3):
+    repeat = int(repeat)
+    decoders = [('python', getattr(_module, '__old_decode_lzw',
+                                   _module.decode_lzw))]
+    if _module.decode_lzw is not decoders[0][1]:
+        decoders.append(('_tifffile', _module.decode_lzw))
+
+    rng = numpy.random.RandomState(0)
+    fd, filename = tempfile.mkstemp(suffix='.tif')
+    os.close(fd)
+    try:
+        sys.stdout.write('%-10s %-10s %10s' % ('image', 'size', 'encoded'))
+        for name, _ in decoders:
+            sys.stdout.write(' %14s' % (name + ' MB/s'))
+        sys.stdout.write('\n')
+        for size in (256, 1024, 2048, 4096):
+            for kind, image in images(size, rng):
+                encoded = encode(image, filename)
+                sys.stdout.write('%-10s %-10s %10d' % (
+                    kind, '%dx%d' % image.shape, len(encoded)))
+                for name, decode in decoders:
+                    seconds, decoded = best(decode, encoded, repeat)
+                    assert decoded == image.tostring(), name
+                    sys.stdout.write(' %14.1f' % (
+                        image.nbytes / seconds / 1024**2))
+                sys.stdout.write('\n')
+    finally:
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+"""Tests of the pure Python LZW decoder.
+
+usage: python -m unittest test_lzw
+"""
+
+import os
+import tempfile
+import unittest
+import warnings
+
+import numpy
+
+from tifffile import tifffile as _module
+from tifffile.tifffile import TiffFile
+
+# the pure Python decoder, even if the _tifffile extension is built
+decode_lzw = getattr(_module, '__old_decode_lzw', _module.decode_lzw)
+
+
+def pack(codes):
+    """Return TIFF LZW stream of codes following a CLEAR code."""
+    bits = []
+    table = 258
+    for i, code in enumerate(codes):
+        if code == 256:
+            table = 258
+        # code widths switch one code early, as in TIFF
+        bitw = 9 if table < 511 else 10 if table < 1023 else (
+            11 if table < 2047 else 12)
+        bits.append(format(code, '0%ib' % bitw))
+        if code != 256 and i and codes[i-1] != 256:
+            table += 1
+    bits = ''.join(bits)
+    bits += '0' * (-len(bits) % 8)
+    return bytes(bytearray(int(bits[i:i+8], 2)
+                           for i in range(0, len(bits), 8)))
+
+
+def reference(encoded):
+    """Return decoded stream, one code at a time, or raise ValueError."""
+    bits = ''.join(format(c, '08b') for c in bytearray(encoded))
+    result = []
+    bitcount = 0
+    table = None
+    previous = None
+    while True:
+        size = 258 if table is None else len(table)
+        bitw = 9 if size < 511 else 10 if size < 1023 else (
+            11 if size < 2047 else 12)
+        if bitcount + bitw >= len(bits):
+            break
+        code = int(bits[bitcount:bitcount+bitw], 2)
+        bitcount += bitw
+        if code == 257:
+            break
+        if code == 256:
+            table = [bytes(bytearray([i])) for i in range(256)] + [b'', b'']
+            previous = None
+            continue
+        if table is None:
+            raise ValueError("strip must begin with CLEAR code")
+        if code < len(table) and code not in (256, 257):
+            decoded = table[code]
+        elif code == len(table) and previous is not None:
+            decoded = table[previous] + table[previous][:1]
+        else:
+            raise ValueError("invalid code %i" % code)
+        if previous is not None:
+            table.append(table[previous] + decoded[:1])
+        result.append(decoded)
+        previous = code
+    return b''.join(result)
+
+
+class DecodeLzwTest(unittest.TestCase):
+
+    def test_table_codes(self):
+        # 258 is defined by the code that uses it, 259 refers to 258
+        encoded = pack([256, 65, 258, 259, 66, 257])
+        self.assertEqual(decode_lzw(encoded), b'AAAAAAB')
+
+    def test_clear(self):
+        encoded = pack([256, 65, 66, 258, 256, 67, 258, 257])
+        self.assertEqual(decode_lzw(encoded), b'ABABCCC')
+
+    def test_code_beyond_table(self):
+        # the table holds 259 codes when the fourth code is read
+        encoded = pack([256, 65, 66, 261, 257])
+        self.assertRaises(ValueError, decode_lzw, encoded)
+        encoded = pack([256, 65, 66, 258, 256, 300, 257])
+        self.assertRaises(ValueError, decode_lzw, encoded)
+
+    def test_corrupt_streams(self):
+        rng = numpy.random.RandomState(0)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            for _ in range(300):
+                encoded = pack([256]) + rng.randint(
+                    0, 256, rng.randint(2, 200)).astype('uint8').tostring()
+                try:
+                    expected = reference(encoded)
+                except ValueError:
+                    self.assertRaises(ValueError, decode_lzw, encoded)
+                else:
+                    self.assertEqual(decode_lzw(encoded), expected)
+
+    def test_truncated(self):
+        encoded = pack([256, 65, 66, 258, 257])[:-1]
+        # Python 2 skips warnings ignored before in the module registry
+        getattr(_module, '__warningregistry__', {}).clear()
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            self.assertEqual(decode_lzw(encoded), b'ABAB')
+        self.assertEqual(len(w), 1)
+        self.assertTrue(str(w[0].message).startswith(
+            'unexpected end of lzw stream (code '))
+
+    def test_pillow(self):
+        try:
+            from PIL import Image, TiffImagePlugin
+        except ImportError:
+            raise unittest.SkipTest('Pillow not installed')
+        TiffImagePlugin.WRITE_LIBTIFF = True
+        rng = numpy.random.RandomState(0)
+        y, x = numpy.ogrid[:300, :400]
+        image = ((x + y) // 3 % 256).astype(numpy.uint8)
+        image |= rng.randint(0, 4, image.shape).astype(numpy.uint8)
+        fd, filename = tempfile.mkstemp(suffix='.tif')
+        os.close(fd)
+        try:
+            Image.fromarray(image).save(filename, compression='tiff_lzw')
+            with TiffFile(filename) as tif:
+                page = tif.pages[0]
+                byte_counts, offsets = page._byte_counts_offsets
+                tif.filehandle.seek(offsets[0])
+                encoded = tif.filehandle.read(byte_counts[0])
+        finally:
+            os.remove(filename)
+        self.assertEqual(decode_lzw(encoded), image.tostring())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -322,8 +322,9 @@ def imsave(file, data, **kwargs):
         Parameters 'append', 'byteorder', 'bigtiff', 'software', and 'imagej',
         are passed to the TiffWriter class.
         Parameters 'photometric', 'planarconfig', 'resolution', 'compress',
-        'colormap', 'tile', 'description', 'datetime', 'metadata', 'contiguous'
-        and 'extratags' are passed to the TiffWriter.save function.
+        'colormap', 'tile', 'description', 'datetime', 'metadata',
+        'contiguous', 'extratags', and 'maxworkers' are passed to the
+        TiffWriter.save function.
 
     Examples
     --------
@@ -370,7 +371,8 @@ class TiffWriter(object):
         'tile_width': 322, 'tile_length': 323, 'tile_offsets': 324,
         'tile_byte_counts': 325, 'extra_samples': 338, 'sample_format': 339,
         'smin_sample_value': 340, 'smax_sample_value': 341,
-        'image_depth': 32997, 'tile_depth': 32998}
+        'sub_ifds': 330, 'ycbcr_subsampling': 530, 'image_depth': 32997,
+        'tile_depth': 32998}
 
     def __init__(self, file, append=False, bigtiff=False, byteorder=None,
                  software='tifffile.py', imagej=False):
@@ -452,6 +454,7 @@ class TiffWriter(object):
         self._description_len = 0
 
         self._tags = None
+        self._subifds = None  # position, count, and number of written SubIFDs
         self._shape = None  # normalized shape of data in consecutive pages
         self._data_shape = None  # shape of data in consecutive pages
         self._data_dtype = None  # data type
@@ -491,7 +494,7 @@ class TiffWriter(object):
     def save(self, data, photometric=None, planarconfig=None, tile=None,
              contiguous=True, compress=0, colormap=None,
              description=None, datetime=None, resolution=None,
-             metadata={}, extratags=()):
+             metadata={}, extratags=(), maxworkers=1):
         """Write image data and tags to TIFF file.
 
         Image data are written in one stripe per plane by default.
@@ -570,9 +573,17 @@ class TiffWriter(object):
                 'Count' values compatible with 'dtype'.
             writeonce : bool
                 If True, the tag is written to the first page only.
+        maxworkers : int
+            Maximum number of threads compressing strips or tiles.
+            If > 1, zlib or LZMA compression, which release the GIL, run
+            in a thread pool. Data are written in the same order and to
+            the same offsets as by a single thread.
 
         """
         # TODO: refactor this function
+        if self._subifds:
+            raise ValueError("%i SubIFDs not written" % (
+                self._subifds[1] - self._subifds[2]))
         fh = self._fh
         byteorder = self._byteorder
         numtag_format = self._numtag_format
@@ -785,8 +796,6 @@ class TiffWriter(object):
         if photometric == 'rgb' and samplesperpixel == 2:
             raise ValueError("not a RGB image (samplesperpixel=2)")
 
-        bytestr = bytes if sys.version[0] == '2' else (
-            lambda x: bytes(x, 'utf-8') if isinstance(x, str) else x)
         tags = []  # list of (code, ifdentry, ifdvalue, writeonce)
 
         strip_or_tile = 'tile' if tile else 'strip'
@@ -798,59 +807,10 @@ class TiffWriter(object):
             return struct.pack(byteorder+fmt, *val)
 
         def addtag(code, dtype, count, value, writeonce=False):
-            # Compute ifdentry & ifdvalue bytes from code, dtype, count, value
             # Append (code, ifdentry, ifdvalue, writeonce) to tags list
-            code = int(TiffWriter.TAGS.get(code, code))
-            try:
-                tifftype = TiffWriter.TYPES[dtype]
-            except KeyError:
-                raise ValueError("unknown dtype %s" % dtype)
-            rawcount = count
-            if dtype == 's':
-                value = bytestr(value) + b'\0'
-                count = rawcount = len(value)
-                rawcount = value.find(b'\0\0')
-                if rawcount < 0:
-                    rawcount = count
-                else:
-                    rawcount += 1  # length of string without buffer
-                value = (value,)
-            if len(dtype) > 1:
-                count *= int(dtype[:-1])
-                dtype = dtype[-1]
-            ifdentry = [pack('HH', code, tifftype),
-                        pack(offset_format, rawcount)]
-            ifdvalue = None
-            if struct.calcsize(dtype) * count <= offset_size:
-                # value(s) can be written directly
-                if count == 1:
-                    if isinstance(value, (tuple, list, numpy.ndarray)):
-                        value = value[0]
-                    ifdentry.append(pack(value_format, pack(dtype, value)))
-                else:
-                    ifdentry.append(pack(value_format,
-                                         pack(str(count)+dtype, *value)))
-            else:
-                # use offset to value(s)
-                ifdentry.append(pack(offset_format, 0))
-                if isinstance(value, numpy.ndarray):
-                    assert value.size == count
-                    assert value.dtype.char == dtype
-                    ifdvalue = value.tostring()
-                elif isinstance(value, (tuple, list)):
-                    ifdvalue = pack(str(count)+dtype, *value)
-                else:
-                    ifdvalue = pack(dtype, value)
-            tags.append((code, b''.join(ifdentry), ifdvalue, writeonce))
+            tags.append(self._tag(code, dtype, count, value) + (writeonce,))
 
-        def rational(arg, max_denominator=1000000):
-            # return nominator and denominator from float or two integers
-            try:
-                f = Fraction.from_float(arg)
-            except TypeError:
-                f = Fraction(arg[0], arg[1])
-            f = f.limit_denominator(max_denominator)
-            return f.numerator, f.denominator
+        rational = self._rational
 
         if description:
             # user provided description
@@ -956,6 +916,39 @@ class TiffWriter(object):
                 fh.tell() + data.size*data.dtype.itemsize > 2**31-1):
             raise ValueError("data too large for standard TIFF file")
 
+        def tiled(plane):
+            # yield tiles of plane, padded in the tile buffer
+            for tz in range(tiles[0]):
+                for ty in range(tiles[1]):
+                    for tx in range(tiles[2]):
+                        c0 = min(tile[0], shape[2] - tz*tile[0])
+                        c1 = min(tile[1], shape[3] - ty*tile[1])
+                        c2 = min(tile[2], shape[4] - tx*tile[2])
+                        chunk[c0:, c1:, c2:] = 0
+                        chunk[:c0, :c1, :c2] = plane[
+                            tz*tile[0]:tz*tile[0]+c0,
+                            ty*tile[1]:ty*tile[1]+c1,
+                            tx*tile[2]:tx*tile[2]+c2]
+                        yield chunk
+
+        def segments():
+            # yield strips or tiles of all pages in order of writing
+            for page in data:
+                for plane in page:
+                    if not tile:
+                        yield plane
+                    elif maxworkers < 2:
+                        for t in tiled(plane):
+                            yield t
+                    else:
+                        # tiles are compressed later, in other threads
+                        for t in tiled(plane):
+                            yield t.copy()
+
+        if compress:
+            compressed = self._compress_segments(compress, segments(),
+                                                 maxworkers)
+
         # if not compressed or tiled, write the first ifd and then all data
         # contiguously; else, write all ifds and data interleaved
         for pageindex in range(shape[0] if (compress or tile) else 1):
@@ -994,31 +987,15 @@ class TiffWriter(object):
             data_offset = fh.tell()
             if compress:
                 strip_byte_counts = []
-            if tile:
-                for plane in data[pageindex]:
-                    for tz in range(tiles[0]):
-                        for ty in range(tiles[1]):
-                            for tx in range(tiles[2]):
-                                c0 = min(tile[0], shape[2] - tz*tile[0])
-                                c1 = min(tile[1], shape[3] - ty*tile[1])
-                                c2 = min(tile[2], shape[4] - tx*tile[2])
-                                chunk[c0:, c1:, c2:] = 0
-                                chunk[:c0, :c1, :c2] = plane[
-                                    tz*tile[0]:tz*tile[0]+c0,
-                                    ty*tile[1]:ty*tile[1]+c1,
-                                    tx*tile[2]:tx*tile[2]+c2]
-                                if compress:
-                                    t = compress(chunk)
-                                    strip_byte_counts.append(len(t))
-                                    fh.write(t)
-                                else:
-                                    fh.write_array(chunk)
-                                    fh.flush()
-            elif compress:
+                for _ in range(numtiles if tile else shape[1]):
+                    t = next(compressed)
+                    strip_byte_counts.append(len(t))
+                    fh.write(t)
+            elif tile:
                 for plane in data[pageindex]:
-                    plane = compress(plane)
-                    strip_byte_counts.append(len(plane))
-                    fh.write(plane)
+                    for t in tiled(plane):
+                        fh.write_array(t)
+                        fh.flush()
             else:
                 fh.write_array(data)
 
@@ -1054,6 +1031,9 @@ class TiffWriter(object):
             if pageindex == 0:
                 tags = [tag for tag in tags if not tag[-1]]
 
+        if compress:
+            compressed.close()
+
         # if uncompressed, write remaining ifds/tags later
         if not (compress or tile):
             self._tags = tags
@@ -1064,6 +1044,395 @@ class TiffWriter(object):
         self._data_offset = data_offset
         self._data_byte_counts = strip_byte_counts
 
+    def save_tiles(self, tiles, shape, dtype, tile=(256, 256), compress=0,
+                   photometric=None, subifds=0, subfiletype=0,
+                   description=None, datetime=None, resolution=None,
+                   extratags=(), maxworkers=1):
+        """Write tiled image from iterator of tiles.
+
+        The image is never held in memory. Each tile is compressed and
+        written as it is produced, and the tile offsets and byte counts of
+        the IFD, which is written first, are updated after the last tile.
+
+        Multi-resolution pyramids are written by calling this function
+        once per level, starting with the full resolution image:
+        with subifds=n, the next n calls write reduced resolution levels
+        to SubIFDs of this image. Alternatively, levels can be written as
+        consecutive pages with subfiletype=1.
+
+        Parameters
+        ----------
+        tiles : iterable
+            Arrays of shape (tile length, tile width[, samples]) in order
+            of rows and columns of tiles, or ((row, column), array) tuples
+            in any order, e.g. as produced by parallel image converters.
+            Tiles at the right and bottom image border may be smaller.
+            Missing tiles are written with zero byte counts.
+        shape : tuple of int
+            Shape of the image (length, width[, samples]).
+        dtype : numpy.dtype
+            Data type of the image.
+        tile : (int, int)
+            The tile length and width. Must be a multiple of 16.
+        compress : int, 'lzma', 'jpeg', or ('jpeg', quality)
+            Values from 0 to 9 controlling the level of zlib compression.
+            If 0, data are written uncompressed (default).
+            JPEG compression (default quality 75) is only supported for
+            grayscale or RGB images of type uint8 and requires Pillow.
+            Each JPEG tile is a complete JPEG stream.
+        photometric : {'minisblack', 'rgb'}
+            The color space of the image data. By default, images with 3
+            or 4 samples are RGB(A).
+        subifds : int
+            Number of reduced resolution images to be written to SubIFDs
+            of this image by the following calls.
+        subfiletype : int
+            Value of the new_subfile_type tag, e.g. 1 for a reduced
+            resolution image written as a page. Ignored for SubIFDs.
+        description, datetime, resolution, extratags
+            Same as for save(). Not written to SubIFDs.
+        maxworkers : int
+            Maximum number of threads compressing tiles.
+
+        """
+        if self._imagej:
+            raise ValueError("ImageJ does not support tiled images")
+        if self._data_shape:
+            # write pending pages of previous contiguous data
+            self._write_remaining_pages()
+            self._write_image_description()
+            self._description_offset = 0
+            self._description_len_offset = 0
+            self._data_shape = None
+            self._colormap = None
+
+        fh = self._fh
+        byteorder = self._byteorder
+        offset_format = self._offset_format
+        dtype = numpy.dtype(byteorder + numpy.dtype(dtype).char)
+
+        shape = tuple(int(i) for i in shape)
+        if len(shape) == 2:
+            shape += (1, )
+        if len(shape) != 3 or any(i < 1 for i in shape):
+            raise ValueError("invalid shape %s" % str(shape))
+        length, width, samples = shape
+        if photometric is None:
+            photometric = 'rgb' if samples in (3, 4) else 'minisblack'
+        if photometric not in ('minisblack', 'rgb'):
+            raise ValueError("invalid photometric %s" % photometric)
+        if photometric == 'rgb' and samples < 3:
+            raise ValueError("not a RGB(A) image")
+        tile = tuple(int(i) for i in tile)
+        if len(tile) != 2 or tile[0] % 16 or tile[1] % 16 or min(tile) < 1:
+            raise ValueError("invalid tile shape")
+        tiles_y = (length + tile[0] - 1) // tile[0]
+        tiles_x = (width + tile[1] - 1) // tile[1]
+        numtiles = tiles_y * tiles_x
+
+        # prepare compression
+        if isinstance(compress, tuple) and compress[0] == 'jpeg':
+            compress, quality = compress
+        else:
+            quality = 75
+        if not compress:
+            def compress(data):
+                return data.tostring()
+            compress_tag = 1
+        elif compress == 'lzma':
+            compress = lzma.compress
+            compress_tag = 34925
+        elif compress == 'jpeg':
+            if dtype.char != 'B' or samples not in (1, 3):
+                raise ValueError("JPEG requires grayscale or RGB uint8")
+            from io import BytesIO
+            from PIL import Image
+
+            def compress(data, quality=int(quality)):
+                if data.shape[-1] == 1:
+                    data = data[..., 0]
+                buf = BytesIO()
+                Image.fromarray(data).save(buf, 'JPEG', quality=quality,
+                                           subsampling=0)
+                return buf.getvalue()
+            compress_tag = 7
+        elif 0 <= compress <= 9:
+            def compress(data, level=compress):
+                return zlib.compress(data, level)
+            compress_tag = 32946
+        else:
+            raise ValueError("invalid compression %s" % str(compress))
+
+        sub = self._subifds
+        tags = []
+
+        def addtag(code, dtype, count, value):
+            tags.append(self._tag(code, dtype, count, value))
+
+        addtag('new_subfile_type', 'I', 1, 1 if sub else subfiletype)
+        if not sub:
+            if description:
+                addtag('image_description', 's', 0, description)
+            if self._software:
+                addtag('software', 's', 0, self._software)
+                self._software = None  # only save to first page in file
+            if datetime is None:
+                datetime = self._now()
+            addtag('datetime', 's', 0,
+                   datetime.strftime("%Y:%m:%d %H:%M:%S"))
+            if resolution:
+                addtag('x_resolution', '2I', 1, self._rational(resolution[0]))
+                addtag('y_resolution', '2I', 1, self._rational(resolution[1]))
+                addtag('resolution_unit', 'H', 1,
+                       {None: 1, 'inch': 2, 'cm': 3}[resolution[2]]
+                       if len(resolution) > 2 else 2)
+            for t in extratags:
+                addtag(*t[:4])
+        addtag('compression', 'H', 1, compress_tag)
+        addtag('image_width', 'I', 1, width)
+        addtag('image_length', 'I', 1, length)
+        addtag('tile_width', 'I', 1, tile[1])
+        addtag('tile_length', 'I', 1, tile[0])
+        addtag('sample_format', 'H', 1,
+               {'u': 1, 'i': 2, 'f': 3, 'c': 6}[dtype.kind])
+        if compress_tag == 7 and photometric == 'rgb':
+            # JPEG streams store RGB as YCbCr without chroma subsampling
+            addtag('photometric', 'H', 1, 6)
+            addtag('ycbcr_subsampling', 'H', 2, (1, 1))
+        else:
+            addtag('photometric', 'H', 1,
+                   {'minisblack': 1, 'rgb': 2}[photometric])
+        addtag('samples_per_pixel', 'H', 1, samples)
+        if samples > 1:
+            addtag('planar_configuration', 'H', 1, 1)
+            addtag('bits_per_sample', 'H', samples,
+                   (dtype.itemsize * 8,) * samples)
+            extrasamples = samples - (3 if photometric == 'rgb' else 1)
+            if photometric == 'rgb' and extrasamples == 1:
+                addtag('extra_samples', 'H', 1, 1)  # associated alpha
+            elif extrasamples:
+                addtag('extra_samples', 'H', extrasamples,
+                       (0,) * extrasamples)
+        else:
+            addtag('bits_per_sample', 'H', 1, dtype.itemsize * 8)
+        if subifds and not sub:
+            addtag('sub_ifds', offset_format, subifds, [0] * subifds)
+        addtag('tile_byte_counts', offset_format, numtiles, [0] * numtiles)
+        addtag('tile_offsets', offset_format, numtiles, [0] * numtiles)
+        tags = sorted(tags, key=lambda x: x[0])
+
+        ifd, positions = self._write_ifd(tags, link=not sub)
+        if sub:
+            # link reduced resolution image from SubIFDs of main image
+            fh.seek(sub[0] + sub[2] * self._offset_size)
+            fh.write(struct.pack(byteorder+offset_format, ifd))
+            sub[2] += 1
+            if sub[2] == sub[1]:
+                self._subifds = None
+        elif subifds:
+            self._subifds = [positions[TiffWriter.TAGS['sub_ifds']],
+                             subifds, 0]
+        fh.seek(0, 2)
+
+        indices = collections.deque()
+
+        def segments(index=0):
+            # yield padded tiles and queue their indices
+            chunk = numpy.empty(tile + (samples, ), dtype)
+            for data in tiles:
+                if isinstance(data, tuple):
+                    (row, column), data = data
+                    if not (0 <= row < tiles_y and 0 <= column < tiles_x):
+                        raise ValueError("invalid tile index %s" % str(
+                            (row, column)))
+                    index = row * tiles_x + column
+                elif index >= numtiles:
+                    raise ValueError("too many tiles")
+                data = numpy.asarray(data)
+                if data.ndim == 2:
+                    data = data.reshape(data.shape + (1, ))
+                if (data.ndim != 3 or data.shape[0] > tile[0] or
+                        data.shape[1] > tile[1] or data.shape[2] != samples):
+                    raise ValueError("invalid tile shape %s" % str(
+                        data.shape))
+                if maxworkers > 1:
+                    # tiles are compressed later, in other threads
+                    chunk = numpy.empty(tile + (samples, ), dtype)
+                chunk[:data.shape[0], :data.shape[1]] = data
+                chunk[data.shape[0]:] = 0
+                chunk[:, data.shape[1]:] = 0
+                indices.append(index)
+                yield chunk
+                index += 1
+
+        offsets = numpy.zeros(numtiles, byteorder+offset_format)
+        byte_counts = numpy.zeros(numtiles, byteorder+offset_format)
+        for data in self._compress_segments(compress, segments(),
+                                            maxworkers):
+            index = indices.popleft()
+            offset = fh.tell()
+            if not self._bigtiff and offset + len(data) > 2**32 - 1:
+                raise ValueError("data too large for non-bigtiff file")
+            fh.write(data)
+            offsets[index] = offset
+            byte_counts[index] = len(data)
+
+        # update tile offsets and byte_counts
+        fh.seek(positions[TiffWriter.TAGS['tile_offsets']])
+        fh.write(offsets.tostring())
+        fh.seek(positions[TiffWriter.TAGS['tile_byte_counts']])
+        fh.write(byte_counts.tostring())
+        fh.seek(0, 2)
+        fh.flush()
+
+    @staticmethod
+    def _compress_segments(compress, segments, maxworkers=1,
+                           batchsize=2**25):
+        """Return iterator over compress(segment) of strips or tiles.
+
+        If maxworkers > 1, batches of about batchsize bytes are compressed
+        by a pool of threads while the next batch is prepared. Results are
+        returned in order of segments, which must not share buffers.
+
+        """
+        segments = iter(segments)
+        if maxworkers < 2:
+            for segment in segments:
+                yield compress(segment)
+            return
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(maxworkers)
+        try:
+            pending = None
+            while True:
+                batch = []
+                size = 0
+                for segment in segments:
+                    batch.append(segment)
+                    size += segment.nbytes
+                    if size >= batchsize and len(batch) >= maxworkers:
+                        break
+                submitted = pool.map_async(compress, batch) if batch else None
+                if pending is not None:
+                    for result in pending.get():
+                        yield result
+                if submitted is None:
+                    break
+                pending = submitted
+        finally:
+            pool.terminate()
+            pool.join()
+
+    @staticmethod
+    def _rational(arg, max_denominator=1000000):
+        """Return nominator and denominator from float or two integers."""
+        try:
+            f = Fraction.from_float(arg)
+        except TypeError:
+            f = Fraction(arg[0], arg[1])
+        f = f.limit_denominator(max_denominator)
+        return f.numerator, f.denominator
+
+    def _tag(self, code, dtype, count, value):
+        """Return (code, ifdentry, ifdvalue) bytes of tag in file format."""
+        byteorder = self._byteorder
+        offset_format = self._offset_format
+
+        def pack(fmt, *val):
+            return struct.pack(byteorder+fmt, *val)
+
+        code = int(TiffWriter.TAGS.get(code, code))
+        try:
+            tifftype = TiffWriter.TYPES[dtype]
+        except KeyError:
+            raise ValueError("unknown dtype %s" % dtype)
+        rawcount = count
+        if dtype == 's':
+            if sys.version[0] != '2' and isinstance(value, str):
+                value = bytes(value, 'utf-8')
+            value = bytes(value) + b'\0'
+            count = rawcount = len(value)
+            rawcount = value.find(b'\0\0')
+            if rawcount < 0:
+                rawcount = count
+            else:
+                rawcount += 1  # length of string without buffer
+            value = (value,)
+        if len(dtype) > 1:
+            count *= int(dtype[:-1])
+            dtype = dtype[-1]
+        ifdentry = [pack('HH', code, tifftype),
+                    pack(offset_format, rawcount)]
+        ifdvalue = None
+        if struct.calcsize(dtype) * count <= self._offset_size:
+            # value(s) can be written directly
+            if count == 1:
+                if isinstance(value, (tuple, list, numpy.ndarray)):
+                    value = value[0]
+                ifdentry.append(pack(self._value_format, pack(dtype, value)))
+            else:
+                ifdentry.append(pack(self._value_format,
+                                     pack(str(count)+dtype, *value)))
+        else:
+            # use offset to value(s)
+            ifdentry.append(pack(offset_format, 0))
+            if isinstance(value, numpy.ndarray):
+                assert value.size == count
+                assert value.dtype.char == dtype
+                ifdvalue = value.tostring()
+            elif isinstance(value, (tuple, list)):
+                ifdvalue = pack(str(count)+dtype, *value)
+            else:
+                ifdvalue = pack(dtype, value)
+        return code, b''.join(ifdentry), ifdvalue
+
+    def _write_ifd(self, tags, link=True):
+        """Write IFD of (code, ifdentry, ifdvalue) tags at end of file.
+
+        If link is True, the IFD is appended to the chain of IFDs.
+        Return the offset of the IFD and a dict of tag codes and file
+        positions of their values.
+
+        """
+        fh = self._fh
+        byteorder = self._byteorder
+        offset_format = self._offset_format
+        offset_size = self._offset_size
+
+        fh.seek(0, 2)
+        if fh.tell() % 2:
+            fh.write(b'\0')  # IFD must begin on a word boundary
+        ifd = fh.tell()
+        fh.write(struct.pack(byteorder+self._numtag_format, len(tags)))
+        tag_offset = fh.tell()
+        fh.write(b''.join(t[1] for t in tags))
+        next_ifd = fh.tell()
+        fh.write(struct.pack(byteorder+offset_format, 0))
+
+        # write tag values and patch offsets in ifdentries, if necessary
+        positions = {}
+        for tagindex, tag in enumerate(tags):
+            entry = tag_offset + tagindex*self._tag_size + offset_size + 4
+            if tag[2]:
+                pos = fh.tell()
+                fh.seek(entry)
+                fh.write(struct.pack(byteorder+offset_format, pos))
+                fh.seek(pos)
+                fh.write(tag[2])
+                if fh.tell() % 2:
+                    fh.write(b'\0')
+                positions[tag[0]] = pos
+            else:
+                positions[tag[0]] = entry
+
+        if link:
+            fh.seek(self._ifd_offset)
+            fh.write(struct.pack(byteorder+offset_format, ifd))
+            self._ifd_offset = next_ifd
+        fh.seek(0, 2)
+        return ifd, positions
+
     def _write_remaining_pages(self):
         """Write outstanding IFDs and tags to file."""
         if not self._tags:
@@ -1176,6 +1545,9 @@ class TiffWriter(object):
 
     def close(self, truncate=False):
         """Write remaining pages (if not truncate) and close file handle."""
+        if self._subifds:
+            warnings.warn("%i SubIFDs not written" % (
+                self._subifds[1] - self._subifds[2]))
         if not truncate:
             self._write_remaining_pages()
         self._write_image_description()
@@ -1443,7 +1815,8 @@ class TiffFile(object):
                 page.strip_byte_counts = tuple(
                     strips[offset] for offset in page.strip_offsets)
 
-    def asarray(self, key=None, series=None, memmap=False, tempdir=None):
+    def asarray(self, key=None, series=None, memmap=False, tempdir=None,
+                maxworkers=1):
         """Return image data from multiple TIFF pages as numpy array.
 
         By default the first image series is returned.
@@ -1460,6 +1833,9 @@ class TiffFile(object):
             file is created.
         tempdir : str
             The directory where the memory-mapped file will be created.
+        maxworkers : int
+            Maximum number of threads to decode the tiles or strips of a
+            single selected page. See TiffPage.asarray.
 
         """
         if not self.pages:
@@ -1497,7 +1873,7 @@ class TiffFile(object):
                 result = stack_pages(pages, memmap=memmap, tempdir=tempdir,
                                      colormapped=False, squeeze=False)
         elif len(pages) == 1:
-            result = pages[0].asarray(memmap=memmap)
+            result = pages[0].asarray(memmap=memmap, maxworkers=maxworkers)
         elif self.is_ome:
             assert not self.is_indexed, "color mapping disabled for ome-tiff"
             if any(p is None for p in pages):
@@ -2430,7 +2806,7 @@ class TiffPage(object):
 
     def asarray(self, squeeze=True, colormapped=True, rgbonly=False,
                 scale_mdgel=False, memmap=False, reopen=True,
-                maxsize=64*2**30):
+                maxsize=64*2**30, maxworkers=1):
         """Read image data from file and return as numpy array.
 
         Raise ValueError if format is unsupported.
@@ -2458,6 +2834,11 @@ class TiffPage(object):
         maxsize: int or None
             Maximum size of data before a ValueError is raised.
             Can be used to catch DOS. Default: 64 GB.
+        maxworkers : int
+            Maximum number of threads to concurrently decode compressed
+            tiles or strips. The compressed data are read in file order
+            by the calling thread. Default: 1, decode serially.
+            The result does not depend on the number of threads.
 
         """
         if not self._shape:
@@ -2465,19 +2846,7 @@ class TiffPage(object):
         if maxsize and product(self._shape) > maxsize:
             raise ValueError("data is too large %s" % str(self._shape))
 
-        if self.dtype is None:
-            raise ValueError("data type not supported: %s%i" % (
-                self.sample_format, self.bits_per_sample))
-        if self.compression not in TIFF_DECOMPESSORS:
-            raise ValueError("cannot decompress %s" % self.compression)
-        if 'sample_format' in self.tags:
-            tag = self.tags['sample_format']
-            if tag.count != 1 and any((i-tag.value[0] for i in tag.value)):
-                raise ValueError("sample formats do not match %s" % tag.value)
-
-        if self.is_chroma_subsampled:
-            # TODO: implement chroma subsampling
-            raise NotImplementedError("chroma subsampling not supported")
+        self._validate_decode()
 
         fh = self.parent.filehandle
         closed = fh.closed
@@ -2499,18 +2868,10 @@ class TiffPage(object):
         byte_counts, offsets = self._byte_counts_offsets
 
         if self.is_tiled:
-            tile_width = self.tile_width
-            tile_length = self.tile_length
-            tile_depth = self.tile_depth if 'tile_depth' in self.tags else 1
-            tw = (image_width + tile_width - 1) // tile_width
-            tl = (image_length + tile_length - 1) // tile_length
-            td = (image_depth + tile_depth - 1) // tile_depth
+            tile_depth, tile_length, tile_width = self._tile_shape[:3]
+            td, tl, tw = self._tile_grid
             shape = (shape[0], shape[1],
                      td*tile_depth, tl*tile_length, tw*tile_width, shape[-1])
-            tile_shape = (tile_depth, tile_length, tile_width, shape[-1])
-            runlen = tile_width
-        else:
-            runlen = image_width
 
         if memmap and self._is_memmappable(rgbonly, colormapped):
             result = fh.memmap_array(typecode, shape, offset=offsets[0])
@@ -2521,73 +2882,27 @@ class TiffPage(object):
             if lsb2msb:
                 reverse_bitorder(result)
         else:
-            if self.is_contig:
-                runlen *= self.samples_per_pixel
-            if bits_per_sample in (8, 16, 32, 64, 128):
-                if (bits_per_sample * runlen) % 8:
-                    raise ValueError("data and sample size mismatch")
-
-                def unpack(x, typecode=typecode):
-                    if self.predictor == 'float':
-                        # the floating point horizontal differencing decoder
-                        # needs the raw byte order
-                        typecode = dtype
-                    try:
-                        return numpy.fromstring(x, typecode)
-                    except ValueError as e:
-                        # strips may be missing EOI
-                        warnings.warn("unpack: %s" % e)
-                        xlen = ((len(x) // (bits_per_sample // 8)) *
-                                (bits_per_sample // 8))
-                        return numpy.fromstring(x[:xlen], typecode)
-
-            elif isinstance(bits_per_sample, tuple):
-                def unpack(x):
-                    return unpack_rgb(x, typecode, bits_per_sample)
-            else:
-                def unpack(x):
-                    return unpack_ints(x, typecode, bits_per_sample, runlen)
-
-            decompress = TIFF_DECOMPESSORS[self.compression]
-            if self.compression == 'jpeg':
-                table = self.jpeg_tables if 'jpeg_tables' in self.tags else b''
-
-                def decompress(x):
-                    return decode_jpeg(x, table, self.photometric)
+            decompress, unpack = self._decoders()
 
             if self.is_tiled:
                 result = numpy.empty(shape, dtype)
-                tw, tl, td, pl = 0, 0, 0, 0
-                for offset, bytecount in zip(offsets, byte_counts):
-                    fh.seek(offset)
-                    tile = fh.read(bytecount)
-                    if lsb2msb:
-                        tile = reverse_bitorder(tile)
-                    tile = decompress(tile)
-                    tile = unpack(tile)
-                    try:
-                        tile.shape = tile_shape
-                    except ValueError:
-                        # incomplete tiles; see gdal issue #1179
-                        warnings.warn("invalid tile data")
-                        t = numpy.zeros(tile_shape, dtype).reshape(-1)
-                        s = min(tile.size, t.size)
-                        t[:s] = tile[:s]
-                        tile = t.reshape(tile_shape)
-                    if self.predictor == 'horizontal':
-                        numpy.cumsum(tile, axis=-2, dtype=dtype, out=tile)
-                    elif self.predictor == 'float':
-                        raise NotImplementedError()
+
+                def decode(segment):
+                    # tiles are stored in order of plane, depth, row, column
+                    index, data = segment
+                    index, tw = divmod(index, shape[4] // tile_width)
+                    index, tl = divmod(index, shape[3] // tile_length)
+                    pl, td = divmod(index, shape[2] // tile_depth)
+                    tw *= tile_width
+                    tl *= tile_length
+                    td *= tile_depth
+                    tile = self._decode_tile(data, decompress, unpack)
                     result[0, pl, td:td+tile_depth,
                            tl:tl+tile_length, tw:tw+tile_width, :] = tile
-                    del tile
-                    tw += tile_width
-                    if tw >= shape[4]:
-                        tw, tl = 0, tl + tile_length
-                        if tl >= shape[3]:
-                            tl, td = 0, td + tile_depth
-                            if td >= shape[2]:
-                                td, pl = 0, pl + 1
+
+                for _ in self._decode_segments(decode, offsets, byte_counts,
+                                               maxworkers):
+                    pass
                 result = result[...,
                                 :image_depth, :image_length, :image_width, :]
             else:
@@ -2595,14 +2910,18 @@ class TiffPage(object):
                 if self.planar_configuration == 'contig':
                     strip_size *= self.samples_per_pixel
                 result = numpy.empty(shape, dtype).reshape(-1)
-                index = 0
-                for offset, bytecount in zip(offsets, byte_counts):
-                    fh.seek(offset)
-                    strip = fh.read(bytecount)
+
+                def decode(segment):
+                    strip = segment[1]
                     if lsb2msb:
                         strip = reverse_bitorder(strip)
-                    strip = decompress(strip)
-                    strip = unpack(strip)
+                    return unpack(decompress(strip))
+
+                # strips are copied in order since the position of each
+                # depends on the decoded sizes of the previous strips
+                index = 0
+                for strip in self._decode_segments(decode, offsets,
+                                                   byte_counts, maxworkers):
                     size = min(result.size, strip.size, strip_size,
                                result.size - index)
                     result[index:index+size] = strip[:size]
@@ -2664,6 +2983,300 @@ class TiffPage(object):
             fh.close()
         return result
 
+    def read_tile(self, index, out=None):
+        """Read and decode one tile of a tiled page and return numpy array.
+
+        Parameters
+        ----------
+        index : int
+            Index of the tile in the tile_offsets tag, i.e. in order of
+            planar sample, depth, row, and column of tiles.
+        out : numpy.ndarray
+            Array to decode into. Its shape must be
+            (tile_depth, tile_length, tile_width, contig samples_per_pixel)
+            and dtype the page's.
+
+        The tile is returned with that shape, including any padding beyond
+        the image width and length. Tiles without data are zero.
+
+        """
+        fh = self.parent.filehandle
+        closed = fh.closed
+        if closed:
+            fh.open()
+        try:
+            self._validate_decode()
+            return self._read_tile(index, self._decoders(), out)
+        finally:
+            if closed:
+                fh.close()
+
+    def read_region(self, y0, x0, y1, x1):
+        """Read image data of a rectangular region and return numpy array.
+
+        Only tiles intersecting the region are read and decoded, so windows
+        of large tiled pages can be read without decoding the whole page.
+        Pages that are not tiled are decoded by asarray() and cropped.
+        Color maps are not applied.
+
+        Parameters
+        ----------
+        y0, x0, y1, x1 : int
+            Rows y0 to y1 and columns x0 to x1 of the region, excluding y1
+            and x1. The region must be within the image.
+
+        The result has the dimensions of the page's normalized shape,
+        with length-1 dimensions other than Y and X squeezed out, e.g.
+        (y1-y0, x1-x0, 3) for a contiguous RGB image.
+
+        """
+        y0, x0, y1, x1 = int(y0), int(x0), int(y1), int(x1)
+        if not (0 <= y0 < y1 <= self.image_length and
+                0 <= x0 < x1 <= self.image_width):
+            raise ValueError("invalid region %s" % str((y0, x0, y1, x1)))
+        shape = self._shape[:3] + (y1 - y0, x1 - x0) + self._shape[5:]
+        squeezed = tuple(n for i, n in enumerate(shape) if n > 1 or
+                         i in (3, 4))
+
+        if not self.is_tiled:
+            result = self.asarray(squeeze=False, colormapped=False)
+            return result[..., y0:y1, x0:x1, :].reshape(squeezed)
+
+        fh = self.parent.filehandle
+        closed = fh.closed
+        if closed:
+            fh.open()
+        try:
+            self._validate_decode()
+            decoders = self._decoders()
+            planes, depth = self._shape[1], self._shape[2]
+            tile_depth, tile_length, tile_width = self._tile_shape[:3]
+            td, tl, tw = self._tile_grid
+            result = numpy.empty(shape, self._dtype)
+            for pl in range(planes):
+                for d in range(td):
+                    d0 = d * tile_depth
+                    d1 = min(d0 + tile_depth, depth)
+                    for r in range(y0 // tile_length,
+                                   (y1 - 1) // tile_length + 1):
+                        r0 = max(y0, r * tile_length)
+                        r1 = min(y1, (r + 1) * tile_length)
+                        for c in range(x0 // tile_width,
+                                       (x1 - 1) // tile_width + 1):
+                            c0 = max(x0, c * tile_width)
+                            c1 = min(x1, (c + 1) * tile_width)
+                            tile = self._read_tile(
+                                ((pl * td + d) * tl + r) * tw + c, decoders)
+                            result[0, pl, d0:d1, r0-y0:r1-y0, c0-x0:c1-x0] = \
+                                tile[:d1-d0,
+                                     r0-r*tile_length:r1-r*tile_length,
+                                     c0-c*tile_width:c1-c*tile_width]
+        finally:
+            if closed:
+                fh.close()
+        return result.reshape(squeezed)
+
+    def raw_tile(self, index):
+        """Return encoded data of one tile as stored in file.
+
+        The JPEG tables shared by the tiles of a JPEG compressed page are
+        inserted after the start-of-image marker, so the result is a
+        complete JPEG image that can be served or decoded on its own.
+
+        """
+        offsets, byte_counts = self._tile_offsets_byte_counts
+        if not 0 <= index < len(offsets):
+            raise IndexError("tile index out of range")
+        fh = self.parent.filehandle
+        closed = fh.closed
+        if closed:
+            fh.open()
+        try:
+            fh.seek(offsets[index])
+            data = fh.read(byte_counts[index])
+        finally:
+            if closed:
+                fh.close()
+        if (self.compression == 'jpeg' and 'jpeg_tables' in self.tags and
+                data[:2] == b'\xff\xd8'):
+            tables = bytes(bytearray(self.jpeg_tables))
+            # tables are an abbreviated JPEG stream with their own SOI and EOI
+            data = data[:2] + tables[2:-2] + data[2:]
+        return data
+
+    def _read_tile(self, index, decoders, out=None):
+        """Read and decode tile at index from open file handle."""
+        offsets, byte_counts = self._tile_offsets_byte_counts
+        if not 0 <= index < len(offsets):
+            raise IndexError("tile index out of range")
+        if not (offsets[index] and byte_counts[index]):
+            if out is None:
+                return numpy.zeros(self._tile_shape, self._dtype)
+            out[...] = 0
+            return out
+        fh = self.parent.filehandle
+        fh.seek(offsets[index])
+        tile = self._decode_tile(fh.read(byte_counts[index]), *decoders)
+        if out is not None:
+            if out.shape != self._tile_shape:
+                raise ValueError("out shape %s does not match tile %s" % (
+                    out.shape, self._tile_shape))
+            out[...] = tile
+            return out
+        if tile.dtype != numpy.dtype(self._dtype):
+            tile = tile.astype(self._dtype)
+        return tile
+
+    def _decode_segments(self, decode, offsets, byte_counts, maxworkers=1,
+                         batchsize=2**25):
+        """Return iterator over decode((index, data)) of strips or tiles.
+
+        The data of the strips or tiles are read in file order from the
+        open file handle. If maxworkers > 1, batches of about batchsize
+        bytes are decoded by a pool of threads while the next batch is
+        read. Results are returned in order of offsets.
+
+        """
+        fh = self.parent.filehandle
+        segments = enumerate(zip(offsets, byte_counts))
+        if maxworkers < 2 or len(offsets) < 2:
+            for index, (offset, bytecount) in segments:
+                fh.seek(offset)
+                yield decode((index, fh.read(bytecount)))
+            return
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(maxworkers)
+        try:
+            pending = None
+            while True:
+                batch = []
+                size = 0
+                for index, (offset, bytecount) in segments:
+                    fh.seek(offset)
+                    batch.append((index, fh.read(bytecount)))
+                    size += bytecount
+                    if size >= batchsize and len(batch) >= maxworkers:
+                        break
+                submitted = pool.map_async(decode, batch) if batch else None
+                if pending is not None:
+                    for result in pending.get():
+                        yield result
+                if submitted is None:
+                    break
+                pending = submitted
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _validate_decode(self):
+        """Raise ValueError if image data can not be decoded."""
+        if self.dtype is None:
+            raise ValueError("data type not supported: %s%i" % (
+                self.sample_format, self.bits_per_sample))
+        if self.compression not in TIFF_DECOMPESSORS:
+            raise ValueError("cannot decompress %s" % self.compression)
+        if 'sample_format' in self.tags:
+            tag = self.tags['sample_format']
+            if tag.count != 1 and any((i-tag.value[0] for i in tag.value)):
+                raise ValueError("sample formats do not match %s" % tag.value)
+
+        if self.is_chroma_subsampled:
+            # TODO: implement chroma subsampling
+            raise NotImplementedError("chroma subsampling not supported")
+
+    def _decoders(self):
+        """Return decompress and unpack functions for strips or tiles."""
+        dtype = self._dtype
+        typecode = self.parent.byteorder + dtype
+        bits_per_sample = self.bits_per_sample
+        runlen = self.tile_width if self.is_tiled else self.image_width
+        if self.is_contig:
+            runlen *= self.samples_per_pixel
+
+        if bits_per_sample in (8, 16, 32, 64, 128):
+            if (bits_per_sample * runlen) % 8:
+                raise ValueError("data and sample size mismatch")
+
+            def unpack(x, typecode=typecode):
+                if self.predictor == 'float':
+                    # the floating point horizontal differencing decoder
+                    # needs the raw byte order
+                    typecode = dtype
+                try:
+                    return numpy.fromstring(x, typecode)
+                except ValueError as e:
+                    # strips may be missing EOI
+                    warnings.warn("unpack: %s" % e)
+                    xlen = ((len(x) // (bits_per_sample // 8)) *
+                            (bits_per_sample // 8))
+                    return numpy.fromstring(x[:xlen], typecode)
+
+        elif isinstance(bits_per_sample, tuple):
+            def unpack(x):
+                return unpack_rgb(x, typecode, bits_per_sample)
+        else:
+            def unpack(x):
+                return unpack_ints(x, typecode, bits_per_sample, runlen)
+
+        decompress = TIFF_DECOMPESSORS[self.compression]
+        if self.compression == 'jpeg':
+            table = self.jpeg_tables if 'jpeg_tables' in self.tags else b''
+
+            def decompress(x):
+                return decode_jpeg(x, table, self.photometric)
+
+        return decompress, unpack
+
+    def _decode_tile(self, data, decompress, unpack):
+        """Return tile of _tile_shape decoded from data as stored in file."""
+        tile_shape = self._tile_shape
+        if self.fill_order == 'lsb2msb':
+            data = reverse_bitorder(data)
+        tile = unpack(decompress(data))
+        try:
+            tile.shape = tile_shape
+        except ValueError:
+            # incomplete tiles; see gdal issue #1179
+            warnings.warn("invalid tile data")
+            t = numpy.zeros(tile_shape, self._dtype).reshape(-1)
+            s = min(tile.size, t.size)
+            t[:s] = tile[:s]
+            tile = t.reshape(tile_shape)
+        if self.predictor == 'horizontal':
+            numpy.cumsum(tile, axis=-2, dtype=self._dtype, out=tile)
+        elif self.predictor == 'float':
+            raise NotImplementedError()
+        return tile
+
+    @lazyattr
+    def _tile_shape(self):
+        """Return shape of decoded tiles (depth, length, width, samples)."""
+        tile_depth = self.tile_depth if 'tile_depth' in self.tags else 1
+        return (tile_depth, self.tile_length, self.tile_width,
+                self._shape[-1])
+
+    @lazyattr
+    def _tile_grid(self):
+        """Return number of tiles along image depth, length, and width."""
+        tile_depth, tile_length, tile_width = self._tile_shape[:3]
+        return ((self.image_depth + tile_depth - 1) // tile_depth,
+                (self.image_length + tile_length - 1) // tile_length,
+                (self.image_width + tile_width - 1) // tile_width)
+
+    @lazyattr
+    def _tile_offsets_byte_counts(self):
+        """Return tile offsets and byte counts as stored, including empty."""
+        if not self.is_tiled:
+            raise ValueError("page is not tiled")
+        offsets = self.tags['tile_offsets'].value
+        byte_counts = self.tags['tile_byte_counts'].value
+        if isinstance(offsets, (int, numpy.integer)):
+            offsets = (offsets, )
+        if isinstance(byte_counts, (int, numpy.integer)):
+            byte_counts = (byte_counts, )
+        return tuple(offsets), tuple(byte_counts)
+
     @lazyattr
     def _byte_counts_offsets(self):
         """Return simplified byte_counts and offsets."""
@@ -4396,84 +5009,144 @@ def decode_lzw(encoded):
 
     The strip must begin with a CLEAR code and end with an EOI code.
 
-    This is an implementation of the LZW decoding algorithm described in (1).
-    It is not compatible with old style LZW compressed files like quad-lzw.tif.
+    This is a vectorized implementation of the LZW decoding algorithm
+    described in (1). It is not compatible with old style LZW compressed
+    files like quad-lzw.tif.
+
+    Between two CLEAR codes, the bit width of each code depends only on
+    its position, so the codes are extracted with numpy. Every table entry
+    is a previously decoded string plus the first byte of the following
+    one, so string lengths and last bytes are known for all codes at
+    once, and the output is written one string position at a time for
+    all codes instead of one code per loop iteration.
 
     """
     len_encoded = len(encoded)
-    bitcount_max = len_encoded * 8
-    unpack = struct.unpack
-
-    if sys.version[0] == '2':
-        newtable = [chr(i) for i in range(256)]
-    else:
-        newtable = [bytes([i]) for i in range(256)]
-    newtable.extend((0, 0))
-
-    def next_code():
-        """Return integer of 'bitw' bits at 'bitcount' position in encoded."""
-        start = bitcount // 8
-        s = encoded[start:start+4]
-        try:
-            code = unpack('>I', s)[0]
-        except Exception:
-            code = unpack('>I', s + b'\x00'*(4-len(s)))[0]
-        code <<= bitcount % 8
-        code &= mask
-        return code >> shr
-
-    switchbitch = {  # code: bit-width, shr-bits, bit-mask
-        255: (9, 23, int(9*'1'+'0'*23, 2)),
-        511: (10, 22, int(10*'1'+'0'*22, 2)),
-        1023: (11, 21, int(11*'1'+'0'*21, 2)),
-        2047: (12, 20, int(12*'1'+'0'*20, 2)), }
-    bitw, shr, mask = switchbitch[255]
-    bitcount = 0
-
     if len_encoded < 4:
         raise ValueError("strip must be at least 4 characters long")
-
-    if next_code() != 256:
+    bitcount_max = len_encoded * 8
+    data = numpy.frombuffer(bytes(encoded) + b'\x00\x00\x00', 'uint8')
+
+    def codes_at(bitpos, bitw):
+        """Return codes of bitw bits at bitpos positions in encoded."""
+        i = bitpos >> 3
+        code = data[i].astype('int64') << 16
+        code |= data[i+1].astype('int64') << 8
+        code |= data[i+2]
+        code >>= 24 - (bitpos & 7) - bitw
+        code &= (1 << bitw) - 1
+        return code
+
+    if codes_at(numpy.zeros(1, 'int64'), 9)[0] != 256:
         raise ValueError("strip must begin with CLEAR code")
 
-    code = 0
-    oldcode = 0
-    result = []
-    result_append = result.append
+    # bit offsets and widths of the codes following a CLEAR code; widths
+    # switch after table lengths of 511, 1023, and 2047
+    k = numpy.arange(4096, dtype='int64')
+    switch_bitw = 9 + (k > 253) + (k > 765) + (k > 1789)
+    switch_bitpos = numpy.cumsum(switch_bitw) - switch_bitw
+
+    # split code stream into segments between CLEAR codes
+    segments = []
+    bitcount = 9
+    code = 256
+    while code == 256:
+        codes = []
+        bitw = switch_bitw
+        bitpos = switch_bitpos + bitcount
+        while True:
+            valid = bitpos + bitw < bitcount_max
+            if not valid[-1]:
+                nvalid = int(numpy.argmin(valid))
+                # the first code not ending before the end of the strip
+                truncated = int(codes_at(bitpos[nvalid:nvalid+1],
+                                         bitw[nvalid:nvalid+1])[0])
+                bitpos = bitpos[:nvalid]
+                bitw = bitw[:nvalid]
+            chunk = codes_at(bitpos, bitw)
+            stop = numpy.flatnonzero(chunk >> 1 == 128)  # CLEAR or EOI
+            if len(stop):
+                stop = stop[0]
+                codes.append(chunk[:stop])
+                code = int(chunk[stop])
+                bitcount = int(bitpos[stop] + bitw[stop])
+                break
+            codes.append(chunk)
+            if len(chunk) < 4096:
+                code = -1  # end of stream
+                break
+            # table is full; codes remain 12 bits wide until CLEAR
+            bitw = numpy.full_like(k, 12)
+            bitpos = 12 * k + (bitpos[-1] + 12)
+        codes = numpy.concatenate(codes)
+        if len(codes):
+            segments.append(codes)
+    if code == -1:
+        warnings.warn("unexpected end of lzw stream (code %i)" % truncated)
+    if not segments:
+        return b''
+
+    # the string of code k in a segment is the string of code j followed
+    # by the first byte of the string of code j+1; j = k-1 if the code is
+    # not yet in the table
+    lengths = [len(codes) for codes in segments]
+    codes = numpy.concatenate(segments).astype('int64')
+    index = numpy.arange(len(codes), dtype='int64')
+    k = index - numpy.repeat(numpy.cumsum([0] + lengths[:-1]), lengths)
+    literal = codes < 256
+    # a code may refer to the table entry it defines but not beyond
+    invalid = numpy.flatnonzero(~literal & (codes - 258 >= k))
+    if len(invalid):
+        invalid = invalid[0]
+        raise ValueError("invalid lzw code %i at table length %i" % (
+            codes[invalid], 258 + max(k[invalid] - 1, 0)))
+    parent = numpy.where(literal, index, index - k + codes - 258)
+
+    # string lengths and first bytes by pointer doubling to literal codes
+    size = (~literal).astype('int64')
+    root = parent
     while True:
-        code = next_code()  # ~5% faster when inlining this function
-        bitcount += bitw
-        if code == 257 or bitcount >= bitcount_max:  # EOI
+        ancestor = root[root]
+        if (ancestor == root).all():
             break
-        if code == 256:  # CLEAR
-            table = newtable[:]
-            table_append = table.append
-            lentable = 258
-            bitw, shr, mask = switchbitch[255]
-            code = next_code()
-            bitcount += bitw
-            if code == 257:  # EOI
-                break
-            result_append(table[code])
-        else:
-            if code < lentable:
-                decoded = table[code]
-                newcode = table[oldcode] + decoded[:1]
-            else:
-                newcode = table[oldcode]
-                newcode += newcode[:1]
-                decoded = newcode
-            result_append(decoded)
-            table_append(newcode)
-            lentable += 1
-        oldcode = code
-        if lentable in switchbitch:
-            bitw, shr, mask = switchbitch[lentable]
-
-    if code != 257:
-        warnings.warn("unexpected end of lzw stream (code %i)" % code)
-
-    return b''.join(result)
+        size += size[root]
+        root = ancestor
+    size += 1
+    first = codes[root]
+    last = numpy.where(literal, codes,
+                       first[numpy.minimum(parent + 1, len(codes) - 1)])
+    last = last.astype('uint8')
+    stop = numpy.cumsum(size) - 1
+    result = numpy.empty(int(stop[-1]) + 1, 'uint8')
+
+    # write all strings backwards from their last byte, walking up the
+    # table; sorted by length, the strings still being written are a prefix
+    result[stop] = last
+    order = numpy.flatnonzero(size > 1)
+    order = order[numpy.argsort(-size[order])]
+    end = stop[order]
+    active = numpy.bincount(size)[::-1].cumsum()[::-1]
+    steps = len(active) - 1
+    code = order
+    for i in range(1, steps):
+        n = active[i+1]
+        if n < 4 * (steps - i):
+            # few long strings remain; their unwritten prefixes are the
+            # strings of ancestor codes, which are complete if copied
+            # in order of codes
+            ancestor = parent[code[:n]]
+            order = order[:n]
+            length = size[order] - i
+            start = stop[order] - size[order] + 1
+            source = stop[ancestor] - length + 1
+            j = numpy.argsort(order)
+            for a, b, n in zip(source[j].tolist(), start[j].tolist(),
+                               length[j].tolist()):
+                result[b:b+n] = result[a:a+n]
+            break
+        code = parent[code[:n]]
+        result[end[:n] - i] = last[code]
+    return result.tostring()
 
 
 @_replace_by('_tifffile.unpack_ints')
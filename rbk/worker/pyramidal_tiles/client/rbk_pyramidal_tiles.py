@@ -125,6 +125,8 @@ def load(config_filename):
         logger.error('Extract metadata application must be given.')
         return None
 
+    thumbnail_size = cfg.get('thumbnail_size', 512)
+
     mail_server = cfg.get('mail_server', None)
     mail_sender = cfg.get('mail_sender', None)
     mail_receiver = cfg.get('mail_receiver', None)
@@ -137,6 +139,7 @@ def load(config_filename):
                                metadata=metadata, \
                                dzi=dzi, \
                                thumbnails=thumbnails, \
+                               thumbnail_size=thumbnail_size, \
                                czi2dzi=czi2dzi, \
                                viewer=viewer, \
                                czirules=czirules, \
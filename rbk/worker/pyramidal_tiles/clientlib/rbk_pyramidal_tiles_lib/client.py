@@ -57,6 +57,7 @@ class PyramidalClient (object):
             self.port = host_port[1]
         self.dzi = kwargs.get("dzi")
         self.thumbnails = kwargs.get("thumbnails")
+        self.thumbnail_size = kwargs.get("thumbnail_size", 512)
         self.czi2dzi = kwargs.get("czi2dzi")
         self.viewer = kwargs.get("viewer")
         self.czirules = kwargs.get("czirules")
@@ -155,9 +156,21 @@ class PyramidalClient (object):
                 continue
             
             """
-            Create the directory for the tiles
+            Publish the thumbnail attached to the file before generating the tiles
             """
             year = parse(creation_time).strftime("%Y")
+            embedded = self.writeEmbeddedThumbnail(f, year, md5)
+            if embedded:
+                self.updateAttributes('Histological_Images:HE_Slide',
+                                     rid,
+                                     ["Thumbnail"],
+                                     {'RID': rid,
+                                      'Thumbnail': '/thumbnails/%s/%s.jpg' % (urlquote(year), urlquote(md5))
+                                      })
+            
+            """
+            Create the directory for the tiles
+            """
             outdir = '%s/%s/%s' % (self.dzi, year, md5)
             if not os.path.exists(outdir):
                 os.makedirs(outdir)
@@ -183,7 +196,7 @@ class PyramidalClient (object):
             """
             Generate the thumbnail
             """
-            thumbnail,urls = self.writeThumbnailImage(f, year, md5)
+            thumbnail,urls = self.writeThumbnailImage(f, year, md5, embedded)
             
             if thumbnail == None:
                 """
@@ -283,10 +296,34 @@ class PyramidalClient (object):
             self.sendMail('FAILURE Tiles: write thumbnail ERROR', '%s\n' % str(traceback.format_exception(et, ev, tb)))
             return None
 
+    """
+    Write the thumbnail attached to the file
+    """
+    def writeEmbeddedThumbnail(self, filename, year, md5):
+        try:
+            outdir = '%s/%s' % (self.thumbnails, year)
+            if not os.path.exists(outdir):
+                os.makedirs(outdir)
+            cf = czifile.CziFile(filename)
+            try:
+                attachment = cf.save_thumbnail('%s/%s.jpg' % (outdir, md5), self.thumbnail_size)
+            finally:
+                cf.close()
+            if attachment == None:
+                self.logger.debug('No thumbnail attachment in the file "%s".' % (filename)) 
+                return False
+            self.logger.debug('Wrote the "%s" attachment of the file "%s" as thumbnail.' % (attachment, filename)) 
+            return True
+        except:
+            et, ev, tb = sys.exc_info()
+            self.logger.error('Can not extract the thumbnail attachment from the "%s" file.' % (filename))
+            self.logger.error('%s' % str(traceback.format_exception(et, ev, tb)))
+            return False
+            
     """
     Generate the thumbnail
     """
-    def writeThumbnailImage(self, filename, year, md5):
+    def writeThumbnailImage(self, filename, year, md5, embedded=False):
         try:
             scanDir='%s/%s/%s' % (self.dzi, year, md5)
             channels = []
@@ -296,7 +333,8 @@ class PyramidalClient (object):
             outdir = '%s/%s' % (self.thumbnails, year)
             if not os.path.exists(outdir):
                 os.makedirs(outdir)
-            shutil.copyfile('%s/%s/%s/%s/0/0_0.jpg' % (self.dzi, year, md5, channels[0]), '%s/%s.jpg' % (outdir, md5))
+            if not embedded:
+                shutil.copyfile('%s/%s/%s/%s/0/0_0.jpg' % (self.dzi, year, md5, channels[0]), '%s/%s.jpg' % (outdir, md5))
             thumbnail = '/thumbnails/%s/%s.jpg' % (urlquote(year), urlquote(md5))
             urls = []
             for channel in channels: